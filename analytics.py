@@ -0,0 +1,306 @@
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from dashboard_queries import run_query
+import name_dictionary
+
+# Placement statistics per player, unit, trait and comp, computed with NumPy over
+# integer-coded arrays. Participants, units and traits are loaded once (ints only:
+# the string keys are joined away in SQL), and every filter is a boolean mask over
+# participants, so changing the date range or player never queries the database again.
+
+# z for the 95% confidence intervals
+Z_95 = 1.96
+
+
+def participant_keys(set_number):
+    # Participants numbered 0..n-1 in (match_id, puuid) order; the units and traits
+    # queries join to the same numbering, so their rows index straight into the arrays
+    return f'''
+        select p.match_id, p.puuid, row_number() over (order by p.match_id, p.puuid) - 1 as participant_id
+        from participants p
+        join matches m on m.match_id = p.match_id
+        where m.tft_set_number = {int(set_number)}
+    '''
+
+
+@contextmanager
+def snapshot(engine):
+    # One connection and one transaction for several queries, so each sees the same rows
+    # even while ingestion writes. DuckDB files and Parquet snapshots have no writer while
+    # the dashboard reads them, so they are used as they are.
+    if hasattr(engine, 'run_query'):
+        yield engine
+        return
+    with engine.connect() as connection:
+        if engine.dialect.name == 'postgresql':
+            connection = connection.execution_options(isolation_level='REPEATABLE READ')
+        with connection.begin():
+            if engine.dialect.name == 'sqlite':
+                # pysqlite only opens a transaction before writes; in WAL mode a read
+                # transaction keeps the snapshot of its first read
+                connection.exec_driver_sql('BEGIN')
+            yield connection
+
+
+def load_arrays(engine, set_number=13):
+    # The participants, units and traits queries each number participants with row_number,
+    # so they run in one snapshot; otherwise a match written in between would shift the
+    # numbering and attach units and traits to the wrong participants
+    with snapshot(engine) as connection:
+        return query_arrays(connection, set_number)
+
+
+def query_arrays(engine, set_number):
+    params = {'set_number': set_number}
+    players = run_query(engine, '''
+        select p.puuid, max(p.riotidgamename) as riotidgamename
+        from participants p
+        join matches m on m.match_id = p.match_id
+        where m.tft_set_number = :set_number
+        group by p.puuid
+        order by p.puuid;
+    ''', params)
+    participants = run_query(engine, '''
+        select row_number() over (order by p.match_id, p.puuid) - 1 as participant_id,
+               dense_rank() over (order by p.puuid) - 1 as player_id,
+               p.placement, p.total_damage_to_players, p.gold_left, p.players_eliminated, m.game_datetime
+        from participants p
+        join matches m on m.match_id = p.match_id
+        where m.tft_set_number = :set_number
+        order by participant_id;
+    ''', params)
+    units = run_query(engine, f'''
+        with keyed as ({participant_keys(set_number)})
+        select k.participant_id, u.character_code, u.tier
+        from units u
+        join keyed k on k.match_id = u.match_id and k.puuid = u.puuid
+        where u.character_code is not null;
+    ''', {})
+    traits = run_query(engine, f'''
+        with keyed as ({participant_keys(set_number)})
+        select k.participant_id, t.trait_code, t.tier_current, t.num_units
+        from traits t
+        join keyed k on k.match_id = t.match_id and k.puuid = t.puuid
+        where t.trait_code is not null and t.tier_current > 0;
+    ''', {})
+    return players, participants, units, traits
+
+
+def board_units(participant_ids, codes, tiers):
+    # One row per (participant, unit) with the highest star level, since a board can field a unit twice
+    keys = participant_ids.astype(np.int64) * 65536 + codes.astype(np.int64)
+    order = np.argsort(keys, kind='stable')
+    keys, tiers = keys[order], tiers[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.array([], dtype=np.int64)
+    max_tiers = np.maximum.reduceat(tiers, starts) if len(starts) else tiers[:0]
+    unique_keys = keys[starts]
+    return (unique_keys // 65536).astype(np.int64), (unique_keys % 65536).astype(np.int32), max_tiers.astype(np.int8)
+
+
+def wilson_interval(successes, n):
+    # Wilson score interval; unlike the normal approximation it stays inside [0, 1] for small n
+    n = np.asarray(n, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = successes / n
+        denominator = 1 + Z_95 ** 2 / n
+        centre = (rate + Z_95 ** 2 / (2 * n)) / denominator
+        half_width = Z_95 * np.sqrt(rate * (1 - rate) / n + Z_95 ** 2 / (4 * n ** 2)) / denominator
+    return np.clip(centre - half_width, 0, 1), np.clip(centre + half_width, 0, 1)
+
+
+def group_stats(groups, placements, size):
+    # Placement statistics of every group id in 0..size-1 with np.bincount, one pass per sum
+    placements = placements.astype(np.float64)
+    games = np.bincount(groups, minlength=size).astype(np.float64)
+    placement_sum = np.bincount(groups, weights=placements, minlength=size)
+    placement_squares = np.bincount(groups, weights=placements ** 2, minlength=size)
+    top4 = np.bincount(groups, weights=placements <= 4, minlength=size)
+    wins = np.bincount(groups, weights=placements == 1, minlength=size)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_placement = placement_sum / games
+        # Sample standard deviation, from the sums so no per-group pass is needed
+        variance = np.maximum(placement_squares - games * avg_placement ** 2, 0) / (games - 1)
+        half_width = Z_95 * np.sqrt(variance / games)
+        top4_low, top4_high = wilson_interval(top4, games)
+        win_low, win_high = wilson_interval(wins, games)
+        stats = pd.DataFrame({
+            'games': games.astype(np.int64),
+            'avg_placement': avg_placement,
+            'placement_ci_low': avg_placement - half_width,
+            'placement_ci_high': avg_placement + half_width,
+            'top4_rate': top4 / games,
+            'top4_ci_low': top4_low,
+            'top4_ci_high': top4_high,
+            'win_rate': wins / games,
+            'win_ci_low': win_low,
+            'win_ci_high': win_high,
+        })
+    return stats.round(4)
+
+
+class PlacementStats:
+    # participant arrays are indexed by participant_id; board_* and trait_* arrays carry
+    # the participant_id of each row, so a participant mask filters them with one lookup
+    def __init__(self, players, participants, units, traits, names):
+        self.puuids = players['puuid'].to_numpy()
+        self.player_names = players['riotidgamename'].fillna('').to_numpy()
+
+        self.player_ids = participants['player_id'].to_numpy(np.int32)
+        self.placements = participants['placement'].fillna(0).to_numpy(np.int8)
+        self.damage = participants['total_damage_to_players'].fillna(0).to_numpy(np.int32)
+        self.gold_left = participants['gold_left'].fillna(0).to_numpy(np.int32)
+        self.players_eliminated = participants['players_eliminated'].fillna(0).to_numpy(np.int16)
+        # Whole days since the epoch; SQLite hands timestamps back as text
+        self.days = pd.to_datetime(participants['game_datetime']).to_numpy('datetime64[D]').astype(np.int32)
+
+        self.board_participants, self.board_codes, self.board_tiers = board_units(
+            units['participant_id'].to_numpy(np.int64), units['character_code'].to_numpy(np.int32), units['tier'].fillna(0).to_numpy(np.int8)
+        )
+        self.trait_participants = traits['participant_id'].to_numpy(np.int64)
+        self.trait_codes = traits['trait_code'].to_numpy(np.int32)
+        self.trait_tiers = traits['tier_current'].to_numpy(np.int8)
+        self.trait_units = traits['num_units'].fillna(0).to_numpy(np.int8)
+
+        # Display names for the unit and trait codes (several raw ids can share one name)
+        self.names = names
+        self.code_count = int(max(names['code'].max() if len(names) else 0, self.board_codes.max(initial=0), self.trait_codes.max(initial=0))) + 1
+        raw_ids = pd.Series(names['raw_id'].to_numpy(), index=names['code'].to_numpy())
+        self.unit_labels = self.labels(raw_ids, 'unit')
+        self.trait_labels = self.labels(raw_ids, 'trait')
+        self.comp_cache = None
+
+    def labels(self, raw_ids, kind):
+        labels = np.full(self.code_count, '', dtype=object)
+        codes = self.names.loc[self.names['kind'] == kind, 'code'].to_numpy()
+        if len(codes):
+            labels[codes] = np.asarray(name_dictionary.to_display(raw_ids.loc[codes].reset_index(drop=True), self.names, kind), dtype=object)
+        return labels
+
+    def __len__(self):
+        return len(self.placements)
+
+    def code_of(self, label, kind):
+        labels = self.unit_labels if kind == 'unit' else self.trait_labels
+        return np.flatnonzero(labels == label)
+
+    def participant_hits(self, participant_ids):
+        hits = np.zeros(len(self), dtype=bool)
+        hits[participant_ids] = True
+        return hits
+
+    # Function to build a participant mask; any filter left as None is not applied
+    def mask(self, start_date=None, end_date=None, puuids=None, with_unit=None, with_trait=None, min_unit_tier=1):
+        mask = self.placements > 0
+        if start_date is not None:
+            mask &= self.days >= np.datetime64(pd.to_datetime(start_date).date(), 'D').astype(np.int32)
+        if end_date is not None:
+            # The end date is inclusive, as in dashboard_queries.match_filters
+            mask &= self.days <= np.datetime64(pd.to_datetime(end_date).date(), 'D').astype(np.int32)
+        if puuids is not None:
+            player_codes = np.flatnonzero(np.isin(self.puuids, list(puuids)))
+            mask &= np.isin(self.player_ids, player_codes)
+        if with_unit is not None:
+            # Boards fielding the unit (any raw id with that display name) at min_unit_tier stars or more
+            rows = np.isin(self.board_codes, self.code_of(with_unit, 'unit')) & (self.board_tiers >= min_unit_tier)
+            mask &= self.participant_hits(self.board_participants[rows])
+        if with_trait is not None:
+            rows = np.isin(self.trait_codes, self.code_of(with_trait, 'trait'))
+            mask &= self.participant_hits(self.trait_participants[rows])
+        return mask
+
+    def kpis(self, mask=None):
+        # The headline numbers: average placement, top-4 and win rates, damage, gold left, eliminations
+        if mask is None:
+            mask = self.mask()
+        games = int(mask.sum())
+        if not games:
+            return {'games': 0, 'avg_placement': None, 'top4_rate': None, 'win_rate': None, 'avg_damage': None, 'avg_gold_left': None, 'avg_players_eliminated': None}
+        placements = self.placements[mask]
+        return {
+            'games': games,
+            'avg_placement': float(placements.mean()),
+            'top4_rate': float((placements <= 4).mean()),
+            'win_rate': float((placements == 1).mean()),
+            'avg_damage': float(self.damage[mask].mean()),
+            'avg_gold_left': float(self.gold_left[mask].mean()),
+            'avg_players_eliminated': float(self.players_eliminated[mask].mean()),
+        }
+
+    def labelled(self, stats, labels, label_column, min_games):
+        stats.insert(0, label_column, labels)
+        stats = stats[stats['games'] >= max(min_games, 1)]
+        return stats.sort_values(['avg_placement', 'games'], ascending=[True, False]).reset_index(drop=True)
+
+    def player_stats(self, mask=None, min_games=1):
+        if mask is None:
+            mask = self.mask()
+        stats = group_stats(self.player_ids[mask], self.placements[mask], len(self.puuids))
+        stats.insert(0, 'puuid', self.puuids)
+        return self.labelled(stats, self.player_names, 'riotidgamename', min_games)
+
+    def grouped_by_label(self, codes, participants, labels, mask, label_column, min_games):
+        # Codes that share a display name count as one group
+        label_codes, label_names = pd.factorize(labels)
+        keep = mask[participants]
+        stats = group_stats(label_codes[codes[keep]], self.placements[participants[keep]], len(label_names))
+        stats = self.labelled(stats, np.asarray(label_names, dtype=object), label_column, min_games)
+        return stats[stats[label_column] != ''].reset_index(drop=True)
+
+    def unit_stats(self, mask=None, min_games=1, min_tier=1):
+        # One game per board that fields the unit, at min_tier stars or more
+        if mask is None:
+            mask = self.mask()
+        rows = self.board_tiers >= min_tier
+        return self.grouped_by_label(self.board_codes[rows], self.board_participants[rows], self.unit_labels, mask, 'unit', min_games)
+
+    def trait_stats(self, mask=None, min_games=1, min_tier=1):
+        # Active traits only; min_tier filters on the trait's current tier
+        if mask is None:
+            mask = self.mask()
+        rows = self.trait_tiers >= min_tier
+        return self.grouped_by_label(self.trait_codes[rows], self.trait_participants[rows], self.trait_labels, mask, 'trait', min_games)
+
+    def comps(self):
+        # A board's comp is its two leading active traits, by units in the trait and then tier.
+        # It does not depend on the filters, so it is worked out once.
+        if self.comp_cache is None:
+            self.comp_cache = self.leading_traits()
+        return self.comp_cache
+
+    def leading_traits(self):
+        # One sort key: participant, then most units, then highest tier
+        sort_keys = self.trait_participants * 4096 + (63 - np.minimum(self.trait_units, 63).astype(np.int64)) * 64 + (63 - np.minimum(self.trait_tiers, 63).astype(np.int64))
+        order = np.argsort(sort_keys, kind='stable')
+        participants = self.trait_participants[order]
+        label_codes, label_names = pd.factorize(self.trait_labels)
+        traits = label_codes[self.trait_codes[order]].astype(np.int64)
+        if not len(participants):
+            return participants, np.array([], dtype=np.int64), np.asarray(label_names, dtype=object)
+        starts = np.flatnonzero(np.r_[True, participants[1:] != participants[:-1]])
+        seconds = np.minimum(starts + 1, len(participants) - 1)
+        first = traits[starts]
+        # -1 for boards with a single active trait
+        second = np.where((starts + 1 < len(participants)) & (participants[seconds] == participants[starts]), traits[seconds], -1)
+        # The pair is sorted, so A + B and B + A are one comp
+        comp_keys = np.maximum(first, second) * (len(label_names) + 1) + np.minimum(first, second) + 1
+        return participants[starts], comp_keys, np.asarray(label_names, dtype=object)
+
+    def comp_stats(self, mask=None, min_games=1):
+        if mask is None:
+            mask = self.mask()
+        participants, comp_keys, trait_names = self.comps()
+        keep = mask[participants]
+        unique_keys, groups = np.unique(comp_keys[keep], return_inverse=True)
+        leading, other = unique_keys // (len(trait_names) + 1), unique_keys % (len(trait_names) + 1) - 1
+        comps = [trait_names[a] if b < 0 else ' + '.join(sorted([trait_names[a], trait_names[b]])) for a, b in zip(leading, other)]
+        stats = group_stats(groups.ravel(), self.placements[participants[keep]], len(unique_keys))
+        return self.labelled(stats, np.asarray(comps, dtype=object), 'comp', min_games)
+
+# Function to load the arrays for one set; names is the tft_names frame (name_dictionary.load_names)
+def load_stats(engine, set_number=13, names=None):
+    if names is None:
+        names = name_dictionary.load_names(engine)
+    players, participants, units, traits = load_arrays(engine, set_number)
+    return PlacementStats(players, participants, units, traits, names)
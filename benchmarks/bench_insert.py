@@ -0,0 +1,58 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+# Compare rows/second of the old executemany path and the bulk paths in db.py
+# against a local Postgres. Rows go into a temp copy of Units, so nothing is kept.
+row_count = int(os.getenv('BENCH_ROWS', 100000))
+
+
+def make_unit_rows(count):
+    items = ['TFT_Item_GuinsoosRageblade', 'TFT_Item_InfinityEdge', 'TFT_Item_Bloodthirster', 'TFT_Item_Warmogs']
+    rows = []
+    for i in range(count):
+        rows.append({
+            'character_id': f"TFT13_Unit{i % 60}",
+            'puuid': f"bench-puuid-{i // 80}",
+            'unit_name': '',
+            'tier': random.randint(1, 3),
+            'match_id': f"NA1_{i // 640}",
+            'itemnames': random.sample(items, random.randint(0, 3)),
+            'unit_index': i % 10
+        })
+    return rows
+
+
+def executemany_data_batch(connection, table_name, data_list, conflict_columns):
+    # The insert path tftpal.py used before the bulk loader
+    cursor = connection.cursor()
+    placeholders = ', '.join(['%s'] * len(data_list[0]))
+    columns = ', '.join(data_list[0].keys())
+    conflict_columns_str = ', '.join(conflict_columns)
+    sql = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders}) ON CONFLICT ({conflict_columns_str}) DO NOTHING"
+    cursor.executemany(sql, [list(data.values()) for data in data_list])
+    cursor.close()
+
+
+def run(name, insert_function, rows):
+    with db.transaction() as connection:
+        cursor = connection.cursor()
+        cursor.execute("CREATE TEMP TABLE bench_units (LIKE Units INCLUDING ALL) ON COMMIT DROP")
+        cursor.close()
+        start = time.perf_counter()
+        insert_function(connection, 'bench_units', rows, db.CONFLICT_COLUMNS['Units'])
+        elapsed = time.perf_counter() - start
+    print(f"{name:<16} {len(rows) / elapsed:>12,.0f} rows/second ({elapsed:.2f}s)")
+
+
+rows = make_unit_rows(row_count)
+print(f"Inserting {row_count:,} unit rows")
+run('executemany', executemany_data_batch, rows)
+run('execute_values', db.values_data_batch, rows)
+run('copy + merge', db.copy_data_batch, rows)
+db.close_pool()
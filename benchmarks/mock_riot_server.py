@@ -0,0 +1,220 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+# Local stand-in for the Riot API endpoints the ingestion uses, serving synthetic but
+# realistically shaped TFT data. Paths are /<host>/<Riot path>, which is what RiotClient
+# requests when RIOT_API_BASE_URL points here. Every lobby is made of ladder players, one
+# lobby per player per hour, so players share matches the way challenger players do.
+
+UNITS = [
+    ('TFT13_Jinx', 5), ('TFT13_Vi', 2), ('TFT13_Ekko', 3), ('TFT13_Silco', 4), ('TFT13_Zeri', 1),
+    ('TFT13_Caitlyn', 5), ('TFT13_Jayce', 5), ('TFT13_Mel', 5), ('TFT13_Viktor', 4), ('TFT13_Heimerdinger', 4),
+    ('TFT13_Ambessa', 4), ('TFT13_Corki', 4), ('TFT13_Elise', 4), ('TFT13_Garen', 4), ('TFT13_TwistedFate', 4),
+    ('TFT13_Blitzcrank', 3), ('TFT13_Cassiopeia', 3), ('TFT13_Draven', 3), ('TFT13_Gangplank', 3), ('TFT13_Kogmaw', 3),
+    ('TFT13_Loris', 3), ('TFT13_Nami', 3), ('TFT13_Nunu', 3), ('TFT13_Renata', 3), ('TFT13_Scar', 3),
+    ('TFT13_Akali', 2), ('TFT13_Camille', 2), ('TFT13_Leona', 2), ('TFT13_Nocturne', 2), ('TFT13_Rell', 2),
+    ('TFT13_RenataGlasc', 2), ('TFT13_Sett', 2), ('TFT13_Tristana', 2), ('TFT13_Urgot', 2), ('TFT13_Zyra', 2),
+    ('TFT13_Amumu', 1), ('TFT13_Darius', 1), ('TFT13_Trundle', 1), ('TFT13_Irelia', 1), ('TFT13_Lux', 1),
+    ('TFT13_Maddie', 1), ('TFT13_Morgana', 1), ('TFT13_Powder', 1), ('TFT13_Singed', 1), ('TFT13_Steb', 1),
+]
+TRAITS = [
+    'TFT13_Ambassador', 'TFT13_Academy', 'TFT13_Automata', 'TFT13_Hextech', 'TFT13_Crime', 'TFT13_Cabal',
+    'TFT13_Experiment', 'TFT13_Family', 'TFT13_Warband', 'TFT13_Rebel', 'TFT13_Scrap', 'TFT13_Enforcer',
+    'TFT13_Bruiser', 'TFT13_Sniper', 'TFT13_Sorcerer', 'TFT13_Titan', 'TFT13_Invoker', 'TFT13_Martialist',
+]
+ITEMS = [
+    'TFT_Item_InfinityEdge', 'TFT_Item_GuinsoosRageblade', 'TFT_Item_Bloodthirster', 'TFT_Item_WarmogsArmor',
+    'TFT_Item_JeweledGauntlet', 'TFT_Item_RabadonsDeathcap', 'TFT_Item_GargoyleStoneplate', 'TFT_Item_SpearOfShojin',
+    'TFT_Item_HextechGunblade', 'TFT_Item_LastWhisper', 'TFT_Item_Redemption', 'TFT_Item_SteraksGage',
+    'TFT_Item_ThiefsGloves', 'TFT_Item_TitansResolve', 'TFT_Item_Quicksilver', 'TFT_Item_Morellonomicon',
+]
+AUGMENTS = [f"TFT13_Augment_{name}" for name in ['Ascension', 'CalculatedLoss', 'PumpingUp', 'Cluttered', 'Epoch', 'ItemGrabBag', 'LatentForge', 'PortableForge']]
+
+
+class League:
+    # Players, lobbies and match ids of one platform region, built once at startup
+    def __init__(self, region, players, matches, started):
+        self.region = region
+        self.prefix = region.upper()
+        self.puuids = [f"mock-{region}-{index:05d}-" + 'x' * 58 for index in range(players)]
+        self.started = started
+        self.matches = matches
+        self.player_match_ids = {puuid: [] for puuid in self.puuids}
+        self.lobbies = {}
+        lobbies_per_round = max(players // 8, 1)
+        shuffler = random.Random(region)
+        for game_round in range(matches):
+            order = list(self.puuids)
+            shuffler.shuffle(order)
+            for lobby in range(lobbies_per_round):
+                match_id = f"{self.prefix}_{5000000000 + game_round * lobbies_per_round + lobby}"
+                self.lobbies[match_id] = (game_round, order[lobby * 8:lobby * 8 + 8])
+                for puuid in order[lobby * 8:lobby * 8 + 8]:
+                    self.player_match_ids[puuid].append(match_id)
+        for match_ids in self.player_match_ids.values():
+            # Newest first, like the real endpoint
+            match_ids.reverse()
+
+    def game_datetime(self, game_round):
+        # One round an hour, ending about now
+        return (self.started - (self.matches - game_round) * 3600) * 1000
+
+    def ladder(self):
+        entries = []
+        for index, puuid in enumerate(self.puuids):
+            rng = random.Random(puuid)
+            wins = rng.randint(50, 250)
+            entries.append({
+                'puuid': puuid, 'leaguePoints': max(2000 - index * 3, 500) + rng.randint(0, 2), 'rank': 'I',
+                'wins': wins, 'losses': wins + rng.randint(0, 150), 'veteran': rng.random() < 0.3,
+                'inactive': False, 'freshBlood': rng.random() < 0.1, 'hotStreak': rng.random() < 0.2,
+            })
+        return {'tier': 'CHALLENGER', 'leagueId': f"mock-{self.region}", 'queue': 'RANKED_TFT', 'name': 'Mock League', 'entries': entries}
+
+    def match(self, match_id):
+        game_round, puuids = self.lobbies[match_id]
+        rng = random.Random(match_id)
+        placements = list(range(1, len(puuids) + 1))
+        rng.shuffle(placements)
+        participants = []
+        for puuid, placement in zip(puuids, placements):
+            level = rng.randint(7, 10)
+            units = []
+            for character_id, cost in rng.sample(UNITS, min(level, len(UNITS))):
+                item_count = rng.choice([0, 0, 1, 2, 3, 3])
+                units.append({
+                    'character_id': character_id, 'itemNames': rng.sample(ITEMS, item_count),
+                    'name': '', 'rarity': cost - 1 if cost < 5 else 6, 'tier': rng.choice([1, 2, 2, 2, 3]),
+                })
+            traits = []
+            for name in rng.sample(TRAITS, rng.randint(5, 9)):
+                tier_total = rng.randint(1, 4)
+                traits.append({
+                    'name': name, 'num_units': rng.randint(1, 9), 'style': rng.randint(0, 4),
+                    'tier_current': rng.randint(0, tier_total), 'tier_total': tier_total,
+                })
+            participants.append({
+                'augments': rng.sample(AUGMENTS, 3),
+                'companion': {'content_ID': 'mock', 'item_ID': rng.randint(1, 50), 'skin_ID': rng.randint(1, 50), 'species': 'PetTFTAvatar'},
+                'gold_left': rng.randint(0, 60), 'last_round': 20 + (8 - placement) * 3 + rng.randint(0, 3),
+                'level': level, 'missions': {'PlayerScore2': rng.randint(0, 200)},
+                'placement': placement, 'players_eliminated': rng.randint(0, 3),
+                'puuid': puuid, 'riotIdGameName': f"Player{puuid.split('-')[2]}", 'riotIdTagline': self.prefix,
+                'time_eliminated': round(rng.uniform(1200, 2400), 3),
+                'total_damage_to_players': rng.randint(20, 200),
+                'traits': traits, 'units': units, 'win': placement <= 4,
+            })
+        return {
+            'metadata': {'data_version': '6', 'match_id': match_id, 'participants': puuids},
+            'info': {
+                'endOfGameResult': 'GameComplete', 'gameCreation': self.game_datetime(game_round) - 2000000,
+                'gameId': int(match_id.split('_')[1]), 'game_datetime': self.game_datetime(game_round),
+                'game_length': round(rng.uniform(1800, 2500), 3), 'game_version': 'Version 14.24.1',
+                'mapId': 22, 'participants': participants, 'queueId': 1100, 'queue_id': 1100,
+                'tft_game_type': 'standard', 'tft_set_core_name': 'TFTSet13', 'tft_set_number': 13,
+            },
+        }
+
+
+class MockRiotHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this each keep-alive
+    # response waits on a delayed ACK and every request looks 40 ms slower
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        settings = self.server.settings
+        if settings['latency'] > 0:
+            time.sleep(settings['latency'])
+        headers = {'X-App-Rate-Limit': settings['app_limit'], 'X-Method-Rate-Limit': settings['method_limit']}
+        with self.server.lock:
+            self.server.requests += 1
+            inject_429 = self.server.random.random() < settings['rate_429']
+        if inject_429:
+            headers.update({'Retry-After': '1', 'X-Rate-Limit-Type': 'method'})
+            return self.reply(429, {'status': {'message': 'Rate limit exceeded', 'status_code': 429}}, headers)
+
+        parsed = urlparse(self.path)
+        parts = [unquote(part) for part in parsed.path.strip('/').split('/')]
+        query = parse_qs(parsed.query)
+        host, path = parts[0], parts[1:]
+        try:
+            body = self.route(host, path, query)
+        except KeyError:
+            body = None
+        if body is None:
+            return self.reply(404, {'status': {'message': 'Data not found', 'status_code': 404}}, headers)
+        self.reply(200, body, headers)
+
+    def route(self, host, path, query):
+        leagues = self.server.leagues
+        if path[:4] == ['tft', 'league', 'v1', 'challenger']:
+            return leagues[host].ladder()
+        if path[:5] == ['tft', 'summoner', 'v1', 'summoners', 'by-puuid']:
+            return {'puuid': path[5], 'profileIconId': 29, 'revisionDate': int(time.time() * 1000), 'summonerLevel': 500}
+        if path[:5] == ['riot', 'account', 'v1', 'accounts', 'by-riot-id']:
+            return {'puuid': f"mock-account-{path[5].lower()}-{path[6].lower()}", 'gameName': path[5], 'tagLine': path[6]}
+        if path[:4] == ['tft', 'match', 'v1', 'matches'] and len(path) == 7 and path[4] == 'by-puuid':
+            puuid = path[5]
+            league = leagues[puuid.split('-')[1]]
+            match_ids = league.player_match_ids[puuid]
+            if 'startTime' in query:
+                start_time = int(query['startTime'][0]) * 1000
+                match_ids = [match_id for match_id in match_ids if league.game_datetime(league.lobbies[match_id][0]) >= start_time]
+            start = int(query.get('start', [0])[0])
+            count = int(query.get('count', [20])[0])
+            return match_ids[start:start + count]
+        if path[:4] == ['tft', 'match', 'v1', 'matches'] and len(path) == 5:
+            return leagues[path[4].split('_')[0].lower()].match(path[4])
+        return None
+
+    def reply(self, status, body, headers):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(port, regions, players, matches, latency_ms=0, rate_429=0.0, app_limit='100000:1', method_limit='100000:1'):
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockRiotHandler)
+    server.daemon_threads = True
+    started = int(time.time())
+    server.leagues = {region: League(region, players, matches, started) for region in regions}
+    server.settings = {'latency': latency_ms / 1000.0, 'rate_429': rate_429, 'app_limit': app_limit, 'method_limit': method_limit}
+    server.lock = threading.Lock()
+    server.random = random.Random(0)
+    server.requests = 0
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve synthetic Riot API responses for benchmarks')
+    parser.add_argument('--port', type=int, default=8500)
+    parser.add_argument('--regions', default='na1', help='Comma-separated platform regions')
+    parser.add_argument('--players', type=int, default=200, help='Ladder players per region')
+    parser.add_argument('--matches', type=int, default=100, help='Match history length per player')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Delay added to every response')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('--app-limit', default='100000:1', help='X-App-Rate-Limit header sent back')
+    parser.add_argument('--method-limit', default='100000:1', help='X-Method-Rate-Limit header sent back')
+    args = parser.parse_args()
+
+    server = make_server(args.port, [region.strip() for region in args.regions.split(',')], args.players, args.matches,
+                         args.latency_ms, args.rate_429, args.app_limit, args.method_limit)
+    print(f"Mock Riot API on http://127.0.0.1:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# End-to-end benchmark without an API key or PostgreSQL: starts benchmarks/mock_riot_server.py,
+# runs tftpal.py against it twice (a cold sweep, then an incremental one with nothing new),
+# runs the dashboard's data-prep queries, and appends the timings, throughput and peak RSS
+# to benchmarks/results.jsonl so runs before and after a change can be compared.
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(benchmarks_dir)
+results_path = os.getenv('BENCH_RESULTS', os.path.join(benchmarks_dir, 'results.jsonl'))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_dir, capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repo_dir, capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except OSError:
+        return None, None
+
+
+def start_mock_server(args, port):
+    command = [
+        sys.executable, os.path.join(benchmarks_dir, 'mock_riot_server.py'), '--port', str(port),
+        '--regions', args.regions, '--players', str(args.players), '--matches', str(args.matches),
+        '--latency-ms', str(args.latency_ms), '--rate-429', str(args.rate_429),
+    ]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    # The server prints its address once the leagues are built
+    server.stdout.readline()
+    return server
+
+
+def metric_totals(metrics_log):
+    # The last snapshot tftpal.py wrote, flattened to {"name{labels}": value}
+    with open(metrics_log, encoding='utf-8') as f:
+        snapshot = json.loads(f.readlines()[-1])
+    totals = {}
+    for kind in ('counters', 'histograms'):
+        for name, series in snapshot[kind].items():
+            for row in series:
+                value = row.pop('value')
+                labels = ','.join(f"{label}={label_value}" for label, label_value in sorted(row.items()))
+                totals[f"{name}{{{labels}}}"] = value['sum'] if kind == 'histograms' else value
+    return totals
+
+
+def run_ingest(name, env, work_dir):
+    metrics_log = os.path.join(work_dir, f"{name}.metrics.jsonl")
+    log_path = os.path.join(work_dir, f"{name}.log")
+    started = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        process = subprocess.Popen([sys.executable, os.path.join(repo_dir, 'tftpal.py')], cwd=repo_dir, env=dict(env, METRICS_LOG=metrics_log), stdout=log, stderr=subprocess.STDOUT)
+        # wait4 gives this child's own peak RSS (kilobytes on Linux)
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    seconds = time.perf_counter() - started
+    if process.returncode != 0 or not os.path.exists(metrics_log):
+        raise RuntimeError(f"tftpal.py failed, see {log_path}")
+
+    totals = metric_totals(metrics_log)
+    matches_written = sum(value for key, value in totals.items() if key.startswith('db_rows_total{table=Matches'))
+    api_requests = sum(value for key, value in totals.items() if key.startswith('riot_requests_total{'))
+    result = {
+        'seconds': round(seconds, 3),
+        'matches_written': matches_written,
+        'matches_per_second': round(matches_written / seconds, 2),
+        'api_requests': api_requests,
+        'requests_per_second': round(api_requests / seconds, 2),
+        'peak_rss_mb': round(usage.ru_maxrss / 1024, 1),
+        'stages': {key: round(value, 4) for key, value in totals.items() if not key.startswith(('riot_requests_total', 'db_rows_total'))},
+    }
+    print(f"{name}: {seconds:.1f}s, {matches_written} matches ({result['matches_per_second']}/s), {api_requests} requests ({result['requests_per_second']}/s), peak RSS {result['peak_rss_mb']} MB")
+    return result
+
+
+def run_dashboard(regions):
+    # Imported only now, so storage.py and riot_client.py see the benchmark's environment
+    import analytics
+    import cooccurrence
+    import dashboard_queries
+    import db
+    import ladder
+    import name_dictionary
+    import storage
+    import unit_items
+    from riot_client import RiotClient
+
+    stages = {}
+
+    def timed(stage, function, *args, **kwargs):
+        started = time.perf_counter()
+        result = function(*args, **kwargs)
+        stages[stage] = round(time.perf_counter() - started, 4)
+        return result
+
+    # The leaderboard needs a ladder snapshot, which tftpal.py does not write
+    client = RiotClient('benchmark')
+    for region in regions:
+        entries = client.challenger_league(region)['entries']
+        with db.transaction() as connection:
+            timed(f"ladder_write_{region}", ladder.write_snapshot, connection, entries, datetime.now(), region, [entry['puuid'] for entry in entries])
+    db.close_pool()
+
+    started = time.perf_counter()
+    engine = storage.dashboard_engine()
+    start_date, end_date = timed('date_bounds', dashboard_queries.get_date_bounds, engine)
+    start_date, end_date = start_date.date(), end_date.date()
+    names = timed('names', name_dictionary.load_names, engine)
+    leaderboard = timed('leaderboard', ladder.current_leaderboard, engine, 10)
+    timed('lp_trajectory', ladder.lp_trajectory, engine, tuple(leaderboard['puuid']))
+    timed('biggest_movers', ladder.biggest_movers, engine, datetime.now())
+    unit_counts = timed('unit_tier_counts', dashboard_queries.get_unit_tier_counts, engine, start_date, end_date)
+    timed('unit_tier_counts_rollups', dashboard_queries.get_unit_tier_counts, engine, start_date, end_date, from_rollups=True)
+    timed('trait_counts', dashboard_queries.get_trait_counts, engine, start_date, end_date)
+    timed('trait_counts_rollups', dashboard_queries.get_trait_counts, engine, start_date, end_date, from_rollups=True)
+    character_id = unit_counts.groupby('character_id')['count'].sum().idxmax()
+    timed('item_stats', unit_items.get_item_stats, engine, character_id, start_date, end_date)
+    timed('item_stats_rollups', unit_items.get_item_stats, engine, character_id, start_date, end_date, from_rollups=True)
+    timed('team_comp_counts_rollups', dashboard_queries.get_team_comp_counts, engine, character_id, start_date, end_date)
+    timed('cooccurrence_index', cooccurrence.build_index, engine, start_date, end_date, to_display=lambda raw_ids: name_dictionary.to_display(raw_ids, names, 'unit'))
+    placement_stats = timed('placement_stats_load', analytics.load_stats, engine, names=names)
+    timed('placement_stats_units', placement_stats.unit_stats, placement_stats.mask(start_date, end_date))
+    # The dashboard shows raw rows a page at a time
+    timed('unit_row_count', dashboard_queries.count_unit_rows, engine, start_date, end_date)
+    timed('unit_rows_page', dashboard_queries.get_unit_rows, engine, start_date, end_date, limit=100)
+    timed('trait_row_count', dashboard_queries.count_trait_rows, engine, start_date, end_date)
+    timed('trait_rows_page', dashboard_queries.get_trait_rows, engine, start_date, end_date, limit=100)
+    seconds = time.perf_counter() - started
+
+    result = {
+        'seconds': round(seconds, 3),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'stages': stages,
+    }
+    print(f"dashboard: {seconds:.2f}s, peak RSS {result['peak_rss_mb']} MB")
+    for stage, stage_seconds in stages.items():
+        print(f"  {stage:<28} {stage_seconds:.4f}s")
+    return result
+
+
+def previous_result(params):
+    if not os.path.exists(results_path):
+        return None
+    previous = None
+    with open(results_path, encoding='utf-8') as f:
+        for line in f:
+            result = json.loads(line)
+            if result['params'] == params:
+                previous = result
+    return previous
+
+
+def compare(result, previous):
+    if previous is None:
+        return
+    print(f"Compared with {previous['git_commit']} ({previous['timestamp']}):")
+    for section, key in [('ingest_cold', 'seconds'), ('ingest_cold', 'matches_per_second'), ('ingest_cold', 'peak_rss_mb'),
+                         ('ingest_incremental', 'seconds'), ('dashboard', 'seconds'), ('dashboard', 'peak_rss_mb')]:
+        before, after = previous[section][key], result[section][key]
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"  {section}.{key}: {before} -> {after} ({change:+.1f}%)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline ingestion and dashboard benchmark against a mock Riot API')
+    parser.add_argument('--regions', default='na1', help='Comma-separated platform regions')
+    parser.add_argument('--players', type=int, default=200, help='Ladder players per region')
+    parser.add_argument('--matches', type=int, default=100, help='Match history length per player')
+    parser.add_argument('--latency-ms', type=float, default=20, help='Mock API latency per request')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Fraction of requests the mock API rate limits')
+    parser.add_argument('--backend', default='duckdb', choices=['duckdb', 'sqlite', 'postgresql'], help='Storage backend; postgresql writes to the database in database.ini')
+    parser.add_argument('--workers', type=int, default=16, help='TFTPAL_WORKERS for the ingest')
+    parser.add_argument('--keep', action='store_true', help='Keep the working directory (database, logs, metrics)')
+    args = parser.parse_args()
+
+    regions = [region.strip() for region in args.regions.split(',')]
+    params = {key: value for key, value in vars(args).items() if key != 'keep'}
+    work_dir = tempfile.mkdtemp(prefix='tft-bench-')
+    port = free_port()
+
+    env = dict(os.environ)
+    env.update({
+        'RIOT_API_KEY': 'benchmark',
+        'RIOT_API_BASE_URL': f"http://127.0.0.1:{port}",
+        'RIOT_REGIONS': args.regions,
+        'TFTPAL_WORKERS': str(args.workers),
+        'STORAGE_BACKEND': args.backend,
+        'STORAGE_PATH': os.path.join(work_dir, f"tft.{args.backend}"),
+        'RIOT_CACHE_DIR': os.path.join(work_dir, 'riot_cache'),
+        'MATCH_ARCHIVE_DIR': os.path.join(work_dir, 'match_archive'),
+        'PARQUET_DIR': os.path.join(work_dir, 'parquet'),
+    })
+    env.pop('METRICS_PORT', None)
+    os.environ.update(env)
+    sys.path.insert(0, repo_dir)
+
+    print(f"Benchmark: {args.players} players x {args.matches} matches in {', '.join(regions)}, {args.latency_ms} ms latency, {args.backend} ({work_dir})")
+    server = start_mock_server(args, port)
+    try:
+        result = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'params': params,
+            'ingest_cold': run_ingest('ingest_cold', env, work_dir),
+            'ingest_incremental': run_ingest('ingest_incremental', env, work_dir),
+            'dashboard': run_dashboard(regions),
+        }
+    finally:
+        server.terminate()
+        server.wait()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    result['git_commit'], result['git_dirty'] = git_revision()
+    compare(result, previous_result(params))
+    with open(results_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(result) + '\n')
+    print(f"Results appended to {results_path}")
@@ -1,7 +1,13 @@
+import os
 import streamlit as st
 import pandas as pd
-from sqlalchemy import create_engine
-from config import config
+import dashboard_queries
+import name_dictionary
+import storage
+import unit_items
+import cooccurrence
+import ladder
+import analytics
 import plotly.express as px
 
 # Set the page layout to wide
@@ -12,74 +18,163 @@ st.title('TFT Challenger Dashboard')
 
 st.write("Teamfight Tactics (TFT) is a strategy game where players compete against each other in a series of rounds. Each round, players select units to fight against other players' units. The goal is to build a strong team composition and defeat all opponents to win the game. This dashboard provides insights into the top players in the Challenger league, as well as data on units, traits, and items used by players.")
 
-# Database connection parameters
-db_params = config()
+# Create the engine once per server process rather than on every rerun.
+# It follows the [storage] backend in database.ini: PostgreSQL, DuckDB or SQLite (see storage.py)
+@st.cache_resource
+def get_engine():
+    return storage.dashboard_engine()
 
-# Create SQLAlchemy engine
-engine = create_engine(f"postgresql://{db_params['user']}:{db_params['password']}@{db_params['host']}:{db_params['port']}/{db_params['database']}")
+engine = get_engine()
 
-# Function to get data from PostgreSQL and load into a pandas DataFrame
+# DASHBOARD_SOURCE=parquet reads match data from the Parquet snapshot (see parquet_export.py)
+# instead of the database; the leaderboard and name dictionary still come from the database
+dashboard_source = os.getenv('DASHBOARD_SOURCE', 'database')
+
+@st.cache_resource(ttl=24 * 60 * 60)
+def get_parquet_source(ingest_marker, start_date, end_date, puuid):
+    import parquet_export
+    return parquet_export.ParquetSource(start_date=start_date, end_date=end_date, puuid=puuid)
+
+def get_source(ingest_marker, start_date=None, end_date=None, puuid=None):
+    if dashboard_source == 'parquet':
+        return get_parquet_source(ingest_marker, start_date, end_date, puuid)
+    return engine
+
+# Function to get data from the database and load into a pandas DataFrame
 def get_data_from_db(query):
     try:
         # Execute the query and load data into a DataFrame
-        df = pd.read_sql_query(query, engine)
+        df = dashboard_queries.run_query(engine, query, {})
         return df
     except Exception as e:
         st.error(f"Error: {e}")
         return pd.DataFrame()
 
-units_query = '''
-    select 
-        u.character_id,u.puuid,u.tier, 
-        u.match_id,u.itemnames,u.unit_index,
-        m.game_datetime
-    from units u
-    join matches m on m.match_id=u.match_id
-    where m.tft_set_number=13;
-'''
-traits_query = '''
-    select 
-        t.puuid, t.trait_name, t.tier_current,
-        t.tier_total, t.match_id, t.num_units,
-        m.game_datetime
-    from traits t
-    join matches m on m.match_id=t.match_id
-    where m.tft_set_number=13;
-'''
-challenger_query = '''
-    select 
-        cl.puuid, p.riotidgamename, cl.leaguepoints, 
-        cl.rank, cl.wins, cl.losses, 
-        cl.veteran, cl.inactive, cl.freshblood, 
-        cl.hotstreak, cl.date
-    from challenger_league cl
-    join participants p on cl.puuid=p.puuid;
-'''
-
-####
-# Need to clean data first
-####
+# The latest ingest run; cached loaders below reload only when it changes
+@st.cache_data(ttl=60)
+def get_latest_ingest():
+    latest_ingest = get_data_from_db('select max(finished_at) as finished_at from ingest_runs;')
+    return None if latest_ingest.empty else latest_ingest['finished_at'].iloc[0]
+
+# Widget changes rerun the script, so keep query results in memory.
+# ingest_marker is only part of the cache key; a new ingest run makes it miss.
+# The aggregations themselves run in the database (see dashboard_queries.py).
+@st.cache_data(ttl=24 * 60 * 60)
+def load_date_bounds(ingest_marker):
+    return dashboard_queries.get_date_bounds(get_source(ingest_marker))
+
+@st.cache_data(ttl=24 * 60 * 60)
+def load_rollups_ready(ingest_marker):
+    if dashboard_source == 'parquet':
+        return False
+    try:
+        return dashboard_queries.rollups_ready(engine)
+    except Exception:
+        # Databases from before rollup_state read the raw tables until the next ingest creates it
+        return False
+
+# Display names for raw unit/trait/item ids, with per-set aliases applied (see name_dictionary.py)
+@st.cache_data(ttl=24 * 60 * 60)
+def load_names(ingest_marker):
+    try:
+        return name_dictionary.load_names(engine)
+    except Exception:
+        # Older databases have no dictionary yet; names then come from the naming rules alone
+        return pd.DataFrame(columns=['code', 'kind', 'raw_id', 'display_name'])
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner='Loading units...')
+def load_unit_tier_counts(ingest_marker, start_date, end_date, puuid, from_rollups):
+    character_tier_counts = dashboard_queries.get_unit_tier_counts(get_source(ingest_marker, start_date, end_date, puuid), start_date, end_date, puuid, from_rollups=from_rollups)
+    character_tier_counts['unit'] = name_dictionary.to_display(character_tier_counts['character_id'], load_names(ingest_marker), 'unit')
+    return character_tier_counts
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner='Loading traits...')
+def load_trait_counts(ingest_marker, start_date, end_date, puuid, from_rollups):
+    trait_counts = dashboard_queries.get_trait_counts(get_source(ingest_marker, start_date, end_date, puuid), start_date, end_date, puuid, from_rollups=from_rollups)
+    trait_counts['trait_name'] = name_dictionary.to_display(trait_counts['trait_name'], load_names(ingest_marker), 'trait')
+    return trait_counts.groupby('trait_name', as_index=False, observed=True)['count'].sum().sort_values(by='count', ascending=False)
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner='Loading items...')
+def load_item_stats(ingest_marker, character_ids, start_date, end_date, puuid, from_rollups):
+    if not character_ids:
+        return pd.DataFrame(columns=['itemnames', 'count', 'avg_placement'])
+    item_stats = pd.concat([unit_items.get_item_stats(get_source(ingest_marker, start_date, end_date, puuid), character_id, start_date, end_date, puuid, from_rollups=from_rollups) for character_id in character_ids])
+    item_stats['itemnames'] = name_dictionary.to_display(item_stats['item'], load_names(ingest_marker), 'item')
+    # Weight placements by count so ids that share a display name combine correctly
+    item_stats['placement_sum'] = item_stats['avg_placement'] * item_stats['count']
+    item_stats = item_stats.groupby('itemnames', as_index=False, observed=True)[['count', 'placement_sum']].sum()
+    item_stats['avg_placement'] = (item_stats['placement_sum'] / item_stats['count']).round(2)
+    return item_stats[['itemnames', 'count', 'avg_placement']].sort_values(by='count', ascending=False)
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner='Loading team compositions...')
+def load_team_comp_counts(ingest_marker, character_ids, start_date, end_date, puuid):
+    # Whole-day ranges only (daily_unit_pairs); the co-occurrence index answers the rest
+    if not character_ids:
+        return pd.DataFrame(columns=['character_id', 'count', 'avg_placement'])
+    team_comp_counts = pd.concat([dashboard_queries.get_team_comp_counts(engine, character_id, start_date, end_date, puuid, limit=20) for character_id in character_ids])
+    team_comp_counts['character_id'] = name_dictionary.to_display(team_comp_counts['character_id'], load_names(ingest_marker), 'unit')
+    team_comp_counts = team_comp_counts.groupby('character_id', as_index=False, observed=True)[['count', 'placement_sum']].sum()
+    team_comp_counts['avg_placement'] = (team_comp_counts['placement_sum'] / team_comp_counts['count']).round(2)
+    return team_comp_counts[['character_id', 'count', 'avg_placement']].sort_values(by='count', ascending=False)
+
+# The board co-occurrence index is built once per filter and shared across sessions
+@st.cache_resource(ttl=24 * 60 * 60, show_spinner='Loading team compositions...')
+def load_cooccurrence_index(ingest_marker, start_date, end_date, puuid):
+    names = load_names(ingest_marker)
+    return cooccurrence.build_index(get_source(ingest_marker, start_date, end_date, puuid), start_date, end_date, puuid, to_display=lambda raw_ids: name_dictionary.to_display(raw_ids, names, 'unit'))
+
+# Raw rows are fetched one page at a time, so a table never ships more than PAGE_SIZE rows to the browser
+PAGE_SIZE = 100
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner='Loading units...')
+def load_unit_rows(ingest_marker, start_date, end_date, puuid, page):
+    units_data = dashboard_queries.get_unit_rows(get_source(ingest_marker, start_date, end_date, puuid), start_date, end_date, puuid, limit=PAGE_SIZE, offset=page * PAGE_SIZE)
+    units_data['character_id'] = name_dictionary.to_display(units_data['character_id'], load_names(ingest_marker), 'unit')
+    return units_data
+
+@st.cache_data(ttl=24 * 60 * 60)
+def load_unit_row_count(ingest_marker, start_date, end_date, puuid):
+    return dashboard_queries.count_unit_rows(get_source(ingest_marker, start_date, end_date, puuid), start_date, end_date, puuid)
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner='Loading traits...')
+def load_trait_rows(ingest_marker, start_date, end_date, puuid, page):
+    traits_data = dashboard_queries.get_trait_rows(get_source(ingest_marker, start_date, end_date, puuid), start_date, end_date, puuid, limit=PAGE_SIZE, offset=page * PAGE_SIZE)
+    traits_data['trait_name'] = name_dictionary.to_display(traits_data['trait_name'], load_names(ingest_marker), 'trait')
+    return traits_data
+
+@st.cache_data(ttl=24 * 60 * 60)
+def load_trait_row_count(ingest_marker, start_date, end_date, puuid):
+    return dashboard_queries.count_trait_rows(get_source(ingest_marker, start_date, end_date, puuid), start_date, end_date, puuid)
+
+# Placement arrays are loaded once per ingest; date and player filters are applied in memory (see analytics.py)
+@st.cache_resource(ttl=24 * 60 * 60, show_spinner='Loading placement statistics...')
+def load_placement_stats(ingest_marker):
+    return analytics.load_stats(get_source(ingest_marker), names=load_names(ingest_marker))
+
+# The ladder comes from its time-series tables (see ladder.py) rather than every snapshot joined to participants
+@st.cache_data(ttl=24 * 60 * 60, show_spinner='Loading leaderboard...')
+def load_leaderboard(ingest_marker, limit, offset=0):
+    leaderboard_data = ladder.current_leaderboard(engine, limit, offset=offset)
+    leaderboard_data['date'] = pd.to_datetime(leaderboard_data['snapshot_at']).dt.strftime('%Y-%m-%d')
+    return leaderboard_data
+
+@st.cache_data(ttl=24 * 60 * 60)
+def load_leaderboard_count(ingest_marker):
+    return ladder.count_leaderboard(engine)
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner='Loading league points...')
+def load_lp_trajectory(ingest_marker, puuids):
+    return ladder.lp_trajectory(engine, puuids)
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner='Loading biggest movers...')
+def load_biggest_movers(ingest_marker, since):
+    return ladder.biggest_movers(engine, since)
 
 # Get data from the database
-units_data = get_data_from_db(units_query)
-traits_data = get_data_from_db(traits_query)
-challenger_data = get_data_from_db(challenger_query)
-
-# Remove the 'TFT13_' prefix and capitalize the first letter of each character_id entry
-units_data['character_id'] = units_data['character_id'].str.replace('TFT13_', '').str.capitalize()
-units_data['character_id'] = units_data['character_id'].str.replace('Tft13_', '').str.capitalize()
-
-traits_data['trait_name'] = traits_data['trait_name'].str.replace('TFT13_', '').str.capitalize()
-
-# Drop duplicates based on puuid and date
-challenger_data['date'] = challenger_data['date'].dt.strftime('%Y-%m-%d')
-challenger_data = challenger_data.drop_duplicates(subset=['puuid', 'date'])
-
-# Select the most recent date for each riotidgamename
-most_recent_data = challenger_data.loc[challenger_data.groupby('riotidgamename')['date'].idxmax()]
+ingest_marker = get_latest_ingest()
 
 # Create leaderboard for top 10 riotidgamenames by leaguepoints
-leaderboard_data = most_recent_data.sort_values(by='leaguepoints', ascending=False).head(10)
+leaderboard_data = load_leaderboard(ingest_marker, 10)
 leaderboard_data = leaderboard_data[['puuid', 'date', 'riotidgamename', 'leaguepoints', 'wins', 'losses']]
 
 # Convert the 'date' column to a string format that includes only the date part
@@ -122,161 +217,215 @@ leaderboard_data_display = leaderboard_data[['date', 'riotidgamename', 'leaguepo
 # st.write("The table below shows the top 10 players in the Challenger league based on league points.")
 # st.markdown(leaderboard_data_display.to_html(classes='leaderboard-table', index=False), unsafe_allow_html=True)
 
-# # Create a line graph for the top 10 riotidgamenames by leaguepoints
-top_10_puuids = leaderboard_data['puuid'].tolist()
-top_10_data = challenger_data[challenger_data['puuid'].isin(top_10_puuids)]
-
-# # Convert the 'date' column to a string format that includes only the date part
-
-# line_chart = px.line(
-#     top_10_data,
-#     x='date',
-#     y='leaguepoints',
-#     color='riotidgamename',
-#     title='League Points Over Time for Top 10 Players',
-#     labels={'date': 'Date', 'leaguepoints': 'League Points', 'riotidgamename': 'Player'}
-# )
-# line_chart.update_layout(xaxis_title='Date', yaxis_title='League Points')
-# line_chart.update_xaxes(tickformat='%Y-%m-%d', tickmode='linear')
-
-# # Display the line chart in Streamlit
-# st.plotly_chart(line_chart, use_container_width=True)
-
-# Create two columns for filters
-filter_col1, filter_col2 = st.columns(2)
-
-# Filter options for game date
-min_date = min(units_data['game_datetime'].min(), traits_data['game_datetime'].min())
-max_date = max(units_data['game_datetime'].max(), traits_data['game_datetime'].max())
-selected_date_range = filter_col1.date_input('Select Game Date Range', [min_date, max_date])
-
-# Filter data based on selected game date range
-filtered_units_data = units_data[
-    (units_data['game_datetime'] >= pd.to_datetime(selected_date_range[0])) &
-    (units_data['game_datetime'] <= pd.to_datetime(selected_date_range[1]))
-]
-
-filtered_traits_data = traits_data[
-    (traits_data['game_datetime'] >= pd.to_datetime(selected_date_range[0])) &
-    (traits_data['game_datetime'] <= pd.to_datetime(selected_date_range[1]))
-]
-
-# Create a dropdown selection for the riotidgamename
-selected_player = st.selectbox('Select Player', ['All'] + leaderboard_data['riotidgamename'].tolist())
-
-# Filter the data based on the selected player
-if selected_player != 'All':
-    selected_puuid = leaderboard_data[leaderboard_data['riotidgamename'] == selected_player]['puuid'].values[0]
-    filtered_units_data = filtered_units_data[filtered_units_data['puuid'] == selected_puuid]
-    filtered_traits_data = filtered_traits_data[filtered_traits_data['puuid'] == selected_puuid]
-
-# Count the occurrences of each character_id and tier
-character_tier_counts = filtered_units_data.groupby(['character_id', 'tier']).size().reset_index(name='count')
-
-# Aggregate the counts by character_id to get the total counts
-total_counts = character_tier_counts.groupby('character_id')['count'].sum().reset_index(name='total_count')
-
-# Merge the aggregated counts back with the original character_tier_counts DataFrame
-character_tier_counts = character_tier_counts.merge(total_counts, on='character_id')
-
-# Sort the character_tier_counts DataFrame by total_count in descending order and then by tier in ascending order
-character_tier_counts = character_tier_counts.sort_values(by=['total_count', 'tier'], ascending=[False, True])
-
-# Create stacked bar chart for the count of each character_id with tier as color
-bar_chart1 = px.bar(
-    character_tier_counts,
-    x='character_id',
-    y='count',
-    color='tier',
-    title='Most Used Units',
-    labels={'count': 'Times Used', 'character_id': 'Unit', 'tier': 'Tier'}
-)
-bar_chart1.update_layout(xaxis_title='Unit', yaxis_title='Times Used', barmode='stack')
-
-# Count the occurrences of each trait_name
-trait_counts = filtered_traits_data['trait_name'].value_counts().reset_index()
-trait_counts.columns = ['trait_name', 'count']
-
-# Clean Trait names
-trait_counts['trait_name'] = trait_counts['trait_name'].replace('Warband', 'Conqueror')
-trait_counts['trait_name'] = trait_counts['trait_name'].replace('Cabal', 'Black Rose')
-
-# Create bar chart for the count of each trait_name
-bar_chart2 = px.bar(
-    trait_counts,
-    x='trait_name',
-    y='count',
-    title='Count of Trait',
-    labels={'count': 'Times Used', 'trait_name': 'Trait'}
-)
-bar_chart2.update_layout(xaxis_title='Trait', yaxis_title='Count', barmode='group')
-
-# Display the bar charts in two columns
-col1, col2 = st.columns(2)
-col1.plotly_chart(bar_chart1, use_container_width=True)
-col2.plotly_chart(bar_chart2, use_container_width=True)
-
-# Single-select filter for character_id
-unique_character_ids = character_tier_counts['character_id'].unique()
-selected_character = st.selectbox('Select Unit', unique_character_ids)
-
-# Filter items_data based on selected character_id
-items_data = filtered_units_data.explode('itemnames')
-filtered_items_data = items_data[items_data['character_id'] == selected_character]
-
-filtered_items_data['itemnames'] = filtered_items_data['itemnames'].str.replace('TFT_Item_', '').str.capitalize()
-filtered_items_data['itemnames'] = filtered_items_data['itemnames'].str.replace('Tft13_item_', '').str.capitalize()
-
-# Replace "Frozenheart" with "Protectorsvow"
-filtered_items_data['itemnames'] = filtered_items_data['itemnames'].replace('Frozenheart', 'Protectorsvow')
-
-# Count the occurrences of each item for the selected character_id
-items_counts = filtered_items_data['itemnames'].value_counts().reset_index()
-items_counts.columns = ['itemnames', 'count']
-
-# Limit to top N items
-top_n = 10
-top_items_counts = items_counts.head(top_n)
-
-# Create bar chart for the count of each item for the selected character_id
-bar_chart3 = px.bar(
-    top_items_counts,
-    x='itemnames',
-    y='count',
-    title=f'Top {top_n} Most Often Used Items By Unit: {selected_character}',
-    labels={'count': 'Times Used', 'itemnames': 'Item'}
-)
-bar_chart3.update_layout(xaxis_title='Item', yaxis_title='Times Used', barmode='group', height=600)
-
-# Filter units_data to include only rows with the same puuid and match_id as the selected character
-selected_puuid_match_id = filtered_units_data[filtered_units_data['character_id'] == selected_character][['puuid', 'match_id']]
-team_comp_data = units_data.merge(selected_puuid_match_id, on=['puuid', 'match_id'])
-
-# Count the occurrences of each character_id in the team comp data
-team_comp_counts = team_comp_data['character_id'].value_counts().reset_index()
-team_comp_counts.columns = ['character_id', 'count']
-
-# Remove the selected character from the team comp counts
-team_comp_counts = team_comp_counts[team_comp_counts['character_id'] != selected_character]
-team_comp_counts = team_comp_counts.head(10)
-
-# Create bar chart for the count of each character_id in the team comp
-team_comp_chart = px.bar(
-    team_comp_counts,
-    x='character_id',
-    y='count',
-    title=f'Team Composition for Selected Unit: {selected_character}',
-    labels={'count': 'Times Used', 'character_id': 'Unit'}
-)
-team_comp_chart.update_layout(xaxis_title='Unit', yaxis_title='Times Used', barmode='group', height=600)
-
-# Display the item chart and team comp chart in two columns
-col1, col2 = st.columns(2)
-col1.plotly_chart(bar_chart3, use_container_width=True)
-col2.plotly_chart(team_comp_chart, use_container_width=True)
-
-# Display the filtered data in Streamlit
-st.write(filtered_units_data)
-st.write(filtered_traits_data)
-st.write(challenger_data)
-
+# Only the leaderboard is queried on first paint; every other section loads its data
+# when it is picked, and sections with their own widgets rerun on their own (st.fragment)
+st.subheader('Top 10 Players by League Points')
+st.dataframe(leaderboard_data_display, use_container_width=True, hide_index=True)
+
+section = st.segmented_control('Section', ['League Points', 'Player Stats', 'Units & Traits', 'Items & Team Comps', 'Raw Data'], key='section')
+
+# Function to show the date range and player filters shared by the match data sections
+def show_filters():
+    # Create two columns for filters
+    filter_col1, filter_col2 = st.columns(2)
+
+    # Filter options for game date
+    min_date, max_date = load_date_bounds(ingest_marker)
+    selected_date_range = filter_col1.date_input('Select Game Date Range', [min_date, max_date], key='date_range')
+    start_date, end_date = selected_date_range[0], selected_date_range[-1]
+
+    # Create a dropdown selection for the riotidgamename
+    selected_player = filter_col2.selectbox('Select Player', ['All'] + leaderboard_data['riotidgamename'].tolist(), key='player')
+
+    # Filter the data based on the selected player
+    selected_puuid = None
+    if selected_player != 'All':
+        selected_puuid = leaderboard_data[leaderboard_data['riotidgamename'] == selected_player]['puuid'].values[0]
+    return start_date, end_date, selected_puuid
+
+def show_league_points():
+    # Create a line graph for the top 10 riotidgamenames by leaguepoints
+    top_10_puuids = tuple(leaderboard_data['puuid'].tolist())
+    top_10_data = load_lp_trajectory(ingest_marker, top_10_puuids)
+
+    line_chart = px.line(
+        top_10_data,
+        x='date',
+        y='leaguepoints',
+        color='riotidgamename',
+        title='League Points Over Time for Top 10 Players',
+        labels={'date': 'Date', 'leaguepoints': 'League Points', 'riotidgamename': 'Player'}
+    )
+    line_chart.update_layout(xaxis_title='Date', yaxis_title='League Points')
+    line_chart.update_xaxes(tickformat='%Y-%m-%d')
+
+    # Display the line chart in Streamlit
+    st.plotly_chart(line_chart, use_container_width=True)
+
+    # Largest LP swings over the last week
+    st.subheader('Biggest Movers (Last 7 Days)')
+    movers_since = (pd.Timestamp.now() - pd.Timedelta(days=7)).floor('D')
+    st.dataframe(load_biggest_movers(ingest_marker, movers_since), use_container_width=True, hide_index=True)
+
+def show_player_stats(start_date, end_date, selected_puuid):
+    # KPIs for the selected range and player
+    placement_stats = load_placement_stats(ingest_marker)
+    stats_mask = placement_stats.mask(start_date, end_date, puuids=None if selected_puuid is None else [selected_puuid])
+    kpis = placement_stats.kpis(stats_mask)
+    kpi_cols = st.columns(6)
+    if kpis['games']:
+        kpi_cols[0].metric('Avg Placement', f"{kpis['avg_placement']:.2f}")
+        kpi_cols[1].metric('Top 4 %', f"{kpis['top4_rate'] * 100:.1f}%")
+        kpi_cols[2].metric('Win %', f"{kpis['win_rate'] * 100:.1f}%")
+        kpi_cols[3].metric('Avg Damage', f"{kpis['avg_damage']:.1f}")
+        kpi_cols[4].metric('Avg Gold Left', f"{kpis['avg_gold_left']:.1f}")
+        kpi_cols[5].metric('Avg Players Eliminated', f"{kpis['avg_players_eliminated']:.2f}")
+
+    # Average placement of each unit and comp on the filtered boards, with 95% confidence intervals
+    col1, col2 = st.columns(2)
+    col1.subheader('Unit Placement Stats')
+    col1.dataframe(placement_stats.unit_stats(stats_mask, min_games=5), use_container_width=True, hide_index=True)
+    col2.subheader('Comp Placement Stats')
+    col2.dataframe(placement_stats.comp_stats(stats_mask, min_games=5), use_container_width=True, hide_index=True)
+
+def load_character_tier_counts(start_date, end_date, selected_puuid):
+    # Whole-day ranges are answered from the daily rollup tables instead of the raw units and traits
+    use_rollups = dashboard_queries.aligns_to_days(start_date, end_date) and load_rollups_ready(ingest_marker)
+
+    # Count the occurrences of each character_id and tier
+    raw_character_tier_counts = load_unit_tier_counts(ingest_marker, start_date, end_date, selected_puuid, use_rollups)
+    character_tier_counts = raw_character_tier_counts.groupby(['unit', 'tier'], as_index=False, observed=True)['count'].sum()
+    character_tier_counts = character_tier_counts.rename(columns={'unit': 'character_id'})
+
+    # Aggregate the counts by character_id to get the total counts
+    total_counts = character_tier_counts.groupby('character_id', observed=True)['count'].sum().reset_index(name='total_count')
+
+    # Merge the aggregated counts back with the original character_tier_counts DataFrame
+    character_tier_counts = character_tier_counts.merge(total_counts, on='character_id')
+
+    # Sort the character_tier_counts DataFrame by total_count in descending order and then by tier in ascending order
+    character_tier_counts = character_tier_counts.sort_values(by=['total_count', 'tier'], ascending=[False, True])
+    return raw_character_tier_counts, character_tier_counts, use_rollups
+
+def show_units_and_traits(start_date, end_date, selected_puuid):
+    _, character_tier_counts, use_rollups = load_character_tier_counts(start_date, end_date, selected_puuid)
+
+    # Create stacked bar chart for the count of each character_id with tier as color
+    bar_chart1 = px.bar(
+        character_tier_counts,
+        x='character_id',
+        y='count',
+        color='tier',
+        title='Most Used Units',
+        labels={'count': 'Times Used', 'character_id': 'Unit', 'tier': 'Tier'}
+    )
+    bar_chart1.update_layout(xaxis_title='Unit', yaxis_title='Times Used', barmode='stack')
+
+    # Count the occurrences of each trait_name
+    trait_counts = load_trait_counts(ingest_marker, start_date, end_date, selected_puuid, use_rollups)
+
+    # Create bar chart for the count of each trait_name
+    bar_chart2 = px.bar(
+        trait_counts,
+        x='trait_name',
+        y='count',
+        title='Count of Trait',
+        labels={'count': 'Times Used', 'trait_name': 'Trait'}
+    )
+    bar_chart2.update_layout(xaxis_title='Trait', yaxis_title='Count', barmode='group')
+
+    # Display the bar charts in two columns
+    col1, col2 = st.columns(2)
+    col1.plotly_chart(bar_chart1, use_container_width=True)
+    col2.plotly_chart(bar_chart2, use_container_width=True)
+
+# Picking a unit reruns only this section
+@st.fragment
+def show_items_and_team_comps(start_date, end_date, selected_puuid):
+    raw_character_tier_counts, character_tier_counts, use_rollups = load_character_tier_counts(start_date, end_date, selected_puuid)
+
+    # Single-select filter for character_id
+    unique_character_ids = character_tier_counts['character_id'].unique()
+    selected_character = st.selectbox('Select Unit', unique_character_ids, key='unit')
+
+    # Raw character ids behind the selected (cleaned) unit name
+    selected_character_ids = tuple(raw_character_tier_counts.loc[raw_character_tier_counts['unit'] == selected_character, 'character_id'].unique())
+
+    # Count the occurrences of each item for the selected character_id, with the average placement when built
+    items_counts = load_item_stats(ingest_marker, selected_character_ids, start_date, end_date, selected_puuid, use_rollups)
+
+    # Limit to top N items
+    top_n = 10
+    top_items_counts = items_counts.head(top_n)
+
+    # Create bar chart for the count of each item for the selected character_id
+    bar_chart3 = px.bar(
+        top_items_counts,
+        x='itemnames',
+        y='count',
+        title=f'Top {top_n} Most Often Used Items By Unit: {selected_character}',
+        labels={'count': 'Times Used', 'itemnames': 'Item', 'avg_placement': 'Avg Placement'},
+        hover_data=['avg_placement']
+    )
+    bar_chart3.update_layout(xaxis_title='Item', yaxis_title='Times Used', barmode='group', height=600)
+
+    # Count the other units on the same boards as the selected character
+    cooccurrence_index = load_cooccurrence_index(ingest_marker, start_date, end_date, selected_puuid)
+    if use_rollups:
+        team_comp_counts = load_team_comp_counts(ingest_marker, selected_character_ids, start_date, end_date, selected_puuid)
+        team_comp_counts = team_comp_counts[team_comp_counts['character_id'] != selected_character].head(10)
+    else:
+        team_comp_counts = cooccurrence_index.pairs(selected_character, limit=10)
+
+    # Create bar chart for the count of each character_id in the team comp
+    team_comp_chart = px.bar(
+        team_comp_counts,
+        x='character_id',
+        y='count',
+        title=f'Team Composition for Selected Unit: {selected_character}',
+        labels={'count': 'Times Used', 'character_id': 'Unit', 'avg_placement': 'Avg Placement'},
+        hover_data=['avg_placement']
+    )
+    team_comp_chart.update_layout(xaxis_title='Unit', yaxis_title='Times Used', barmode='group', height=600)
+
+    # Display the item chart and team comp chart in two columns
+    col1, col2 = st.columns(2)
+    col1.plotly_chart(bar_chart3, use_container_width=True)
+    col2.plotly_chart(team_comp_chart, use_container_width=True)
+
+    # Most common complete boards that include the selected character
+    st.subheader(f'Most Common Boards With {selected_character}')
+    st.dataframe(cooccurrence_index.top_boards(10, containing=selected_character), use_container_width=True, hide_index=True)
+
+# One page of a raw table; paging reruns only this table. The key includes the filters,
+# so a new filter starts again from page 1.
+@st.fragment
+def show_paginated_table(title, key, row_count, load_page):
+    st.subheader(title)
+    page_count = max(1, -(-row_count // PAGE_SIZE))
+    page = st.number_input(f'Page (of {page_count}, {row_count} rows)', min_value=1, max_value=page_count, value=1, key=key)
+    st.dataframe(load_page(page - 1), use_container_width=True, hide_index=True)
+
+def show_raw_data(start_date, end_date, selected_puuid):
+    filter_key = f"{start_date}_{end_date}_{selected_puuid}"
+    show_paginated_table('Units', f"units_page_{filter_key}", load_unit_row_count(ingest_marker, start_date, end_date, selected_puuid),
+                         lambda page: load_unit_rows(ingest_marker, start_date, end_date, selected_puuid, page))
+    show_paginated_table('Traits', f"traits_page_{filter_key}", load_trait_row_count(ingest_marker, start_date, end_date, selected_puuid),
+                         lambda page: load_trait_rows(ingest_marker, start_date, end_date, selected_puuid, page))
+    show_paginated_table('Challenger League', 'ladder_page', load_leaderboard_count(ingest_marker),
+                         lambda page: load_leaderboard(ingest_marker, PAGE_SIZE, page * PAGE_SIZE))
+
+if section == 'League Points':
+    show_league_points()
+elif section is not None:
+    start_date, end_date, selected_puuid = show_filters()
+    if section == 'Player Stats':
+        show_player_stats(start_date, end_date, selected_puuid)
+    elif section == 'Units & Traits':
+        show_units_and_traits(start_date, end_date, selected_puuid)
+    elif section == 'Items & Team Comps':
+        show_items_and_team_comps(start_date, end_date, selected_puuid)
+    elif section == 'Raw Data':
+        show_raw_data(start_date, end_date, selected_puuid)
+else:
+    st.caption('Pick a section above to load it.')
@@ -2,6 +2,7 @@ import requests
 from datetime import datetime
 from dotenv import load_dotenv
 import os
+from response_cache import ResponseCache
 
 # Load environment variables from .env file
 load_dotenv()
@@ -14,17 +15,25 @@ if not api_key:
 
 region = 'na1'
 
+response_cache = ResponseCache()
+
+def fetch_challenger_league(region, api_key, use_cache=True):
+    # Both lookups below read the same endpoint, so share one cached response. Snapshots
+    # pass use_cache=False: they are stamped with the current time, so they need the live ladder
+    url = f"https://{region}.api.riotgames.com/tft/league/v1/challenger"
+    params = {'queue': 'RANKED_TFT'}
+    response_body = response_cache.get('league', url, params) if use_cache else None
+    if response_body is None:
+        response = requests.get(url, params=params, headers={"X-Riot-Token": api_key})
+        response.raise_for_status()  # Raise an exception for HTTP errors
+        response_body = response.json()
+        response_cache.put('league', url, response_body, params)
+    return response_body
+
 def get_challenger_leauge_puuid(region, api_key):
-    # Construct the URL for the endpoint
-    url = f"https://{region}.api.riotgames.com/tft/league/v1/challenger?queue=RANKED_TFT&api_key={api_key}"
     puuid_list = []
     try:
-        # Make the request to the endpoint
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-
-        # Parse the JSON response
-        response_body = response.json()
+        response_body = fetch_challenger_league(region, api_key)
         entries = response_body['entries']
         puuid_list = [entry['puuid'] for entry in entries]  # Extract the puuid from each entry
         #print(puuid_list)
@@ -41,16 +50,9 @@ def get_challenger_leauge_puuid(region, api_key):
     return puuid_list
 
 def get_challenger_league_data(region,api_key):
-    # Construct the URL for the endpoint
-    url = f"https://{region}.api.riotgames.com/tft/league/v1/challenger?queue=RANKED_TFT&api_key={api_key}"
     entries = []
     try:
-        # Make the request to the endpoint
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-
-        # Parse the JSON response
-        response_body = response.json()
+        response_body = fetch_challenger_league(region, api_key, use_cache=False)
         entries = response_body['entries']
 
         # Add the current datetime as 'date' to each entry
@@ -1,3 +1,4 @@
+import os
 from configparser import ConfigParser
 
 def config(filename='database.ini', section='postgresql'):
@@ -14,4 +15,18 @@ def config(filename='database.ini', section='postgresql'):
         raise Exception('Section{0} not found in the {1} file'.format(section, filename))
     return db
 
-config()
\ No newline at end of file
+def storage_config(filename='database.ini', section='storage'):
+    # Which database to use: postgresql (the default), duckdb or sqlite.
+    # The embedded backends keep everything in one file and need no [postgresql] section, e.g.
+    #   [storage]
+    #   backend = duckdb
+    #   path = tft.duckdb
+    # STORAGE_BACKEND and STORAGE_PATH override the file, e.g. for CI runs
+    parser = ConfigParser()
+    parser.read(filename)
+    storage = dict(parser.items(section)) if parser.has_section(section) else {}
+    storage['backend'] = os.getenv('STORAGE_BACKEND', storage.get('backend', 'postgresql')).lower()
+    if storage['backend'] not in ('postgresql', 'duckdb', 'sqlite'):
+        raise Exception('Unknown storage backend {0} in the {1} file'.format(storage['backend'], filename))
+    storage['path'] = os.getenv('STORAGE_PATH', storage.get('path', 'tft.' + storage['backend']))
+    return storage
@@ -0,0 +1,122 @@
+import json
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from dashboard_queries import dialect_name, match_filters, run_query
+
+
+class CooccurrenceIndex:
+    # Boards (one participant in one match) as a sparse board x unit membership matrix.
+    # Unit-by-unit co-occurrence counts and placement sums are precomputed, so the team
+    # composition for any unit is a single sparse row lookup.
+    def __init__(self, board_units, placements, unit_names):
+        # board_units: list of integer unit-code arrays, one per board
+        # placements: placement of each board; unit_names: display name of each code
+        self.unit_names = np.asarray(unit_names)
+        self.placements = np.asarray(placements, dtype=np.float64)
+        n_boards = len(board_units)
+        n_units = len(self.unit_names)
+
+        lengths = np.fromiter((len(units) for units in board_units), dtype=np.int64, count=n_boards)
+        rows = np.repeat(np.arange(n_boards), lengths)
+        columns = np.concatenate(board_units) if n_boards else np.array([], dtype=np.int64)
+        membership = sparse.csr_matrix((np.ones(len(columns)), (rows, columns)), shape=(n_boards, n_units))
+        membership.sum_duplicates()
+        membership.data[:] = 1
+        membership.sort_indices()
+        self.membership = membership
+
+        # counts[a, b]: boards with both a and b; the diagonal is boards with a
+        self.counts = (membership.T @ membership).tocsr()
+        self.placement_sums = (membership.T @ sparse.diags(self.placements) @ membership).tocsr()
+
+        # Order-independent hash of each board's unit set: a sum of random 64-bit weights per unit
+        weights = np.random.default_rng(0).integers(1, 2 ** 63, size=n_units, dtype=np.uint64)
+        board_hashes = np.zeros(n_boards, dtype=np.uint64)
+        non_empty = np.diff(membership.indptr) > 0
+        if membership.nnz:
+            sums = np.add.reduceat(weights[membership.indices], membership.indptr[:-1][non_empty])
+            board_hashes[non_empty] = sums
+        self.board_hashes = board_hashes
+
+    def code_of(self, unit_name):
+        matches = np.flatnonzero(self.unit_names == unit_name)
+        return int(matches[0]) if len(matches) else None
+
+    def pairs(self, unit_name, limit=10):
+        # Units most often on the same board as unit_name, with their average placement together
+        code = self.code_of(unit_name)
+        if code is None:
+            return pd.DataFrame(columns=['character_id', 'count', 'avg_placement'])
+        counts = self.counts.getrow(code)
+        placement_sums = self.placement_sums.getrow(code)
+        keep = counts.indices != code
+        others = counts.indices[keep]
+        together = counts.data[keep]
+        sums = np.asarray(placement_sums[0, others].todense()).ravel()
+        order = np.argsort(-together, kind='stable')[:limit]
+        return pd.DataFrame({
+            'character_id': self.unit_names[others[order]],
+            'count': together[order].astype(np.int64),
+            'avg_placement': np.round(sums[order] / together[order], 2),
+        })
+
+    def top_boards(self, k=10, containing=None):
+        # Most common complete boards, optionally only those that include a given unit
+        mask = self.board_hashes != 0
+        if containing is not None:
+            code = self.code_of(containing)
+            if code is None:
+                return pd.DataFrame(columns=['board', 'count', 'avg_placement'])
+            mask &= np.asarray(self.membership[:, code].todense()).ravel() > 0
+        board_ids = np.flatnonzero(mask)
+        if not len(board_ids):
+            return pd.DataFrame(columns=['board', 'count', 'avg_placement'])
+
+        unique_hashes, first_index, inverse, counts = np.unique(
+            self.board_hashes[board_ids], return_index=True, return_inverse=True, return_counts=True
+        )
+        placement_sums = np.bincount(inverse, weights=self.placements[board_ids])
+        order = np.argsort(-counts, kind='stable')[:k]
+        boards = []
+        for position in order:
+            board = board_ids[first_index[position]]
+            units = self.membership.indices[self.membership.indptr[board]:self.membership.indptr[board + 1]]
+            boards.append(', '.join(sorted(self.unit_names[units])))
+        return pd.DataFrame({
+            'board': boards,
+            'count': counts[order],
+            'avg_placement': np.round(placement_sums[order] / counts[order], 2),
+        })
+
+
+def load_boards(engine, start_date, end_date, puuid=None, set_number=13):
+    # One row per board with its distinct units, so the payload is boards rather than unit rows
+    where, params = match_filters(start_date, end_date, puuid, set_number, alias='p')
+    # SQLite has no arrays, so its units come back as JSON text
+    sqlite = dialect_name(engine) == 'sqlite'
+    units = 'json_group_array(distinct u.character_id)' if sqlite else 'array_agg(distinct u.character_id)'
+    sql = f'''
+        select p.match_id, p.puuid, p.placement, {units} as units
+        from participants p
+        join matches m on m.match_id = p.match_id
+        join units u on u.match_id = p.match_id and u.puuid = p.puuid
+        where {where}
+        group by p.match_id, p.puuid, p.placement;
+    '''
+    boards = run_query(engine, sql, params)
+    if sqlite:
+        boards['units'] = boards['units'].map(json.loads)
+    return boards
+
+
+# Function to build the index for a filter; to_display maps a Series of raw ids to the names shown
+def build_index(engine, start_date, end_date, puuid=None, set_number=13, to_display=None):
+    boards = load_boards(engine, start_date, end_date, puuid, set_number)
+    flat_units = pd.Series([unit for units in boards['units'] for unit in units], dtype=object)
+    if to_display is not None:
+        flat_units = to_display(flat_units)
+    codes, unit_names = pd.factorize(flat_units)
+    lengths = boards['units'].map(len).to_numpy()
+    board_units = np.split(codes, np.cumsum(lengths)[:-1]) if len(lengths) else []
+    return CooccurrenceIndex(board_units, boards['placement'].to_numpy(), np.asarray(unit_names))
@@ -0,0 +1,213 @@
+from datetime import date, datetime, timedelta
+import pandas as pd
+from sqlalchemy import Connection, text
+
+# Aggregations behind the dashboard charts, run in the database so only
+# a few hundred aggregated rows come back instead of whole fact tables.
+
+
+def match_filters(start_date, end_date, puuid=None, set_number=13, alias='u'):
+    # Shared WHERE clause; the end date is inclusive, so filter up to the next midnight
+    conditions = [
+        'm.tft_set_number = :set_number',
+        'm.game_datetime >= :start_date',
+        'm.game_datetime < :end_date',
+    ]
+    params = {
+        'set_number': set_number,
+        'start_date': pd.to_datetime(start_date).to_pydatetime(),
+        'end_date': (pd.to_datetime(end_date) + timedelta(days=1)).to_pydatetime(),
+    }
+    if puuid is not None:
+        conditions.append(f'{alias}.puuid = :puuid')
+        params['puuid'] = puuid
+    return ' and '.join(conditions), params
+
+
+def rollup_filters(start_date, end_date, puuid=None, set_number=13):
+    # Rollups are keyed by day, so whole days map straight onto the primary key
+    conditions = [
+        'r.tft_set_number = :set_number',
+        'r.day between :start_date and :end_date',
+    ]
+    params = {
+        'set_number': set_number,
+        'start_date': pd.to_datetime(start_date).date(),
+        'end_date': pd.to_datetime(end_date).date(),
+    }
+    if puuid is not None:
+        conditions.append('r.puuid = :puuid')
+        params['puuid'] = puuid
+    return ' and '.join(conditions), params
+
+
+def aligns_to_days(start_date, end_date):
+    # Rollups can only answer ranges made of whole days
+    for value in (start_date, end_date):
+        if isinstance(value, datetime) and value.time() != datetime.min.time():
+            return False
+        if not isinstance(value, date):
+            return False
+    return True
+
+
+def rollups_ready(engine):
+    # Rollups are only read once they cover every stored match (see rollups.ROLLUP_VERSION);
+    # an upgraded database has partial rollups until `python rollups.py` rebuilds them
+    import rollups
+    ready = run_query(engine, 'select exists (select 1 from rollup_state where version = :version) as ready;', {'version': rollups.ROLLUP_VERSION})
+    return bool(ready['ready'].iloc[0])
+
+
+def in_list(name, values, params):
+    # Expand values into numbered :name_0, :name_1, ... parameters for an IN (...) list
+    names = [f'{name}_{index}' for index in range(len(values))]
+    params.update(zip(names, values))
+    return ', '.join(f':{param_name}' for param_name in names)
+
+
+def dialect_name(engine):
+    # DuckDB sources (storage.py, parquet_export.py) are not SQLAlchemy engines
+    if hasattr(engine, 'run_query'):
+        return 'duckdb'
+    return engine.dialect.name
+
+
+def run_query(engine, sql, params):
+    # DuckDB databases and Parquet snapshots run the same SQL through DuckDB
+    if hasattr(engine, 'run_query'):
+        return engine.run_query(sql, params)
+    # An open connection (see analytics.snapshot) runs the query in its current transaction
+    if isinstance(engine, Connection):
+        return pd.read_sql_query(text(sql), engine, params=params)
+    with engine.connect() as connection:
+        return pd.read_sql_query(text(sql), connection, params=params)
+
+
+def get_date_bounds(engine, set_number=13):
+    sql = 'select min(game_datetime) as min_date, max(game_datetime) as max_date from matches where tft_set_number = :set_number;'
+    bounds = run_query(engine, sql, {'set_number': set_number})
+    # SQLite hands timestamps back as text
+    return pd.to_datetime(bounds['min_date'].iloc[0]), pd.to_datetime(bounds['max_date'].iloc[0])
+
+
+def get_unit_tier_counts(engine, start_date, end_date, puuid=None, set_number=13, from_rollups=False):
+    if from_rollups:
+        where, params = rollup_filters(start_date, end_date, puuid, set_number)
+        sql = f'''
+            select r.character_id, r.tier, sum(r.units) as count
+            from daily_unit_counts r
+            where {where}
+            group by r.character_id, r.tier;
+        '''
+        return run_query(engine, sql, params)
+    where, params = match_filters(start_date, end_date, puuid, set_number)
+    sql = f'''
+        select u.character_id, u.tier, count(*) as count
+        from units u
+        join matches m on m.match_id = u.match_id
+        where {where}
+        group by u.character_id, u.tier;
+    '''
+    return run_query(engine, sql, params)
+
+
+def get_trait_counts(engine, start_date, end_date, puuid=None, set_number=13, from_rollups=False):
+    if from_rollups:
+        where, params = rollup_filters(start_date, end_date, puuid, set_number)
+        sql = f'''
+            select r.trait_name, sum(r.traits) as count
+            from daily_trait_counts r
+            where {where}
+            group by r.trait_name
+            order by count desc;
+        '''
+        return run_query(engine, sql, params)
+    where, params = match_filters(start_date, end_date, puuid, set_number, alias='t')
+    sql = f'''
+        select t.trait_name, count(*) as count
+        from traits t
+        join matches m on m.match_id = t.match_id
+        where {where}
+        group by t.trait_name
+        order by count desc;
+    '''
+    return run_query(engine, sql, params)
+
+
+def get_team_comp_counts(engine, character_id, start_date, end_date, puuid=None, set_number=13, limit=10):
+    # Boards (same puuid and match) each other unit shares with the selected unit, from the
+    # daily_unit_pairs rollup; other ranges are answered by cooccurrence.py from the raw units
+    where, params = rollup_filters(start_date, end_date, puuid, set_number)
+    params.update({'character_id': character_id, 'limit': limit})
+    sql = f'''
+        select r.other_character_id as character_id, sum(r.boards) as count, sum(r.placement_sum) as placement_sum
+        from daily_unit_pairs r
+        where {where} and r.character_id = :character_id
+        group by r.other_character_id
+        order by count desc
+        limit :limit;
+    '''
+    return run_query(engine, sql, params)
+
+
+def page_clause(limit, offset, params):
+    # LIMIT/OFFSET for one page of raw rows; limit None returns every row
+    if limit is None:
+        return ''
+    params.update({'limit': limit, 'offset': offset})
+    return 'limit :limit offset :offset'
+
+
+def get_unit_rows(engine, start_date, end_date, puuid=None, set_number=13, limit=None, offset=0):
+    where, params = match_filters(start_date, end_date, puuid, set_number)
+    sql = f'''
+        select
+            u.character_id, u.puuid, u.tier,
+            u.match_id, u.itemnames, u.unit_index,
+            m.game_datetime
+        from units u
+        join matches m on m.match_id = u.match_id
+        where {where}
+        order by m.game_datetime desc, u.match_id, u.puuid, u.unit_index, u.character_id
+        {page_clause(limit, offset, params)};
+    '''
+    return run_query(engine, sql, params)
+
+
+def count_unit_rows(engine, start_date, end_date, puuid=None, set_number=13):
+    where, params = match_filters(start_date, end_date, puuid, set_number)
+    sql = f'''
+        select count(*) as count
+        from units u
+        join matches m on m.match_id = u.match_id
+        where {where};
+    '''
+    return int(run_query(engine, sql, params)['count'].iloc[0])
+
+
+def get_trait_rows(engine, start_date, end_date, puuid=None, set_number=13, limit=None, offset=0):
+    where, params = match_filters(start_date, end_date, puuid, set_number, alias='t')
+    sql = f'''
+        select
+            t.puuid, t.trait_name, t.tier_current,
+            t.tier_total, t.match_id, t.num_units,
+            m.game_datetime
+        from traits t
+        join matches m on m.match_id = t.match_id
+        where {where}
+        order by m.game_datetime desc, t.match_id, t.puuid, t.trait_name
+        {page_clause(limit, offset, params)};
+    '''
+    return run_query(engine, sql, params)
+
+
+def count_trait_rows(engine, start_date, end_date, puuid=None, set_number=13):
+    where, params = match_filters(start_date, end_date, puuid, set_number, alias='t')
+    sql = f'''
+        select count(*) as count
+        from traits t
+        join matches m on m.match_id = t.match_id
+        where {where};
+    '''
+    return int(run_query(engine, sql, params)['count'].iloc[0])
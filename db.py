@@ -0,0 +1,400 @@
+import io
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+import psycopg2
+from psycopg2 import pool
+from psycopg2.extras import execute_values
+from config import config
+from match_transform import MATCH_TABLES
+import ladder
+import metrics
+import name_dictionary
+import riot_accounts
+import rollups
+import storage
+import unit_items
+import work_queue
+
+# Conflict columns that make each table's inserts idempotent
+CONFLICT_COLUMNS = {
+    'Matches': ['match_id'],
+    'Participants': ['puuid', 'match_id'],
+    'Units': ['unit_index', 'puuid', 'match_id', 'character_id'],
+    'Traits': ['trait_name', 'puuid', 'match_id'],
+    'unit_items': ['match_id', 'puuid', 'character_id', 'unit_index', 'slot'],
+}
+
+# Match and ladder tables; on PostgreSQL these may already exist from before the schema lived here
+CORE_SCHEMA_STATEMENTS = [
+    '''
+    CREATE TABLE IF NOT EXISTS Matches (
+        match_id TEXT PRIMARY KEY,
+        game_version TEXT,
+        game_datetime TIMESTAMP,
+        queue_id INTEGER,
+        endofgameresult TEXT,
+        game_length DOUBLE PRECISION,
+        tft_game_type TEXT,
+        tft_set_core_name TEXT,
+        tft_set_number INTEGER,
+        region TEXT DEFAULT 'na1'
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS Participants (
+        puuid TEXT NOT NULL,
+        match_id TEXT NOT NULL,
+        placement INTEGER,
+        level INTEGER,
+        total_damage_to_players INTEGER,
+        riotidgamename TEXT,
+        riotidtagline TEXT,
+        partner_group_id INTEGER,
+        gold_left INTEGER,
+        last_round INTEGER,
+        players_eliminated INTEGER,
+        time_eliminated DOUBLE PRECISION,
+        win BOOLEAN,
+        PRIMARY KEY (puuid, match_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS Units (
+        character_id TEXT NOT NULL,
+        puuid TEXT NOT NULL,
+        unit_name TEXT,
+        tier INTEGER,
+        match_id TEXT NOT NULL,
+        itemnames TEXT[],
+        unit_index INTEGER NOT NULL,
+        character_code SMALLINT,
+        PRIMARY KEY (unit_index, puuid, match_id, character_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS Traits (
+        puuid TEXT NOT NULL,
+        trait_name TEXT NOT NULL,
+        tier_current INTEGER,
+        tier_total INTEGER,
+        match_id TEXT NOT NULL,
+        num_units INTEGER,
+        trait_code SMALLINT,
+        PRIMARY KEY (trait_name, puuid, match_id)
+    )
+    ''',
+    # Full ladder copies written before ladder_snapshots existed; `python ladder.py` migrates them
+    '''
+    CREATE TABLE IF NOT EXISTS challenger_league (
+        puuid TEXT NOT NULL,
+        summonerid TEXT,
+        leaguepoints INTEGER,
+        rank TEXT,
+        wins INTEGER,
+        losses INTEGER,
+        veteran BOOLEAN,
+        inactive BOOLEAN,
+        freshblood BOOLEAN,
+        hotstreak BOOLEAN,
+        date TIMESTAMP NOT NULL,
+        PRIMARY KEY (date, puuid)
+    )
+    ''',
+]
+
+# Tables and indexes owned by the ingestion scripts and the dashboard queries
+SCHEMA_STATEMENTS = CORE_SCHEMA_STATEMENTS + [
+    '''
+    CREATE TABLE IF NOT EXISTS player_watermarks (
+        puuid TEXT PRIMARY KEY,
+        last_game_datetime TIMESTAMP NOT NULL,
+        last_match_id TEXT NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS ingest_runs (
+        run_id SERIAL PRIMARY KEY,
+        source TEXT NOT NULL,
+        rows_written INTEGER NOT NULL,
+        finished_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+    ''',
+    # Platform region each match was played on; matches stored before regions were tracked are all na1
+    "ALTER TABLE Matches ADD COLUMN IF NOT EXISTS region TEXT DEFAULT 'na1'",
+    # Indexes behind the dashboard's GROUP BY queries
+    'CREATE INDEX IF NOT EXISTS matches_set_datetime_idx ON Matches (tft_set_number, game_datetime)',
+    'CREATE INDEX IF NOT EXISTS units_match_puuid_idx ON Units (match_id, puuid)',
+    'CREATE INDEX IF NOT EXISTS units_character_idx ON Units (character_id)',
+    'CREATE INDEX IF NOT EXISTS traits_match_idx ON Traits (match_id)',
+] + ladder.SCHEMA_STATEMENTS + rollups.SCHEMA_STATEMENTS + name_dictionary.SCHEMA_STATEMENTS + unit_items.SCHEMA_STATEMENTS + riot_accounts.SCHEMA_STATEMENTS + work_queue.SCHEMA_STATEMENTS
+
+max_connections = int(os.getenv('DB_POOL_SIZE', 16))
+
+# Batches at least this large are staged with COPY instead of INSERT ... VALUES pages
+copy_threshold = int(os.getenv('DB_COPY_THRESHOLD', 1000))
+
+connection_pool = None
+pool_lock = threading.Lock()
+# psycopg2 pools raise instead of waiting when empty, so callers queue here
+pool_slots = threading.BoundedSemaphore(max_connections)
+
+
+def get_pool():
+    # One pool per process, shared by every worker thread
+    global connection_pool
+    with pool_lock:
+        if connection_pool is None:
+            params = config()
+            print('Connecting to the PostgreSQL database...')
+            connection_pool = pool.ThreadedConnectionPool(1, max_connections, **params)
+    return connection_pool
+
+
+def close_pool():
+    global connection_pool
+    if storage.is_embedded():
+        storage.close_embedded_connection()
+        return
+    with pool_lock:
+        if connection_pool is not None:
+            connection_pool.closeall()
+            connection_pool = None
+            print('Database connection closed.')
+
+
+@contextmanager
+def transaction():
+    # Borrow a pooled connection and commit everything done with it at once
+    if storage.is_embedded():
+        with storage.embedded_transaction() as connection:
+            yield connection
+        return
+    with pool_slots:
+        db_pool = get_pool()
+        connection = db_pool.getconn()
+        try:
+            yield connection
+            with metrics.timer('db_commit_seconds', {'backend': 'postgresql'}):
+                connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            db_pool.putconn(connection)
+
+
+# Function to run a callback inside a single transaction; errors are printed and raised
+def connect(callback):
+    try:
+        with transaction() as connection:
+            callback(connection)
+    except(Exception, psycopg2.DatabaseError) as error:
+        print(error)
+        raise
+
+
+# Function to insert rows into a table; the caller's transaction commits them.
+# With returning, the listed columns of the rows actually inserted are returned.
+def insert_data_batch(connection, table_name, data_list, conflict_columns=None, returning=None):
+    if not data_list:
+        return []
+    if storage.is_embedded():
+        return embedded_data_batch(connection, table_name, data_list, conflict_columns, returning)
+    if len(data_list) >= copy_threshold:
+        return copy_data_batch(connection, table_name, data_list, conflict_columns, returning)
+    return values_data_batch(connection, table_name, data_list, conflict_columns, returning)
+
+
+# Function to insert rows a page per statement instead of one round-trip per row
+def values_data_batch(connection, table_name, data_list, conflict_columns=None, returning=None):
+    if not data_list:
+        return []
+    cursor = connection.cursor()
+    columns = ', '.join(data_list[0].keys())
+    if conflict_columns:
+        conflict_columns_str = ', '.join(conflict_columns)
+        sql = f"INSERT INTO {table_name} ({columns}) VALUES %s ON CONFLICT ({conflict_columns_str}) DO NOTHING"
+    else:
+        sql = f"INSERT INTO {table_name} ({columns}) VALUES %s"
+    if returning:
+        sql += f" RETURNING {', '.join(returning)}"
+    inserted = execute_values(cursor, sql, [list(data.values()) for data in data_list], page_size=1000, fetch=bool(returning))
+    cursor.close()
+    return inserted or []
+
+
+# Function to insert rows into DuckDB or SQLite with the same conflict semantics
+def embedded_data_batch(connection, table_name, data_list, conflict_columns=None, returning=None):
+    if not data_list:
+        return []
+    keys = list(data_list[0].keys())
+    conflict_clause = f"ON CONFLICT ({', '.join(conflict_columns)}) DO NOTHING" if conflict_columns else ''
+    if not returning:
+        connection.insert_rows(table_name, keys, [[data[key] for key in keys] for data in data_list], conflict_clause)
+        return []
+    # Rows come back one statement at a time, which costs nothing in-process
+    cursor = connection.cursor()
+    sql = f"INSERT INTO {table_name} ({', '.join(keys)}) VALUES ({', '.join(['%s'] * len(keys))}) {conflict_clause} RETURNING {', '.join(returning)}"
+    inserted = []
+    for data in data_list:
+        cursor.execute(sql, [data[key] for key in keys])
+        inserted.extend(tuple(row) for row in cursor.fetchall())
+    cursor.close()
+    return inserted
+
+
+def copy_value(value):
+    # Render a value in COPY text format
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        text = 't' if value else 'f'
+    elif isinstance(value, (list, tuple)):
+        items = ['NULL' if item is None else '"' + str(item).replace('\\', '\\\\').replace('"', '\\"') + '"' for item in value]
+        text = '{' + ','.join(items) + '}'
+    elif isinstance(value, datetime):
+        text = value.isoformat(sep=' ')
+    else:
+        text = str(value)
+    return text.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+# Function to bulk load rows: COPY into a staging table, then merge with the table's conflict semantics
+def copy_data_batch(connection, table_name, data_list, conflict_columns=None, returning=None):
+    if not data_list:
+        return []
+    keys = list(data_list[0].keys())
+    columns = ', '.join(keys)
+    staging_table = f"staging_{table_name.lower()}"
+    cursor = connection.cursor()
+    cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS {staging_table} (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS")
+    cursor.execute(f"TRUNCATE {staging_table}")
+
+    buffer = io.StringIO()
+    for data in data_list:
+        buffer.write('\t'.join(copy_value(data[key]) for key in keys))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {staging_table} ({columns}) FROM STDIN", buffer)
+
+    if conflict_columns:
+        conflict_columns_str = ', '.join(conflict_columns)
+        sql = f"INSERT INTO {table_name} ({columns}) SELECT {columns} FROM {staging_table} ON CONFLICT ({conflict_columns_str}) DO NOTHING"
+    else:
+        sql = f"INSERT INTO {table_name} ({columns}) SELECT {columns} FROM {staging_table}"
+    if returning:
+        sql += f" RETURNING {', '.join(returning)}"
+    cursor.execute(sql)
+    inserted = cursor.fetchall() if returning else []
+    cursor.close()
+    return inserted
+
+
+# Function to insert rows, or apply updates (a SET clause) to existing rows with the same key
+def upsert_data_batch(connection, table_name, data_list, key_columns, updates, where=None):
+    if not data_list:
+        return
+    # A stable key order keeps concurrent writers from deadlocking on each other's rows
+    data_list = sorted(data_list, key=lambda data: tuple(str(data[column]) for column in key_columns))
+    keys = list(data_list[0].keys())
+    conflict_clause = f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {updates}"
+    if where:
+        conflict_clause += f" WHERE {where}"
+    rows = [[data[key] for key in keys] for data in data_list]
+    if storage.is_embedded():
+        connection.insert_rows(table_name, keys, rows, conflict_clause)
+        return
+    cursor = connection.cursor()
+    execute_values(cursor, f"INSERT INTO {table_name} ({', '.join(keys)}) VALUES %s {conflict_clause}", rows, page_size=1000)
+    cursor.close()
+
+
+# Function to add rows' count columns onto existing rows with the same key
+def increment_data_batch(connection, table_name, data_list, key_columns, count_columns):
+    updates = ', '.join(f"{column} = {table_name}.{column} + excluded.{column}" for column in count_columns)
+    upsert_data_batch(connection, table_name, data_list, key_columns, updates)
+
+
+# Function to write all rows of one match in one transaction
+def write_match(match_rows):
+    write_matches([match_rows])
+
+
+# Function to write several matches in one transaction, one batch per table
+def write_matches(match_rows_list):
+    name_dictionary.encode_match_rows(match_rows_list)
+    with transaction() as connection:
+        new_participants = set()
+        for table_name in MATCH_TABLES:
+            data_list = [row for match_rows in match_rows_list for row in match_rows[table_name]]
+            metrics.inc('db_rows_total', {'table': table_name}, len(data_list))
+            if table_name == 'Participants':
+                new_participants = set(insert_data_batch(connection, table_name, data_list, CONFLICT_COLUMNS[table_name], returning=['puuid', 'match_id']))
+            else:
+                insert_data_batch(connection, table_name, data_list, CONFLICT_COLUMNS[table_name])
+
+        # Keep the daily rollups in step with the rows written in this same transaction
+        for table_name, rollup_rows in rollups.compute_rollups(match_rows_list, new_participants).items():
+            key_columns, count_columns = rollups.ROLLUP_TABLES[table_name]
+            increment_data_batch(connection, table_name, rollup_rows, key_columns, count_columns)
+
+        # Player names for the ladder, taken from each player's newest match
+        ladder.update_players(connection, match_rows_list)
+
+
+# Function to create any missing tables and indexes
+def create_tables():
+    with transaction() as connection:
+        cursor = connection.cursor()
+        for statement in SCHEMA_STATEMENTS:
+            cursor.execute(statement)
+        rollups.check_complete(cursor)
+        cursor.close()
+
+
+# Function to get the newest stored match for each player
+def get_watermarks(puuids):
+    with transaction() as connection:
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT puuid, last_game_datetime, last_match_id FROM player_watermarks WHERE puuid = ANY(%s)",
+            (list(puuids),)
+        )
+        watermarks = {puuid: (last_game_datetime, last_match_id) for puuid, last_game_datetime, last_match_id in cursor.fetchall()}
+        cursor.close()
+    return watermarks
+
+
+# Function to advance each player's watermark to their newest stored match
+def update_watermarks(puuids):
+    if not puuids:
+        return
+    with transaction() as connection:
+        cursor = connection.cursor()
+        cursor.execute('''
+            INSERT INTO player_watermarks (puuid, last_game_datetime, last_match_id, updated_at)
+            SELECT puuid, game_datetime, match_id, now()
+            FROM (
+                SELECT p.puuid, m.game_datetime, m.match_id,
+                    row_number() OVER (PARTITION BY p.puuid ORDER BY m.game_datetime DESC) AS match_rank
+                FROM Participants p
+                JOIN Matches m ON m.match_id = p.match_id
+                WHERE p.puuid = ANY(%s)
+            ) newest
+            WHERE match_rank = 1
+            ON CONFLICT (puuid) DO UPDATE SET
+                last_game_datetime = excluded.last_game_datetime,
+                last_match_id = excluded.last_match_id,
+                updated_at = excluded.updated_at
+            WHERE excluded.last_game_datetime > player_watermarks.last_game_datetime
+        ''', (list(puuids),))
+        cursor.close()
+
+
+# Function to record a finished ingest; the dashboard reloads its data when this changes
+def record_ingest_run(source, rows_written):
+    with transaction() as connection:
+        insert_data_batch(connection, 'ingest_runs', [{'source': source, 'rows_written': rows_written}])
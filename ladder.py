@@ -0,0 +1,262 @@
+import pandas as pd
+from dashboard_queries import in_list, run_query
+
+# Challenger ladder as a time series: one row per player per snapshot, plus the
+# current ladder kept up to date at write time so the leaderboard is a plain read.
+LADDER_COLUMNS = ['leaguepoints', 'rank', 'wins', 'losses', 'veteran', 'inactive', 'freshblood', 'hotstreak']
+
+SCHEMA_STATEMENTS = [
+    '''
+    CREATE TABLE IF NOT EXISTS ladder_snapshots (
+        puuid TEXT NOT NULL,
+        snapshot_at TIMESTAMP NOT NULL,
+        snapshot_day DATE NOT NULL,
+        region TEXT DEFAULT 'na1',
+        leaguepoints INTEGER,
+        rank TEXT,
+        wins INTEGER,
+        losses INTEGER,
+        veteran BOOLEAN,
+        inactive BOOLEAN,
+        freshblood BOOLEAN,
+        hotstreak BOOLEAN,
+        PRIMARY KEY (puuid, snapshot_at)
+    )
+    ''',
+    # Day buckets for range scans across the whole ladder; the primary key serves per-player lookups
+    'CREATE INDEX IF NOT EXISTS ladder_snapshots_day_idx ON ladder_snapshots (snapshot_day, puuid)',
+    # Each current ladder player's newest snapshot
+    '''
+    CREATE TABLE IF NOT EXISTS ladder_latest (
+        puuid TEXT PRIMARY KEY,
+        snapshot_at TIMESTAMP NOT NULL,
+        region TEXT DEFAULT 'na1',
+        leaguepoints INTEGER,
+        rank TEXT,
+        wins INTEGER,
+        losses INTEGER,
+        veteran BOOLEAN,
+        inactive BOOLEAN,
+        freshblood BOOLEAN,
+        hotstreak BOOLEAN
+    )
+    ''',
+    # One name per player, so the ladder never has to join through Participants
+    '''
+    CREATE TABLE IF NOT EXISTS players (
+        puuid TEXT PRIMARY KEY,
+        riotidgamename TEXT,
+        riotidtagline TEXT,
+        last_game_datetime TIMESTAMP NOT NULL
+    )
+    ''',
+    # Platform region of each entry; ladders stored before regions were tracked are all na1
+    "ALTER TABLE ladder_snapshots ADD COLUMN IF NOT EXISTS region TEXT DEFAULT 'na1'",
+    "ALTER TABLE ladder_latest ADD COLUMN IF NOT EXISTS region TEXT DEFAULT 'na1'",
+]
+
+LATEST_UPDATES = ', '.join(f"{column} = excluded.{column}" for column in ['snapshot_at', 'region'] + LADDER_COLUMNS)
+PLAYER_UPDATES = 'riotidgamename = excluded.riotidgamename, riotidtagline = excluded.riotidtagline, last_game_datetime = excluded.last_game_datetime'
+
+# Move full ladder copies from challenger_league into the time series and fill players from Participants
+MIGRATION_STATEMENTS = [
+    f'''
+    INSERT INTO ladder_snapshots (puuid, snapshot_at, snapshot_day, {', '.join(LADDER_COLUMNS)})
+    SELECT puuid, date, date::date, {', '.join(LADDER_COLUMNS)}
+    FROM challenger_league
+    WHERE true
+    ON CONFLICT (puuid, snapshot_at) DO NOTHING
+    ''',
+    f'''
+    INSERT INTO ladder_latest (puuid, snapshot_at, {', '.join(LADDER_COLUMNS)})
+    SELECT puuid, date, {', '.join(LADDER_COLUMNS)}
+    FROM challenger_league
+    WHERE date = (SELECT max(date) FROM challenger_league)
+    ON CONFLICT (puuid) DO UPDATE SET {LATEST_UPDATES}
+    WHERE excluded.snapshot_at >= ladder_latest.snapshot_at
+    ''',
+    f'''
+    INSERT INTO players (puuid, riotidgamename, riotidtagline, last_game_datetime)
+    SELECT puuid, riotidgamename, riotidtagline, game_datetime
+    FROM (
+        SELECT p.puuid, p.riotidgamename, p.riotidtagline, m.game_datetime,
+            row_number() OVER (PARTITION BY p.puuid ORDER BY m.game_datetime DESC) AS name_rank
+        FROM Participants p
+        JOIN Matches m ON m.match_id = p.match_id
+    ) newest
+    WHERE name_rank = 1
+    ON CONFLICT (puuid) DO UPDATE SET {PLAYER_UPDATES}
+    WHERE excluded.last_game_datetime >= players.last_game_datetime
+    ''',
+]
+
+
+def entry_fields(entry):
+    # League entries use camelCase keys (leaguePoints, hotStreak, ...)
+    fields = {key.lower(): value for key, value in entry.items()}
+    return {column: fields.get(column) for column in ['puuid'] + LADDER_COLUMNS}
+
+
+def snapshot_rows(entries, snapshot_at, region):
+    rows = []
+    for entry in entries:
+        fields = entry_fields(entry)
+        row = {'puuid': fields['puuid'], 'snapshot_at': snapshot_at, 'snapshot_day': snapshot_at.date(), 'region': region}
+        row.update({column: fields[column] for column in LADDER_COLUMNS})
+        rows.append(row)
+    return rows
+
+
+# Function to write one region's ladder entries taken at snapshot_at; the caller's transaction commits them.
+# ladder_puuids is everyone on that region's ladder at snapshot_at, so players who left it are dropped.
+def write_snapshot(connection, entries, snapshot_at, region, ladder_puuids=None):
+    import db
+    rows = snapshot_rows(entries, snapshot_at, region)
+    db.insert_data_batch(connection, 'ladder_snapshots', rows, ['puuid', 'snapshot_at'])
+    latest_rows = [{column: row[column] for column in ['puuid', 'snapshot_at', 'region'] + LADDER_COLUMNS} for row in rows]
+    db.upsert_data_batch(connection, 'ladder_latest', latest_rows, ['puuid'], LATEST_UPDATES, where='excluded.snapshot_at >= ladder_latest.snapshot_at')
+    if ladder_puuids:
+        cursor = connection.cursor()
+        cursor.execute('DELETE FROM ladder_latest WHERE region = %s AND NOT (puuid = ANY(%s))', (region, list(ladder_puuids)))
+        cursor.close()
+
+
+# Function to get a region's current ladder as {puuid: entry fields}
+def load_latest(region):
+    import db
+    with db.transaction() as connection:
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT puuid, {', '.join(LADDER_COLUMNS)} FROM ladder_latest WHERE region = %s", (region,))
+        latest = {row[0]: dict(zip(['puuid'] + LADDER_COLUMNS, row)) for row in cursor.fetchall()}
+        cursor.close()
+    return latest
+
+
+# Function to keep each player's name from their newest written match
+def update_players(connection, match_rows_list):
+    import db
+    newest = {}
+    for match_rows in match_rows_list:
+        game_datetime = match_rows['Matches'][0]['game_datetime']
+        for participant in match_rows['Participants']:
+            current = newest.get(participant['puuid'])
+            if current is None or game_datetime > current['last_game_datetime']:
+                newest[participant['puuid']] = {
+                    'puuid': participant['puuid'],
+                    'riotidgamename': participant['riotidgamename'],
+                    'riotidtagline': participant['riotidtagline'],
+                    'last_game_datetime': game_datetime,
+                }
+    db.upsert_data_batch(connection, 'players', list(newest.values()), ['puuid'], PLAYER_UPDATES, where='excluded.last_game_datetime >= players.last_game_datetime')
+
+
+def region_filter(region, params, alias='l'):
+    # Every region's ladder unless one is asked for
+    if region is None:
+        return 'true'
+    params['region'] = region
+    return f'{alias}.region = :region'
+
+
+def current_leaderboard(engine, limit=10, region=None, offset=0):
+    params = {}
+    limit_clause = ''
+    if limit is not None:
+        limit_clause = 'limit :limit offset :offset'
+        params.update({'limit': limit, 'offset': offset})
+    sql = f'''
+        select
+            l.puuid, l.region, coalesce(p.riotidgamename, l.puuid) as riotidgamename,
+            l.leaguepoints, l.rank, l.wins, l.losses,
+            l.veteran, l.inactive, l.freshblood, l.hotstreak, l.snapshot_at
+        from ladder_latest l
+        left join players p on p.puuid = l.puuid
+        where {region_filter(region, params)}
+        order by l.leaguepoints desc, l.region, l.puuid
+        {limit_clause};
+    '''
+    return run_query(engine, sql, params)
+
+
+def count_leaderboard(engine, region=None):
+    params = {}
+    sql = f'select count(*) as count from ladder_latest l where {region_filter(region, params)};'
+    return int(run_query(engine, sql, params)['count'].iloc[0])
+
+
+def lp_trajectory(engine, puuids, start_date=None, end_date=None):
+    # LP at the end of each day for the given players, from each day's last snapshot
+    if not len(puuids):
+        return pd.DataFrame(columns=['puuid', 'riotidgamename', 'date', 'leaguepoints'])
+    params = {}
+    conditions = [f"s.puuid in ({in_list('puuid', list(puuids), params)})"]
+    if start_date is not None:
+        conditions.append('s.snapshot_day >= :start_date')
+        params['start_date'] = pd.to_datetime(start_date).date()
+    if end_date is not None:
+        conditions.append('s.snapshot_day <= :end_date')
+        params['end_date'] = pd.to_datetime(end_date).date()
+    sql = f'''
+        select t.puuid, coalesce(p.riotidgamename, t.puuid) as riotidgamename, t.snapshot_day as date, t.leaguepoints
+        from (
+            select s.puuid, s.snapshot_day, s.leaguepoints,
+                row_number() over (partition by s.puuid, s.snapshot_day order by s.snapshot_at desc) as day_rank
+            from ladder_snapshots s
+            where {' and '.join(conditions)}
+        ) t
+        left join players p on p.puuid = t.puuid
+        where t.day_rank = 1
+        order by t.puuid, t.snapshot_day;
+    '''
+    return run_query(engine, sql, params)
+
+
+def biggest_movers(engine, since, limit=10, region=None):
+    # LP change of current ladder players since a point in time. The baseline is the last
+    # snapshot at or before since, or the first one after it for players who joined later.
+    params = {'since': pd.to_datetime(since).to_pydatetime(), 'limit': limit}
+    sql = f'''
+        select
+            l.puuid, l.region, coalesce(p.riotidgamename, l.puuid) as riotidgamename, l.leaguepoints,
+            l.leaguepoints - b.leaguepoints as lp_change,
+            (l.wins + l.losses) - (b.wins + b.losses) as games
+        from ladder_latest l
+        join (
+            select puuid, leaguepoints, wins, losses
+            from (
+                select s.puuid, s.leaguepoints, s.wins, s.losses,
+                    row_number() over (
+                        partition by s.puuid
+                        order by
+                            case when s.snapshot_at <= :since then 0 else 1 end,
+                            case when s.snapshot_at <= :since then s.snapshot_at end desc,
+                            s.snapshot_at
+                    ) as baseline_rank
+                from ladder_snapshots s
+                where s.puuid in (select puuid from ladder_latest)
+            ) ranked
+            where baseline_rank = 1
+        ) b on b.puuid = l.puuid
+        left join players p on p.puuid = l.puuid
+        where {region_filter(region, params)}
+        order by abs(l.leaguepoints - b.leaguepoints) desc
+        limit :limit;
+    '''
+    return run_query(engine, sql, params)
+
+
+# Function to migrate challenger_league copies and existing player names
+def migrate():
+    import db
+    db.create_tables()
+    with db.transaction() as connection:
+        cursor = connection.cursor()
+        for statement in MIGRATION_STATEMENTS:
+            cursor.execute(statement)
+        cursor.close()
+    db.close_pool()
+
+
+if __name__ == '__main__':
+    migrate()
+    print('Ladder history migrated.')
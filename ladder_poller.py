@@ -0,0 +1,157 @@
+import argparse
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+import db
+import ladder
+import metrics
+from match_archive import MatchArchive
+from pipeline import STOP, ingest_players
+from response_cache import ResponseCache
+from riot_client import RiotClient, parse_regions
+
+# Fields whose change makes a ladder entry worth writing
+CHANGE_COLUMNS = ['leaguepoints', 'wins', 'losses', 'hotstreak', 'inactive']
+
+poll_seconds = int(os.getenv('LADDER_POLL_SECONDS', 300))
+
+
+class LadderPoller:
+    # Polls the challenger ladder, writes only the entries that changed since the last poll,
+    # and hands players who finished games to a background ingest thread
+    def __init__(self, client, region, interval=None, ingest=True, archive=None, workers=16):
+        self.client = client
+        self.region = region
+        self.interval = interval or poll_seconds
+        self.ingest = ingest
+        self.archive = archive
+        self.workers = workers
+        self.ingest_queue = queue.Queue()
+        self.stopped = threading.Event()
+        # Starts from the stored ladder, so a restart does not rewrite every entry
+        self.previous = ladder.load_latest(region)
+        self.ladder_puuids = set(self.previous)
+
+    def diff(self, entries):
+        # Entries that changed, and the players among them with more games than before
+        changed = []
+        played = []
+        for entry in entries:
+            fields = ladder.entry_fields(entry)
+            previous = self.previous.get(fields['puuid'])
+            if previous is None:
+                changed.append(entry)
+                played.append(fields['puuid'])
+                continue
+            if any(fields[column] != previous[column] for column in CHANGE_COLUMNS):
+                changed.append(entry)
+            if fields['wins'] + fields['losses'] > previous['wins'] + previous['losses']:
+                played.append(fields['puuid'])
+        return changed, played
+
+    def poll_once(self):
+        entries = self.client.challenger_league(self.region)['entries']
+        snapshot_at = datetime.now()
+        changed, played = self.diff(entries)
+        ladder_puuids = [entry['puuid'] for entry in entries]
+
+        if changed or set(ladder_puuids) != self.ladder_puuids:
+            with db.transaction() as connection:
+                ladder.write_snapshot(connection, changed, snapshot_at, self.region, ladder_puuids=ladder_puuids)
+            db.record_ingest_run('ladder', len(changed))
+
+        # Only remember the poll once it is stored, so a failed write is retried next poll
+        self.previous = {fields['puuid']: fields for fields in map(ladder.entry_fields, entries)}
+        self.ladder_puuids = set(ladder_puuids)
+        print(f"{snapshot_at:%Y-%m-%d %H:%M:%S} {self.region} ladder: {len(entries)} entries, {len(changed)} changed, {len(played)} played")  # Debugging statement
+
+        if self.ingest:
+            for puuid in played:
+                self.ingest_queue.put(puuid)
+
+    def _ingest(self):
+        while True:
+            puuid = self.ingest_queue.get()
+            if puuid is STOP:
+                return
+            # Take everyone queued so far, so one ingest covers a whole poll's players
+            puuids = {puuid}
+            stop = False
+            while True:
+                try:
+                    puuid = self.ingest_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if puuid is STOP:
+                    stop = True
+                    break
+                puuids.add(puuid)
+            try:
+                ingest_players(self.client, self.region, sorted(puuids), set(self.ladder_puuids), archive=self.archive, workers=self.workers)
+            except Exception as e:
+                print(f"An error occurred: {e}")
+            if stop:
+                return
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        ingester = threading.Thread(target=self._ingest, daemon=True)
+        ingester.start()
+        try:
+            while not self.stopped.is_set():
+                started = time.monotonic()
+                try:
+                    self.poll_once()
+                except Exception as e:
+                    print(f"An error occurred: {e}")
+                self.stopped.wait(max(self.interval - (time.monotonic() - started), 0))
+        finally:
+            # Let the queued players finish ingesting before exiting
+            self.ingest_queue.put(STOP)
+            ingester.join()
+
+
+# Function to poll every region's ladder side by side until interrupted
+def run_pollers(pollers):
+    threads = [threading.Thread(target=poller.run, daemon=True) for poller in pollers]
+    for thread in threads:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1)
+    except KeyboardInterrupt:
+        print('Stopping the ladder poller...')
+        for poller in pollers:
+            poller.stop()
+        for thread in threads:
+            thread.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Poll the challenger ladder and ingest matches of players who played')
+    parser.add_argument('--regions', default=os.getenv('RIOT_REGIONS', 'na1'), help='Comma-separated platform regions, e.g. na1,euw1,kr (RIOT_REGIONS)')
+    parser.add_argument('--interval', type=int, default=poll_seconds, help='Seconds between polls (LADDER_POLL_SECONDS)')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('TFTPAL_WORKERS', 16)), help='Requests in flight during ingestion')
+    parser.add_argument('--no-ingest', action='store_true', help='Only record the ladder')
+    args = parser.parse_args()
+    regions = parse_regions(args.regions)
+
+    # Load environment variables from .env file
+    load_dotenv()
+    api_key = os.getenv('RIOT_API_KEY')
+    if not api_key:
+        raise ValueError("API key must be set in the .env file")
+
+    db.create_tables()
+    metrics.start_exporters()
+    match_archive = MatchArchive()
+    client = RiotClient(api_key, cache=ResponseCache())
+    run_pollers([LadderPoller(client, region, args.interval, ingest=not args.no_ingest, archive=match_archive, workers=args.workers) for region in regions])
+    match_archive.close()
+    db.close_pool()
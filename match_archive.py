@@ -0,0 +1,216 @@
+import argparse
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Raw match bodies are appended to gzipped newline-delimited JSON segments, with an
+# index file mapping each match id to the segment holding it and the tracked puuids archived with it.
+# Each process writes its own segments (the pid is in the name), so the poller and tftpal.py can share a directory.
+archive_dir = os.getenv('MATCH_ARCHIVE_DIR', 'match_archive')
+segment_bytes = int(os.getenv('MATCH_ARCHIVE_SEGMENT_MB', 256)) * 1024 * 1024
+INDEX_FILE = 'index.tsv'
+
+
+def segment_name(number, pid):
+    return f"segment-{number:06d}-{pid}.jsonl.gz"
+
+
+def list_segments(directory):
+    return sorted(name for name in os.listdir(directory) if name.startswith('segment-') and name.endswith('.jsonl.gz'))
+
+
+# Function to read index.tsv into {match_id: set of archived tracked puuids}.
+# A match id can have several lines when later records add newly tracked players;
+# lines written before the puuid column existed count as no puuids.
+def read_index(directory):
+    index = {}
+    index_path = os.path.join(directory, INDEX_FILE)
+    if os.path.exists(index_path):
+        with open(index_path, encoding='utf-8') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    continue
+                fields = line.rstrip('\n').split('\t')
+                puuids = index.setdefault(fields[0], set())
+                if len(fields) > 2 and fields[2]:
+                    puuids.update(fields[2].split(','))
+    return index
+
+
+class MatchArchive:
+    def __init__(self, directory=None, max_segment_bytes=None):
+        self.directory = directory or archive_dir
+        self.max_segment_bytes = max_segment_bytes or segment_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.index = read_index(self.directory)
+        # Each index line goes out in a single append-mode write, so lines from two processes never interleave
+        self.index_file = open(os.path.join(self.directory, INDEX_FILE), 'a', encoding='utf-8')
+
+        # Always start a fresh segment so earlier ones are never reopened for writing
+        segments = list_segments(self.directory)
+        self.segment_number = max(int(name[8:14]) for name in segments) + 1 if segments else 1
+        self.segment = None
+
+    def _open_segment(self):
+        self.segment_path = os.path.join(self.directory, segment_name(self.segment_number, os.getpid()))
+        self.segment = gzip.open(self.segment_path, 'at', encoding='utf-8')
+
+    def __contains__(self, match_id):
+        return match_id in self.index
+
+    def append(self, match, tracked_puuids):
+        match_id = match['metadata']['match_id']
+        # Only the match's own tracked players, which is all construct_data_groups needs on replay
+        match_puuids = [participant['puuid'] for participant in match['info']['participants'] if participant['puuid'] in tracked_puuids]
+        with self.lock:
+            archived_puuids = self.index.get(match_id)
+            if archived_puuids is not None:
+                # Already archived; keep a supplementary record only for players tracked since then
+                match_puuids = [puuid for puuid in match_puuids if puuid not in archived_puuids]
+                if not match_puuids:
+                    return
+            record = json.dumps({'match_id': match_id, 'tracked_puuids': match_puuids, 'match': match})
+            if self.segment is None:
+                self._open_segment()
+            self.segment.write(record + '\n')
+            # Sync-flush so a crash loses at most the record being written
+            self.segment.flush()
+            self.index.setdefault(match_id, set()).update(match_puuids)
+            self.index_file.write(f"{match_id}\t{os.path.basename(self.segment_path)}\t{','.join(match_puuids)}\n")
+            self.index_file.flush()
+            if os.path.getsize(self.segment_path) >= self.max_segment_bytes:
+                self.segment.close()
+                self.segment = None
+                self.segment_number += 1
+
+    def close(self):
+        with self.lock:
+            if self.segment is not None:
+                self.segment.close()
+                self.segment = None
+            self.index_file.close()
+
+
+def read_segment(path):
+    # Yield archived records; a segment cut short by a crash ends at its last complete record
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                if line.endswith('\n'):
+                    yield json.loads(line)
+        except (EOFError, zlib.error):
+            return
+
+
+def replay_segment(path, batch_size):
+    # Imported here so reading an archive never needs a database configured
+    import db
+    from match_transform import construct_data_groups
+
+    batch = []
+    replayed = 0
+    for record in read_segment(path):
+        batch.append(construct_data_groups(record['match'], set(record['tracked_puuids'])))
+        if len(batch) >= batch_size:
+            db.write_matches(batch)
+            replayed += len(batch)
+            batch = []
+    if batch:
+        db.write_matches(batch)
+        replayed += len(batch)
+    db.close_pool()
+    return replayed
+
+
+# Function to empty the match tables so a replay re-flattens every archived match;
+# without it, matches already stored are skipped by write_matches' ON CONFLICT DO NOTHING
+def truncate_match_tables():
+    import db
+    from match_transform import MATCH_TABLES
+    with db.transaction() as connection:
+        cursor = connection.cursor()
+        cursor.execute('TRUNCATE ' + ', '.join(MATCH_TABLES))
+        cursor.close()
+
+
+# Function to count stored matches and participants the archive cannot restore
+def count_unarchived(index):
+    import db
+    with db.transaction() as connection:
+        cursor = connection.cursor()
+        cursor.execute('SELECT match_id FROM Matches')
+        missing_matches = sum(1 for (match_id,) in cursor.fetchall() if match_id not in index)
+        # Old index lines carry no puuids, so only check matches whose archived players are known
+        cursor.execute('SELECT match_id, puuid FROM Participants')
+        missing_participants = sum(1 for match_id, puuid in cursor.fetchall() if index.get(match_id) and puuid not in index[match_id])
+        cursor.close()
+    return missing_matches, missing_participants
+
+
+# Function to load the match tables from the archive, one worker process per segment.
+# rebuild=True first empties them and afterwards recomputes the rollups from what was replayed;
+# it refuses to run while the tables hold matches the archive lacks, unless force=True.
+def replay(directory=None, workers=None, batch_size=200, rebuild=False, force=False):
+    directory = directory or archive_dir
+    start_time = time.time()
+    segments = [os.path.join(directory, name) for name in list_segments(directory)]
+    print(f"Replaying {len(segments)} segments from {directory}")  # Debugging statement
+
+    import db
+    import rollups
+    db.create_tables()
+    if rebuild:
+        missing_matches, missing_participants = count_unarchived(read_index(directory))
+        if (missing_matches or missing_participants) and not force:
+            print(f"Not rebuilding: {missing_matches} stored matches and {missing_participants} stored participants "
+                  f"are not in the archive and would be lost. Re-run with --force to rebuild anyway.")
+            db.close_pool()
+            return 0
+        truncate_match_tables()
+    db.close_pool()
+
+    # DuckDB and SQLite files take one writer at a time, so replay their segments in turn
+    if db.storage.is_embedded():
+        workers = 1
+
+    replayed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(replay_segment, path, batch_size): path for path in segments}
+        for future in as_completed(futures):
+            try:
+                count = future.result()
+                replayed += count
+                print(f"{os.path.basename(futures[future])}: {count} matches")
+            except Exception as e:
+                print(f"An error occurred replaying {futures[future]}: {e}")
+
+    if rebuild:
+        rollups.rebuild_rollups()
+    # Moves the dashboard's cache marker so it stops serving pre-replay results
+    db.record_ingest_run('replay', replayed)
+    db.close_pool()
+
+    elapsed_time = time.time() - start_time
+    print(f"Replayed {replayed} matches in {elapsed_time:.2f} seconds")
+    return replayed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Raw match archive tools')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    replay_parser = subparsers.add_parser('replay', help='Load archived matches into Matches/Participants/Units/Traits/unit_items')
+    replay_parser.add_argument('--archive', default=archive_dir, help='Archive directory')
+    replay_parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    replay_parser.add_argument('--batch-size', type=int, default=200, help='Matches written per transaction')
+    replay_parser.add_argument('--rebuild', action='store_true', help='Empty the match tables first so stored matches are re-flattened, then recompute the rollups')
+    replay_parser.add_argument('--force', action='store_true', help='Rebuild even if stored matches are missing from the archive (they are lost)')
+    args = parser.parse_args()
+
+    if args.command == 'replay':
+        replay(args.archive, args.workers, args.batch_size, args.rebuild, args.force)
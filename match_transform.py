@@ -0,0 +1,90 @@
+from collections import defaultdict
+from datetime import datetime
+
+# Tables a match is flattened into, parents before children
+MATCH_TABLES = ['Matches', 'Participants', 'Units', 'unit_items', 'Traits']
+
+
+# Function to flatten a raw match body into rows for each table, keeping only tracked players
+def construct_data_groups(match, tracked_puuids):
+    match_rows = {table_name: [] for table_name in MATCH_TABLES}
+    match_rows['Matches'].append({
+        'match_id': match['metadata']['match_id'],
+        'game_version': match['info']['game_version'],
+        'game_datetime': datetime.fromtimestamp(match['info']['game_datetime'] / 1000.0),
+        'queue_id': match['info']['queue_id'],
+        'endofgameresult': match['info']['endOfGameResult'],
+        'game_length': match['info']['game_length'],
+        'tft_game_type': match['info']['tft_game_type'],
+        'tft_set_core_name': match['info']['tft_set_core_name'],
+        'tft_set_number': match['info']['tft_set_number'],
+        # Match ids start with their platform, e.g. NA1_5012345678
+        'region': match['metadata']['match_id'].split('_')[0].lower()
+    })
+
+    for participant in match['info']['participants']:
+        if participant['puuid'] in tracked_puuids:
+            partner_group_id = participant.get('partner_group_id', None)
+            match_rows['Participants'].append({
+                'puuid': participant['puuid'],
+                'match_id': match['metadata']['match_id'],
+                'placement': participant['placement'],
+                'level': participant['level'],
+                'total_damage_to_players': participant['total_damage_to_players'],
+                'riotidgamename': participant['riotIdGameName'],
+                'riotidtagline': participant['riotIdTagline'],
+                'partner_group_id': partner_group_id,
+                'gold_left': participant['gold_left'],
+                'last_round': participant['last_round'],
+                'players_eliminated': participant['players_eliminated'],
+                'time_eliminated': participant['time_eliminated'],
+                'win': participant['win']
+            })
+
+            # Collect units data for batch insert
+            character_counts = defaultdict(int)
+            for unit in participant['units']:
+                character_counts[unit['character_id']] += 1
+
+            character_indices = defaultdict(int)
+            for unit in participant['units']:
+                character_id = unit['character_id']
+                if character_counts[character_id] > 1:
+                    character_indices[character_id] += 1
+                    unit['unit_index'] = character_indices[character_id]
+                else:
+                    unit['unit_index'] = 0
+
+                match_rows['Units'].append({
+                    'character_id': unit['character_id'],
+                    'puuid': participant['puuid'],
+                    'unit_name': unit['name'],
+                    'tier': unit['tier'],
+                    'match_id': match['metadata']['match_id'],
+                    'itemnames': unit['itemNames'],
+                    'unit_index': unit['unit_index']
+                })
+
+                # One row per equipped item, so item queries never need to unnest itemnames
+                for slot, item in enumerate(unit['itemNames'], start=1):
+                    match_rows['unit_items'].append({
+                        'match_id': match['metadata']['match_id'],
+                        'puuid': participant['puuid'],
+                        'character_id': unit['character_id'],
+                        'unit_index': unit['unit_index'],
+                        'slot': slot,
+                        'item': item
+                    })
+
+            # Collect traits data for batch insert
+            for trait in participant['traits']:
+                match_rows['Traits'].append({
+                    'puuid': participant['puuid'],
+                    'trait_name': trait['name'],
+                    'tier_current': trait['tier_current'],
+                    'tier_total': trait['tier_total'],
+                    'match_id': match['metadata']['match_id'],
+                    'num_units': trait['num_units']
+                })
+
+    return match_rows
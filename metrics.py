@@ -0,0 +1,270 @@
+import bisect
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# In-process counters, histograms and gauges for the ingestion scripts. They can be
+# scraped as Prometheus text (METRICS_PORT), appended to a JSON log every
+# METRICS_LOG_SECONDS (METRICS_LOG), and are summarized at the end of a run.
+metrics_port = os.getenv('METRICS_PORT')
+metrics_log = os.getenv('METRICS_LOG')
+metrics_log_seconds = float(os.getenv('METRICS_LOG_SECONDS', 30))
+
+# cProfile output for construct_data_groups, e.g. TRANSFORM_PROFILE=transform.prof
+transform_profile = os.getenv('TRANSFORM_PROFILE')
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+HELP = {
+    'riot_requests_total': 'Riot API responses by method and status',
+    'riot_request_seconds': 'Riot API request latency',
+    'riot_rate_limited_total': 'Riot API 429 responses by limit type',
+    'riot_backoff_seconds_total': 'Seconds spent backing off after 429 and 5xx responses',
+    'riot_limiter_wait_seconds_total': 'Seconds spent waiting for a local rate limit token',
+    'response_cache_lookups_total': 'Response cache lookups by endpoint class and result',
+    'db_rows_total': 'Rows handed to the database per table',
+    'db_commit_seconds': 'Database commit latency',
+    'pipeline_stage_seconds': 'Time per call of each ingest pipeline stage (a write is one batch of matches)',
+    'pipeline_queue_depth': 'Items waiting between ingest pipeline stages',
+    'work_item_failures_total': 'Failed sweep work items, by whether they will be retried or were dead-lettered',
+}
+
+
+def label_key(labels):
+    return tuple(sorted((labels or {}).items()))
+
+
+def render_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in pairs) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    def inc(self, name, labels=None, value=1):
+        key = label_key(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, labels=None, buckets=LATENCY_BUCKETS):
+        key = label_key(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    def gauge(self, name, labels, callback):
+        # The callback is read whenever metrics are exported; pass None to remove it
+        key = label_key(labels)
+        with self.lock:
+            series = self.gauges.setdefault(name, {})
+            if callback is None:
+                series.pop(key, None)
+            else:
+                series[key] = callback
+
+    def snapshot(self):
+        with self.lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {name: {key: (list(h.buckets), list(h.counts), h.count, h.sum) for key, h in series.items()} for name, series in self.histograms.items()}
+            gauges = {name: dict(series) for name, series in self.gauges.items()}
+        gauge_values = {}
+        for name, series in gauges.items():
+            for key, callback in series.items():
+                try:
+                    gauge_values.setdefault(name, {})[key] = callback()
+                except Exception:
+                    continue
+        return counters, histograms, gauge_values
+
+    def prometheus_text(self):
+        counters, histograms, gauges = self.snapshot()
+        lines = []
+        for name, series in sorted(counters.items()):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{render_labels(key)} {value}")
+        for name, series in sorted(histograms.items()):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, (buckets, counts, count, total) in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(buckets + ['+Inf'], counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{render_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{render_labels(key)} {total}")
+                lines.append(f"{name}_count{render_labels(key)} {count}")
+        for name, series in sorted(gauges.items()):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{render_labels(key)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def json_snapshot(self):
+        counters, histograms, gauges = self.snapshot()
+
+        def rows(series, value):
+            return [dict(key, value=value(item)) for key, item in sorted(series.items())]
+
+        return {
+            'time': time.time(),
+            'counters': {name: rows(series, lambda item: item) for name, series in counters.items()},
+            'histograms': {name: rows(series, lambda item: {'count': item[2], 'sum': round(item[3], 6)}) for name, series in histograms.items()},
+            'gauges': {name: rows(series, lambda item: item) for name, series in gauges.items()},
+        }
+
+    def totals(self, name):
+        # {label value tuple: (count, seconds)} of a histogram, for summaries
+        _, histograms, _ = self.snapshot()
+        return {key: (count, total) for key, (_, _, count, total) in histograms.get(name, {}).items()}
+
+
+registry = Registry()
+
+
+def inc(name, labels=None, value=1):
+    registry.inc(name, labels, value)
+
+
+def observe(name, value, labels=None):
+    registry.observe(name, value, labels)
+
+
+def gauge(name, labels, callback):
+    registry.gauge(name, labels, callback)
+
+
+@contextmanager
+def timer(name, labels=None):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.perf_counter() - started, labels)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = registry.prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would drown out the ingest output
+        pass
+
+
+def start_http_server(port):
+    server = ThreadingHTTPServer(('', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving metrics on http://localhost:{port}/metrics")  # Debugging statement
+    return server
+
+
+def start_json_log(path, interval):
+    def write_forever():
+        while True:
+            time.sleep(interval)
+            write_json(path)
+
+    threading.Thread(target=write_forever, daemon=True).start()
+
+
+def write_json(path):
+    try:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(registry.json_snapshot(), default=str) + '\n')
+    except OSError as e:
+        print(f"An error occurred: {e}")
+
+
+# Function to start whichever exporters METRICS_PORT and METRICS_LOG ask for
+def start_exporters():
+    if metrics_port:
+        start_http_server(int(metrics_port))
+    if metrics_log:
+        start_json_log(metrics_log, metrics_log_seconds)
+
+
+# Function to print where a run spent its time, to tell an API-bound sweep from a DB- or CPU-bound one
+def report():
+    if metrics_log:
+        write_json(metrics_log)
+    transform_profiler.dump()
+    counters, _, _ = registry.snapshot()
+    for name in ('riot_request_seconds', 'db_commit_seconds', 'pipeline_stage_seconds'):
+        for key, (count, total) in sorted(registry.totals(name).items()):
+            print(f"{name} [{describe(key)}]: {count} in {total:.2f}s ({total / count * 1000 if count else 0:.1f} ms each)")
+    for name in ('riot_rate_limited_total', 'riot_backoff_seconds_total', 'riot_limiter_wait_seconds_total', 'response_cache_lookups_total', 'db_rows_total', 'work_item_failures_total'):
+        for key, value in sorted(counters.get(name, {}).items()):
+            print(f"{name} [{describe(key)}]: {round(value, 2)}")
+
+
+def describe(key):
+    return ', '.join(f"{label}={label_value}" for label, label_value in key)
+
+
+class Profiler:
+    # cProfile that is switched on only around the calls it wraps, so a profile of one
+    # stage is not diluted by the threads waiting on the API. Enabled by TRANSFORM_PROFILE;
+    # py-spy needs no hook and can attach to a running ingest instead.
+    def __init__(self, path):
+        self.path = path
+        self.profile = cProfile.Profile() if path else None
+        # One profiled call at a time, since a profile can only be enabled in one thread
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def section(self):
+        if self.profile is None:
+            yield
+            return
+        with self.lock:
+            self.profile.enable()
+            try:
+                yield
+            finally:
+                self.profile.disable()
+
+    def dump(self):
+        if self.profile is not None:
+            self.profile.dump_stats(self.path)
+            print(f"Wrote profile to {self.path} (python -m pstats {self.path})")  # Debugging statement
+
+
+transform_profiler = Profiler(transform_profile)
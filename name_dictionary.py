@@ -0,0 +1,165 @@
+import re
+import threading
+import pandas as pd
+
+# Raw API ids (TFT13_Jinx, TFT_Item_InfinityEdge, ...) mapped to small integer codes
+# and display names. Units and Traits keep their raw id columns as the stored keys (the
+# rollups, unit_items and the Parquet export group by them); Units.character_code and
+# Traits.trait_code sit alongside them for analytics.py, item codes are kept once per
+# item in unit_items.item_code, and the dashboard turns raw ids into categoricals of
+# display names with to_display.
+
+SCHEMA_STATEMENTS = [
+    '''
+    CREATE TABLE IF NOT EXISTS tft_names (
+        code SMALLSERIAL PRIMARY KEY,
+        kind TEXT NOT NULL,
+        raw_id TEXT NOT NULL,
+        set_number INTEGER,
+        display_name TEXT NOT NULL,
+        UNIQUE (kind, raw_id)
+    )
+    ''',
+    'ALTER TABLE Units ADD COLUMN IF NOT EXISTS character_code SMALLINT',
+    # Item codes live in unit_items.item_code only; earlier versions also kept them on Units
+    'ALTER TABLE Units DROP COLUMN IF EXISTS item_codes',
+    'ALTER TABLE Traits ADD COLUMN IF NOT EXISTS trait_code SMALLINT',
+]
+
+# Prefixes the API puts in front of ids, e.g. TFT13_, TFT_Item_, TFT13_Item_
+ID_PREFIX = re.compile(r'^TFT\d*_(Item_)?', re.IGNORECASE)
+
+# Set whose rules apply to ids that carry no set number, like TFT_Item_ ids
+CURRENT_SET = 13
+
+# Per-set renames from the internal name to the one shown in game
+ALIAS_RULES = {
+    13: {
+        'Warband': 'Conqueror',
+        'Cabal': 'Black Rose',
+        'Frozenheart': 'Protectorsvow',
+    },
+}
+
+
+def set_number_of(raw_id):
+    match = re.match(r'^TFT(\d+)_', raw_id, re.IGNORECASE)
+    return int(match.group(1)) if match else None
+
+
+def display_name(raw_id, set_number=None):
+    # Strip the prefix and capitalize the first letter, then apply the set's renames
+    name = ID_PREFIX.sub('', raw_id).capitalize()
+    return ALIAS_RULES.get(set_number or CURRENT_SET, {}).get(name, name)
+
+
+codes = {}
+codes_lock = threading.Lock()
+
+
+# Function to get the code of every (kind, raw_id), creating codes for ids not seen before
+def get_codes(keys):
+    import db
+    with codes_lock:
+        missing = sorted(set(keys) - codes.keys())
+    if missing:
+        # Codes are committed on their own so a failed match write never leaves a cached code behind
+        new_codes = {}
+        with db.transaction() as connection:
+            cursor = connection.cursor()
+            for kind, raw_id in missing:
+                set_number = set_number_of(raw_id)
+                # Insert-then-select also picks up a code another writer has just created
+                cursor.execute(
+                    '''
+                    INSERT INTO tft_names (kind, raw_id, set_number, display_name)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (kind, raw_id) DO NOTHING
+                    ''',
+                    (kind, raw_id, set_number, display_name(raw_id, set_number))
+                )
+                cursor.execute('SELECT code FROM tft_names WHERE kind = %s AND raw_id = %s', (kind, raw_id))
+                new_codes[(kind, raw_id)] = cursor.fetchone()[0]
+            cursor.close()
+        with codes_lock:
+            codes.update(new_codes)
+    with codes_lock:
+        return {key: codes[key] for key in keys}
+
+
+# Function to add code columns to flattened match rows before they are written
+def encode_match_rows(match_rows_list):
+    keys = set()
+    for match_rows in match_rows_list:
+        for unit in match_rows['Units']:
+            keys.add(('unit', unit['character_id']))
+            keys.update(('item', item) for item in unit['itemnames'])
+        for trait in match_rows['Traits']:
+            keys.add(('trait', trait['trait_name']))
+    if not keys:
+        return
+    key_codes = get_codes(keys)
+    for match_rows in match_rows_list:
+        for unit in match_rows['Units']:
+            unit['character_code'] = key_codes[('unit', unit['character_id'])]
+        for unit_item in match_rows['unit_items']:
+            unit_item['item_code'] = key_codes[('item', unit_item['item'])]
+        for trait in match_rows['Traits']:
+            trait['trait_code'] = key_codes[('trait', trait['trait_name'])]
+
+
+def load_names(engine):
+    from dashboard_queries import run_query
+    return run_query(engine, 'select code, kind, raw_id, display_name from tft_names;', {})
+
+
+def to_display(raw_ids, names, kind):
+    # Map raw ids to a categorical of display names; ids missing from the dictionary
+    # (rows written before it existed) fall back to the same naming rules
+    lookup = dict(zip(names.loc[names['kind'] == kind, 'raw_id'], names.loc[names['kind'] == kind, 'display_name']))
+    for raw_id in set(raw_ids) - lookup.keys():
+        lookup[raw_id] = display_name(raw_id, set_number_of(raw_id))
+    return pd.Categorical(raw_ids.map(lookup))
+
+
+# Statements that assign codes to rows written before the dictionary existed
+# (PostgreSQL only; DuckDB and SQLite databases are created with the dictionary)
+BACKFILL_STATEMENTS = [
+    '''
+    UPDATE Units u SET character_code = n.code
+    FROM tft_names n
+    WHERE n.kind = 'unit' AND n.raw_id = u.character_id AND u.character_code IS NULL
+    ''',
+    '''
+    UPDATE Traits t SET trait_code = n.code
+    FROM tft_names n
+    WHERE n.kind = 'trait' AND n.raw_id = t.trait_name AND t.trait_code IS NULL
+    ''',
+]
+
+
+# Function to build the dictionary from existing rows and fill in their codes
+def backfill():
+    import db
+    db.create_tables()
+    with db.transaction() as connection:
+        cursor = connection.cursor()
+        cursor.execute('''
+            SELECT DISTINCT 'unit', character_id FROM Units
+            UNION SELECT DISTINCT 'item', unnest(itemnames) FROM Units
+            UNION SELECT DISTINCT 'trait', trait_name FROM Traits
+        ''')
+        keys = cursor.fetchall()
+        cursor.close()
+    get_codes(keys)
+    with db.transaction() as connection:
+        cursor = connection.cursor()
+        for statement in BACKFILL_STATEMENTS:
+            cursor.execute(statement)
+        cursor.close()
+    db.close_pool()
+
+
+if __name__ == '__main__':
+    backfill()
+    print('Name dictionary backfilled.')
@@ -0,0 +1,172 @@
+import os
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from storage import DuckDBSource
+
+# Columnar snapshot of the match tables, partitioned by set number and game date
+# (parquet/<table>/tft_set_number=13/game_date=2025-01-31/part-*.parquet)
+parquet_dir = os.getenv('PARQUET_DIR', 'parquet')
+PARTITION_COLUMNS = ['tft_set_number', 'game_date']
+
+EXPORT_QUERIES = {
+    'matches': '''
+        select m.*, m.game_datetime::date as game_date
+        from matches m
+    ''',
+    'participants': '''
+        select p.*, m.game_datetime, m.tft_set_number, m.game_datetime::date as game_date
+        from participants p
+        join matches m on m.match_id = p.match_id
+    ''',
+    'units': '''
+        select u.*, m.game_datetime, m.tft_set_number, m.game_datetime::date as game_date
+        from units u
+        join matches m on m.match_id = u.match_id
+    ''',
+    'traits': '''
+        select t.*, m.game_datetime, m.tft_set_number, m.game_datetime::date as game_date
+        from traits t
+        join matches m on m.match_id = t.match_id
+    ''',
+    'unit_items': '''
+        select ui.*, m.game_datetime, m.tft_set_number, m.game_datetime::date as game_date
+        from unit_items ui
+        join matches m on m.match_id = ui.match_id
+    ''',
+}
+
+
+engine = None
+
+
+def read_frame(sql, params):
+    # PostgreSQL is read through SQLAlchemy, since pandas only supports raw DB-API connections
+    # for sqlite3; DuckDB and SQLite through the writers' connection, which holds their file
+    # and converts their array and timestamp columns
+    global engine
+    import db
+    import storage
+    if storage.is_embedded():
+        with db.transaction() as connection:
+            cursor = connection.cursor()
+            cursor.execute(sql, params)
+            frame = pd.DataFrame(cursor.fetchall(), columns=[column[0] for column in cursor.description])
+            cursor.close()
+        return frame
+    if engine is None:
+        engine = storage.dashboard_engine()
+    with engine.connect() as connection:
+        return pd.read_sql_query(sql, connection, params=tuple(params))
+
+
+def get_partitions(match_ids=None):
+    # (set number, game date) of the given matches, or of every match
+    sql = 'SELECT DISTINCT tft_set_number, game_datetime::date AS game_date FROM Matches'
+    params = []
+    if match_ids is not None:
+        sql += ' WHERE match_id = ANY(%s)'
+        params.append(list(match_ids))
+    frame = read_frame(sql, params)
+    return sorted({(int(set_number), str(pd.to_datetime(game_date).date())) for set_number, game_date in frame.itertuples(index=False)})
+
+
+def partition_path(directory, table_name, set_number, game_date):
+    return os.path.join(directory, table_name, f"tft_set_number={set_number}", f"game_date={game_date}")
+
+
+def write_partition(frame, directory, table_name):
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    ds.write_dataset(
+        table,
+        os.path.join(directory, table_name),
+        format='parquet',
+        partitioning=PARTITION_COLUMNS,
+        partitioning_flavor='hive',
+        basename_template='part-{i}.parquet',
+        existing_data_behavior='overwrite_or_ignore',
+    )
+
+
+# Function to export matches to Parquet. With match_ids only the partitions holding them
+# are rewritten, each from all of its rows in the database, so a partition stays one file
+# per table however many ingest runs added to it; without, every partition is rewritten.
+def export_matches(match_ids=None, directory=None):
+    directory = directory or parquet_dir
+    if match_ids is not None and not match_ids:
+        return
+    partitions = get_partitions(match_ids)
+
+    # Partitions are built in a staging directory and then swapped in one at a time
+    staging_dir = os.path.join(directory, f".staging-{uuid.uuid4().hex[:12]}")
+    try:
+        for table_name, sql in EXPORT_QUERIES.items():
+            rows = 0
+            for set_number, game_date in partitions:
+                day = datetime.strptime(game_date, '%Y-%m-%d')
+                frame = read_frame(
+                    sql + ' where m.tft_set_number = %s and m.game_datetime >= %s and m.game_datetime < %s',
+                    [set_number, day, day + timedelta(days=1)]
+                )
+                if len(frame):
+                    # Keep the string form hive partitions are written with
+                    frame['game_date'] = game_date
+                    write_partition(frame, staging_dir, table_name)
+                    rows += len(frame)
+
+            if match_ids is None and os.path.exists(os.path.join(directory, table_name)):
+                shutil.rmtree(os.path.join(directory, table_name))
+            for set_number, game_date in partitions:
+                live_path = partition_path(directory, table_name, set_number, game_date)
+                staged_path = partition_path(staging_dir, table_name, set_number, game_date)
+                if os.path.exists(live_path):
+                    shutil.rmtree(live_path)
+                if os.path.exists(staged_path):
+                    os.makedirs(os.path.dirname(live_path), exist_ok=True)
+                    os.replace(staged_path, live_path)
+            print(f"Exported {rows} {table_name} rows in {len(partitions)} partitions to {directory}")  # Debugging statement
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def partition_filter(start_date=None, end_date=None, puuid=None, has_puuid=True):
+    # Filters on the partition columns prune whole directories; puuid uses row-group statistics
+    conditions = []
+    if start_date is not None:
+        conditions.append(f"game_date >= '{pd.to_datetime(start_date).date()}'")
+    if end_date is not None:
+        conditions.append(f"game_date <= '{pd.to_datetime(end_date).date()}'")
+    if puuid is not None and has_puuid:
+        conditions.append("puuid = '{}'".format(puuid.replace("'", "''")))
+    return ' where ' + ' and '.join(conditions) if conditions else ''
+
+
+class ParquetSource(DuckDBSource):
+    # In-memory DuckDB over the snapshot, usable wherever dashboard_queries takes an engine.
+    # The table views are pre-filtered to the date range and player, so the dashboard's
+    # queries run unchanged while DuckDB prunes partitions and reads only the columns they use.
+    def __init__(self, directory=None, start_date=None, end_date=None, puuid=None):
+        super().__init__()
+        directory = directory or parquet_dir
+        self.memory = duckdb.connect()
+        self.lock = threading.Lock()
+        for table_name in EXPORT_QUERIES:
+            path = os.path.join(directory, table_name, '**', '*.parquet').replace("'", "''")
+            where = partition_filter(start_date, end_date, puuid, has_puuid=table_name != 'matches')
+            self.memory.execute(f"create view {table_name} as select * from read_parquet('{path}', hive_partitioning = true){where}")
+
+    @contextmanager
+    def connection(self):
+        # A DuckDB connection is not safe to share across Streamlit's script threads
+        with self.lock:
+            yield self.memory
+
+
+if __name__ == '__main__':
+    export_matches()
@@ -0,0 +1,358 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import db
+import metrics
+from match_transform import construct_data_groups
+
+# Marks the end of a stage's input
+STOP = object()
+
+# Match-id page size used when catching a player up from their watermark
+MATCH_ID_PAGE_SIZE = 100
+
+# The Parquet snapshot is only kept up to date for a dashboard that reads it
+export_parquet = os.getenv('DASHBOARD_SOURCE', 'database') == 'parquet'
+
+
+class IngestPipeline:
+    # Fetch -> transform -> write stages joined by bounded queues, so each stage runs at
+    # its own pace and a slow stage holds the others back instead of piling up matches
+    def __init__(self, client, region, tracked_puuids, archive=None, fetch_workers=16,
+                 queue_size=64, batch_matches=50, flush_seconds=5.0, on_written=None):
+        self.client = client
+        self.region = region
+        self.tracked_puuids = tracked_puuids
+        self.archive = archive
+        self.fetch_workers = fetch_workers
+        self.batch_matches = batch_matches
+        self.flush_seconds = flush_seconds
+        # Called with the match ids of each batch once it is committed, e.g. to checkpoint a sweep
+        self.on_written = on_written
+        self.match_id_queue = queue.Queue(maxsize=queue_size)
+        self.match_queue = queue.Queue(maxsize=queue_size)
+        self.rows_queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.failed_match_ids = set()
+        self.written_match_ids = set()
+        # The last error of each failed match id
+        self.errors = {}
+
+    def _fail(self, match_ids, error):
+        print(f"An error occurred: {error}")
+        with self.lock:
+            self.failed_match_ids.update(match_ids)
+            self.errors.update((match_id, error) for match_id in match_ids)
+
+    def _fetch(self):
+        while True:
+            match_id = self.match_id_queue.get()
+            if match_id is STOP:
+                return
+            try:
+                with metrics.timer('pipeline_stage_seconds', {'stage': 'fetch', 'region': self.region}):
+                    match = self.client.match_by_id(self.region, match_id)
+                if self.archive is not None:
+                    self.archive.append(match, self.tracked_puuids)
+                # The id travels with the body, so a failure is reported even for a malformed body
+                self.match_queue.put((match_id, match))
+            except Exception as e:
+                self._fail([match_id], e)
+
+    def _transform(self):
+        # STOP is always handed on, so the writer (and run()) never waits on a dead transformer
+        try:
+            while True:
+                item = self.match_queue.get()
+                if item is STOP:
+                    return
+                match_id, match = item
+                try:
+                    # TRANSFORM_PROFILE profiles just this call (see metrics.py)
+                    with metrics.timer('pipeline_stage_seconds', {'stage': 'transform', 'region': self.region}), metrics.transform_profiler.section():
+                        match_rows = construct_data_groups(match, self.tracked_puuids)
+                    self.rows_queue.put(match_rows)
+                except Exception as e:
+                    self._fail([match_id], e)
+        finally:
+            self.rows_queue.put(STOP)
+
+    def _write_batch(self, batch):
+        with metrics.timer('pipeline_stage_seconds', {'stage': 'write', 'region': self.region}):
+            db.write_matches(batch)
+        return [match_rows['Matches'][0]['match_id'] for match_rows in batch]
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        try:
+            match_ids = self._write_batch(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                self._fail([batch[0]['Matches'][0]['match_id']], e)
+                return
+            # The batch was rolled back as a whole, so write its matches one at a time and
+            # fail only the ones that still raise, rather than every match in the batch
+            print(f"An error occurred: {e}")
+            match_ids = []
+            for match_rows in batch:
+                try:
+                    match_ids += self._write_batch([match_rows])
+                except Exception as match_error:
+                    self._fail([match_rows['Matches'][0]['match_id']], match_error)
+            if not match_ids:
+                return
+        with self.lock:
+            self.written_match_ids.update(match_ids)
+        if self.on_written is not None:
+            try:
+                self.on_written(match_ids)
+            except Exception as e:
+                # The matches are stored either way; a resumed sweep finds them in Matches
+                print(f"An error occurred: {e}")
+
+    def _write(self):
+        # Flush once a batch is big enough or its oldest match has waited flush_seconds
+        batch = []
+        batch_started = None
+        while True:
+            timeout = None
+            if batch:
+                timeout = max(batch_started + self.flush_seconds - time.monotonic(), 0)
+            try:
+                match_rows = self.rows_queue.get(timeout=timeout)
+            except queue.Empty:
+                self._flush(batch)
+                batch = []
+                continue
+            if match_rows is STOP:
+                self._flush(batch)
+                return
+            if not batch:
+                batch_started = time.monotonic()
+            batch.append(match_rows)
+            if len(batch) >= self.batch_matches:
+                self._flush(batch)
+                batch = []
+
+    def queue_depths(self):
+        return {
+            'match_ids': self.match_id_queue.qsize(),
+            'matches': self.match_queue.qsize(),
+            'rows': self.rows_queue.qsize(),
+        }
+
+    # Function to push match ids through every stage; returns the ids that failed
+    def run(self, match_ids):
+        depth_queues = {'match_ids': self.match_id_queue, 'matches': self.match_queue, 'rows': self.rows_queue}
+        for stage, stage_queue in depth_queues.items():
+            metrics.gauge('pipeline_queue_depth', {'queue': stage, 'region': self.region}, stage_queue.qsize)
+        fetchers = [threading.Thread(target=self._fetch, daemon=True) for _ in range(self.fetch_workers)]
+        transformer = threading.Thread(target=self._transform, daemon=True)
+        writer = threading.Thread(target=self._write, daemon=True)
+        for thread in fetchers + [transformer, writer]:
+            thread.start()
+
+        # Blocks whenever the fetchers fall behind, so ids are handed out as they are needed
+        for match_id in match_ids:
+            self.match_id_queue.put(match_id)
+        for _ in fetchers:
+            self.match_id_queue.put(STOP)
+
+        for thread in fetchers:
+            thread.join()
+        self.match_queue.put(STOP)
+        transformer.join()
+        writer.join()
+        for stage in depth_queues:
+            metrics.gauge('pipeline_queue_depth', {'queue': stage, 'region': self.region}, None)
+        return self.failed_match_ids
+
+
+def fetch_match_ids(client, region, puuid, watermark):
+    # Only ask for matches newer than the player's watermark, paging until we have them all
+    if watermark is None:
+        return client.match_ids_by_puuid(region, puuid)
+    last_game_datetime, last_match_id = watermark
+    start_time = int(last_game_datetime.timestamp())
+    matches_ids = []
+    while True:
+        page = client.match_ids_by_puuid(region, puuid, count=MATCH_ID_PAGE_SIZE, start=len(matches_ids), start_time=start_time)
+        matches_ids.extend(page)
+        if len(page) < MATCH_ID_PAGE_SIZE:
+            break
+    return [match_id for match_id in matches_ids if match_id != last_match_id]
+
+
+def try_fetch_match_ids(client, region, puuid, watermark):
+    # None when the player's match ids could not be fetched
+    try:
+        return fetch_match_ids(client, region, puuid, watermark)
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return None
+
+
+def get_stored_participants(player_match_ids):
+    # (puuid, match_id) pairs of {puuid: [match ids]} that already have a Participants row.
+    # A match stored through other players still needs rows for a player new to the ladder.
+    pairs = {(puuid, match_id) for puuid, matches_ids in player_match_ids.items() for match_id in matches_ids}
+    if not pairs:
+        return set()
+    stored = set()
+
+    def select_participants(connection):
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT puuid, match_id FROM Participants WHERE match_id = ANY(%s) AND puuid = ANY(%s)",
+            (sorted({match_id for _, match_id in pairs}), sorted(player_match_ids))
+        )
+        stored.update(pair for pair in cursor.fetchall() if tuple(pair) in pairs)
+        cursor.close()
+
+    db.connect(select_participants)
+    return {tuple(pair) for pair in stored}
+
+
+def missing_match_ids(player_match_ids):
+    # Match ids with at least one listing player whose Participants row is not stored yet;
+    # refetching them is cheap since their bodies are in the response cache
+    stored_pairs = get_stored_participants(player_match_ids)
+    return {match_id for puuid, matches_ids in player_match_ids.items() for match_id in matches_ids if (puuid, match_id) not in stored_pairs}
+
+
+# Function to store every match the players finished since their watermarks.
+# Returns the pipeline, whose written_match_ids and failed_match_ids describe the run.
+def ingest_players(client, region, puuids, tracked_puuids, archive=None, workers=16):
+    watermarks = db.get_watermarks(puuids)
+
+    # Fetch every player's match-id list concurrently; the client keeps us within Riot's limits
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Challenger players share lobbies, so build one frontier of ids across every player first
+        match_id_frontier = set()
+        player_match_ids = {}
+        for puuid, matches_ids in zip(puuids, executor.map(lambda puuid: try_fetch_match_ids(client, region, puuid, watermarks.get(puuid)), puuids)):
+            if matches_ids is not None:
+                player_match_ids[puuid] = matches_ids
+                match_id_frontier.update(matches_ids)
+    listed_match_ids = len(match_id_frontier)
+    match_id_frontier = missing_match_ids(player_match_ids)
+    print(f"{region}: matches to fetch: {len(match_id_frontier)} ({listed_match_ids - len(match_id_frontier)} already stored)")  # Debugging statement
+
+    # Each remaining match is fetched once and streamed through fetch -> transform -> write stages
+    pipeline = IngestPipeline(client, region, tracked_puuids, archive=archive, fetch_workers=workers)
+    failed_match_ids = pipeline.run(match_id_frontier)
+    print(f"{region}: matches written: {len(pipeline.written_match_ids)} ({len(failed_match_ids)} failed)")  # Debugging statement
+
+    # A watermark only moves once every match newer than it is stored, so failures are retried next run
+    complete_puuids = [puuid for puuid, matches_ids in player_match_ids.items() if not failed_match_ids.intersection(matches_ids)]
+    db.update_watermarks(complete_puuids)
+
+    finish_ingest(pipeline.written_match_ids)
+    return pipeline
+
+
+def finish_ingest(written_match_ids):
+    # Rewrite the Parquet partitions of the new matches before the ingest run is recorded,
+    # so a dashboard reading Parquet never sees a marker newer than its files
+    if export_parquet:
+        try:
+            import parquet_export
+            parquet_export.export_matches(written_match_ids)
+        except Exception as e:
+            print(f"An error occurred: {e}")
+
+    db.record_ingest_run('matches', len(written_match_ids))
+
+
+# Players whose match ids are listed (and checkpointed) per chunk during a sweep
+SWEEP_PLAYER_CHUNK = 100
+
+
+# Function to run one region of a checkpointed sweep (see work_queue.py). Players and match
+# ids are work items: each one is marked done as soon as it is stored, failures are retried
+# with exponential backoff until they are dead-lettered, and a resumed sweep only works on
+# what is still pending. Returns the set of match ids written by this call.
+def sweep_region(client, region, sweep, archive=None, workers=16):
+    # The ladder is read once per sweep, so a resumed sweep finishes the players it started with
+    tracked_puuids = set(sweep.item_ids('puuid', region))
+    if not tracked_puuids:
+        tracked_puuids = {entry['puuid'] for entry in client.challenger_league(region)['entries']}
+        sweep.enqueue('puuid', region, sorted(tracked_puuids))
+    print(f"{region}: {len(tracked_puuids)} challenger players")  # Debugging statement
+
+    written_match_ids = set()
+    while True:
+        due_puuids = sweep.due('puuid', region)
+        for start in range(0, len(due_puuids), SWEEP_PLAYER_CHUNK):
+            chunk = due_puuids[start:start + SWEEP_PLAYER_CHUNK]
+            watermarks = db.get_watermarks(chunk)
+            player_match_ids, errors = {}, {}
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {puuid: executor.submit(fetch_match_ids, client, region, puuid, watermarks.get(puuid)) for puuid in chunk}
+                for puuid, future in futures.items():
+                    try:
+                        player_match_ids[puuid] = future.result()
+                    except Exception as e:
+                        print(f"An error occurred: {e}")
+                        errors[puuid] = e
+            # Match ids go in before their players are marked done, so a crash in between only repeats the listing
+            sweep.enqueue('match', region, [match_id for matches_ids in player_match_ids.values() for match_id in matches_ids])
+            sweep.mark_done('puuid', region, player_match_ids, match_ids=player_match_ids)
+            sweep.mark_failed('puuid', region, errors)
+
+        due_match_ids = set(sweep.due('match', region))
+        listed_by = sweep.listing_puuids(region)
+        match_id_frontier = missing_match_ids({puuid: [match_id for match_id in matches_ids if match_id in due_match_ids] for puuid, matches_ids in listed_by.items()})
+        # Ids no done player listed (a crash between queueing and marking) are fetched to be safe
+        match_id_frontier |= due_match_ids - {match_id for matches_ids in listed_by.values() for match_id in matches_ids}
+        stored_match_ids = due_match_ids - match_id_frontier
+        sweep.mark_done('match', region, stored_match_ids)
+        print(f"{region}: matches to fetch: {len(match_id_frontier)} ({len(stored_match_ids)} already stored)")  # Debugging statement
+
+        pipeline = IngestPipeline(client, region, tracked_puuids, archive=archive, fetch_workers=workers,
+                                  on_written=lambda match_ids: sweep.mark_done('match', region, match_ids))
+        failed_match_ids = pipeline.run(match_id_frontier)
+        sweep.mark_failed('match', region, {match_id: pipeline.errors.get(match_id, 'failed') for match_id in failed_match_ids})
+        written_match_ids |= pipeline.written_match_ids
+        print(f"{region}: matches written: {len(pipeline.written_match_ids)} ({len(failed_match_ids)} failed)")  # Debugging statement
+
+        # Wait out the backoff of whatever failed, until every item is done or dead-lettered
+        next_attempt_at = sweep.next_attempt_at(region)
+        if next_attempt_at is None:
+            break
+        wait = max((next_attempt_at - datetime.now()).total_seconds(), 0)
+        print(f"{region}: retrying failed items in {wait:.0f}s")  # Debugging statement
+        time.sleep(wait)
+
+    # A watermark only moves once every match the player listed is stored
+    db.update_watermarks(sweep.complete_puuids(region))
+    return written_match_ids
+
+
+# Function to store new matches of every challenger player in several regions at once.
+# Riot limits each routing value separately and RiotClient keeps separate buckets per host,
+# so regions on different clusters never wait on each other. Returns {region: pipeline}, or
+# {region: written match ids} when the run is a checkpointed sweep.
+def ingest_regions(client, regions, archive=None, workers=16, sweep=None):
+    def ingest_region(region):
+        if sweep is not None:
+            written_match_ids = sweep_region(client, region, sweep, archive=archive, workers=workers)
+            finish_ingest(written_match_ids)
+            return written_match_ids
+        puuids = [entry['puuid'] for entry in client.challenger_league(region)['entries']]
+        print(f"{region}: {len(puuids)} challenger players")  # Debugging statement
+        return ingest_players(client, region, puuids, set(puuids), archive=archive, workers=workers)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(len(regions), 1)) as executor:
+        futures = {region: executor.submit(ingest_region, region) for region in regions}
+        for region, future in futures.items():
+            try:
+                results[region] = future.result()
+            except Exception as e:
+                print(f"An error occurred in {region}: {e}")
+    return results
@@ -1,6 +1,8 @@
-import requests
 from dotenv import load_dotenv
 import os
+import db
+import riot_accounts
+from riot_client import RiotClient
 
 # Load environment variables from .env file
 load_dotenv()
@@ -10,49 +12,30 @@ api_key = os.getenv('RIOT_API_KEY')
 print(f"Loaded API Key: {api_key}")  # Debugging statement
 if not api_key:
     raise ValueError("API key must be set in the .env file")
-region = 'americas'
+# Platform region; the account lookup goes to its routing value (americas for na1)
+region = 'na1'
 summoner_name = ''
 tagline = 'na1'
 
-# To get PUUID from Riot ID and tagline
-# Construct the URL for the endpoint
-url = f"https://{region}.api.riotgames.com/riot/account/v1/accounts/by-riot-id/{summoner_name}/{tagline}"
-
-# Set the headers with the API key
-headers = {
-    "X-Riot-Token": api_key
-}
-
-def get_puuid(region, summoner_name, tagline, api_key):
-    # Construct the URL for the endpoint
-    url = f"https://{region}.api.riotgames.com/riot/account/v1/accounts/by-riot-id/{summoner_name}/{tagline}"
-
-    # Set the headers with the API key
-    headers = {
-        "X-Riot-Token": api_key
-    }
-    puuid = None
-    try:
-        # Make the request to the endpoint
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-
-        # Parse the JSON response
-        account_info = response.json()
-        # Extract the puuid
-        puuid = account_info['puuid']
-        print(f"Summoner Name: {summoner_name}")
-        print(f"PUUID: {puuid}")
-    except requests.exceptions.HTTPError as err:
-        if err.response.status_code == 403:
-            print("Error: Forbidden. Check your API key and permissions.")
-        elif err.response.status_code == 429:
-            print("Error: Rate limit exceeded. Please wait and try again later.")
-        else:
-            print(f"Error: {err}")
-    except Exception as e:
-        print(f"An error occurred: {e}")
-    
+# One client for every lookup, so they share its connections and rate limits
+client = RiotClient(api_key)
+
+# The riot_accounts table is created before the first lookup
+tables_created = False
+
+# To get PUUID from Riot ID and tagline; for many Riot IDs at once use `python riot_accounts.py`
+def get_puuid(region, summoner_name, tagline, api_key=api_key):
+    global tables_created
+    if not tables_created:
+        db.create_tables()
+        tables_created = True
+
+    # Riot IDs resolved before come from the riot_accounts table without a request. A failed
+    # API request is printed by resolve_riot_ids and gives None; database errors are raised.
+    puuid = riot_accounts.resolve_riot_ids(client, [(summoner_name, tagline)], region)[(summoner_name, tagline)]
+    print(f"Summoner Name: {summoner_name}")
+    print(f"PUUID: {puuid}")
+
     return puuid
 
-#get_puuid(region, summoner_name, tagline, api_key)
\ No newline at end of file
+#get_puuid(region, summoner_name, tagline, api_key)
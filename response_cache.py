@@ -0,0 +1,111 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import metrics
+
+# How long responses of each endpoint class stay fresh, in seconds (None never expires)
+DEFAULT_TTLS = {
+    'match': None,              # match bodies never change once played
+    'match_ids': 60,            # a player's match list grows with every game
+    'league': 5 * 60,           # ladder snapshots
+    'summoner': 24 * 60 * 60,
+    'account': 3 * 24 * 60 * 60,
+}
+
+cache_dir = os.getenv('RIOT_CACHE_DIR', '.riot_cache')
+max_cache_bytes = int(os.getenv('RIOT_CACHE_MAX_MB', 2048)) * 1024 * 1024
+
+
+def cache_key(endpoint, params=None):
+    # Key on the endpoint and its parameters only, never on the API key
+    raw = json.dumps([endpoint, sorted((params or {}).items())], default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    # Gzipped JSON responses on disk, evicted least-recently-used once over max_bytes
+    def __init__(self, directory=None, max_bytes=None, ttls=None):
+        self.directory = directory or cache_dir
+        self.max_bytes = max_bytes or max_cache_bytes
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self.total_bytes = sum(os.path.getsize(path) for path in self._files())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.json.gz'):
+                    yield os.path.join(root, name)
+
+    def get(self, endpoint_class, endpoint, params=None):
+        path = self._path(cache_key(endpoint, params))
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self.lock:
+                self.misses += 1
+            metrics.inc('response_cache_lookups_total', {'class': endpoint_class, 'result': 'miss'})
+            return None
+
+        ttl = self.ttls.get(endpoint_class)
+        if ttl is not None and time.time() - entry['stored_at'] > ttl:
+            with self.lock:
+                self.misses += 1
+            metrics.inc('response_cache_lookups_total', {'class': endpoint_class, 'result': 'expired'})
+            return None
+
+        # Touch the file so eviction sees it as recently used
+        os.utime(path)
+        with self.lock:
+            self.hits += 1
+        metrics.inc('response_cache_lookups_total', {'class': endpoint_class, 'result': 'hit'})
+        return entry['body']
+
+    def put(self, endpoint_class, endpoint, body, params=None):
+        path = self._path(cache_key(endpoint, params))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+        # Write to a temporary file first so readers never see a partial entry
+        temporary_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(temporary_path, 'wt', encoding='utf-8') as f:
+            json.dump({'endpoint_class': endpoint_class, 'stored_at': time.time(), 'body': body}, f)
+        os.replace(temporary_path, path)
+
+        with self.lock:
+            self.total_bytes += os.path.getsize(path) - previous_size
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Drop the least recently used entries until we are back under 90% of the limit
+        entries = []
+        for path in self._files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        self.total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.total_bytes <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                self.total_bytes -= size
+            except OSError:
+                pass
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -0,0 +1,172 @@
+import argparse
+import csv
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import requests
+
+# Riot ID -> puuid lookups resolved so far. Riot IDs are case-insensitive, so rows are
+# keyed by the lowercased "gameName#tagLine" and keep the casing the API returned.
+SCHEMA_STATEMENTS = [
+    '''
+    CREATE TABLE IF NOT EXISTS riot_accounts (
+        riot_id_key TEXT PRIMARY KEY,
+        puuid TEXT NOT NULL,
+        game_name TEXT NOT NULL,
+        tag_line TEXT NOT NULL,
+        resolved_at TIMESTAMP NOT NULL
+    )
+    ''',
+]
+
+ACCOUNT_UPDATES = 'puuid = excluded.puuid, game_name = excluded.game_name, tag_line = excluded.tag_line, resolved_at = excluded.resolved_at'
+
+# Resolved accounts are written every this many lookups, so an interrupted run keeps its progress
+WRITE_BATCH_SIZE = 500
+
+
+def riot_id_key(game_name, tag_line):
+    return f"{game_name.strip().lower()}#{tag_line.strip().lower()}"
+
+
+def split_riot_id(riot_id):
+    # "gameName#tagLine"; game names may themselves contain spaces but never '#'
+    game_name, _, tag_line = riot_id.strip().rpartition('#')
+    if not game_name or not tag_line:
+        raise ValueError(f"Not a Riot ID: {riot_id}")
+    return game_name, tag_line
+
+
+# Function to get stored puuids as {riot_id_key: puuid}; entries older than max_age count as missing
+def get_stored_accounts(keys, max_age=None):
+    import db
+    if not keys:
+        return {}
+    sql = "SELECT riot_id_key, puuid FROM riot_accounts WHERE riot_id_key = ANY(%s)"
+    params = [list(keys)]
+    if max_age is not None:
+        sql += " AND resolved_at >= %s"
+        params.append(datetime.now() - max_age)
+    with db.transaction() as connection:
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        stored = dict(cursor.fetchall())
+        cursor.close()
+    return stored
+
+
+def store_accounts(accounts):
+    import db
+    if not accounts:
+        return
+    with db.transaction() as connection:
+        db.upsert_data_batch(connection, 'riot_accounts', accounts, ['riot_id_key'], ACCOUNT_UPDATES)
+
+
+def lookup_account(client, region, game_name, tag_line):
+    # None when no account has this Riot ID
+    try:
+        return client.account_by_riot_id(region, game_name, tag_line)
+    except requests.exceptions.HTTPError as err:
+        if err.response is not None and err.response.status_code == 404:
+            return None
+        raise
+
+
+# Function to resolve many (gameName, tagLine) pairs to puuids. Only Riot IDs missing from
+# riot_accounts (or older than max_age) are looked up, concurrently through the client's
+# pooled session and rate limiter. Returns {(gameName, tagLine): puuid or None}.
+def resolve_riot_ids(client, riot_ids, region='na1', workers=16, max_age=None):
+    riot_ids = list(dict.fromkeys(riot_ids))
+    keys = {riot_id: riot_id_key(*riot_id) for riot_id in riot_ids}
+    stored = get_stored_accounts(set(keys.values()), max_age)
+
+    # Two spellings of one Riot ID only need one lookup
+    misses = list({keys[riot_id]: riot_id for riot_id in riot_ids if keys[riot_id] not in stored}.values())
+    print(f"Riot IDs: {len(riot_ids)} ({sum(key in stored for key in keys.values())} already resolved, {len(misses)} to look up)")  # Debugging statement
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(misses), WRITE_BATCH_SIZE):
+            batch = misses[start:start + WRITE_BATCH_SIZE]
+            futures = [executor.submit(lookup_account, client, region, game_name, tag_line) for game_name, tag_line in batch]
+            resolved_at = datetime.now()
+            accounts = []
+            for (game_name, tag_line), future in zip(batch, futures):
+                try:
+                    account = future.result()
+                except Exception as e:
+                    print(f"An error occurred: {e}")
+                    failed += 1
+                    continue
+                if account is None:
+                    continue
+                stored[keys[(game_name, tag_line)]] = account['puuid']
+                accounts.append({
+                    'riot_id_key': keys[(game_name, tag_line)],
+                    'puuid': account['puuid'],
+                    'game_name': account.get('gameName') or game_name,
+                    'tag_line': account.get('tagLine') or tag_line,
+                    'resolved_at': resolved_at,
+                })
+            store_accounts(accounts)
+
+    resolved = {riot_id: stored.get(keys[riot_id]) for riot_id in riot_ids}
+    print(f"Resolved: {sum(puuid is not None for puuid in resolved.values())}, not found: {sum(puuid is None for puuid in resolved.values()) - failed}, failed: {failed}")  # Debugging statement
+    return resolved
+
+
+def read_riot_ids(file):
+    # One "gameName#tagLine" per line, or a CSV with gameName and tagLine columns
+    riot_ids = []
+    for row in csv.reader(file):
+        row = [value.strip() for value in row]
+        if not row or not row[0] or row[0].startswith('#'):
+            continue
+        if len(row) >= 2:
+            if row[:2] == ['gameName', 'tagLine']:
+                continue
+            riot_ids.append((row[0], row[1]))
+        else:
+            riot_ids.append(split_riot_id(row[0]))
+    return riot_ids
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Resolve Riot IDs to puuids, looking up only the ones not stored yet')
+    parser.add_argument('input', help='File with one gameName#tagLine per line, or a gameName,tagLine CSV ("-" for stdin)')
+    parser.add_argument('--output', default='puuids.csv', help='CSV of gameName,tagLine,puuid to write')
+    parser.add_argument('--region', default='na1', help='Platform region whose account routing to use')
+    parser.add_argument('--workers', type=int, default=16, help='Lookups in flight at once')
+    parser.add_argument('--max-age-days', type=int, default=None, help='Look up stored ids again once they are this old')
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from riot_client import RiotClient, parse_regions
+
+    # Load environment variables from .env file
+    load_dotenv()
+    api_key = os.getenv('RIOT_API_KEY')
+    if not api_key:
+        raise ValueError("API key must be set in the .env file")
+
+    if args.input == '-':
+        riot_ids = read_riot_ids(sys.stdin)
+    else:
+        with open(args.input, newline='', encoding='utf-8') as file:
+            riot_ids = read_riot_ids(file)
+
+    import db
+    db.create_tables()
+    client = RiotClient(api_key)
+    max_age = timedelta(days=args.max_age_days) if args.max_age_days is not None else None
+    resolved = resolve_riot_ids(client, riot_ids, parse_regions(args.region)[0], args.workers, max_age)
+    db.close_pool()
+
+    with open(args.output, 'w', newline='', encoding='utf-8') as output:
+        writer = csv.writer(output)
+        writer.writerow(['gameName', 'tagLine', 'puuid'])
+        for (game_name, tag_line), puuid in resolved.items():
+            writer.writerow([game_name, tag_line, puuid or ''])
+    print(f"Wrote {len(resolved)} Riot IDs to {args.output}")  # Debugging statement
@@ -0,0 +1,239 @@
+import os
+import threading
+import time
+from urllib.parse import quote
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
+
+# Platform regions and the routing value their match endpoints live under
+PLATFORM_ROUTING = {
+    'na1': 'americas',
+    'br1': 'americas',
+    'la1': 'americas',
+    'la2': 'americas',
+    'euw1': 'europe',
+    'eun1': 'europe',
+    'tr1': 'europe',
+    'ru': 'europe',
+    'me1': 'europe',
+    'kr': 'asia',
+    'jp1': 'asia',
+    'oc1': 'sea',
+    'ph2': 'sea',
+    'sg2': 'sea',
+    'th2': 'sea',
+    'tw2': 'sea',
+    'vn2': 'sea',
+}
+
+
+# Account lookups only live on these three routing values; SEA accounts are served from asia
+ACCOUNT_ROUTING = {'americas': 'americas', 'europe': 'europe', 'asia': 'asia', 'sea': 'asia'}
+
+
+# Function to turn a comma-separated list such as "na1,euw1,kr" into platform regions
+def parse_regions(value):
+    regions = [region.strip().lower() for region in value.split(',') if region.strip()]
+    unknown = [region for region in regions if region not in PLATFORM_ROUTING]
+    if unknown:
+        raise ValueError(f"Unknown platform regions: {', '.join(unknown)}")
+    return list(dict.fromkeys(regions))
+
+
+# Response cache class of each method, see response_cache.DEFAULT_TTLS. The ladder
+# (league.challenger) is left out so pollers and snapshots always see it live, and accounts
+# (account.by_riot_id) are kept in the riot_accounts table instead
+METHOD_CACHE_CLASSES = {
+    'summoner.by_puuid': 'summoner',
+    'match.by_puuid': 'match_ids',
+    'match.by_id': 'match',
+}
+
+# Default limits of a development key, as (requests, window seconds)
+DEFAULT_APP_LIMITS = [(20, 1), (100, 120)]
+
+# Send every request to a stand-in instead of api.riotgames.com, e.g. the benchmark's
+# mock server: RIOT_API_BASE_URL=http://127.0.0.1:8500 requests http://127.0.0.1:8500/<host>/<path>
+api_base_url = os.getenv('RIOT_API_BASE_URL')
+
+
+def parse_rate_limits(header_value):
+    # Riot sends limits as "20:1,100:120"
+    limits = []
+    for part in header_value.split(','):
+        count, window = part.split(':')
+        limits.append((int(count), int(window)))
+    return limits
+
+
+class TokenBucket:
+    # A bucket of `limit` tokens where each spent token is returned one full
+    # window after it was spent, so no window ever sees more than `limit` requests.
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.spent = []
+
+    def wait_time(self, now):
+        self.spent = [t for t in self.spent if t + self.window > now]
+        if len(self.spent) < self.limit:
+            return 0
+        return self.spent[0] + self.window - now
+
+    def take(self, now):
+        self.spent.append(now)
+
+
+class RateLimiter:
+    # Thread-safe scheduler over a set of buckets that must all have a token
+    def __init__(self, limits):
+        self.lock = threading.Lock()
+        self.buckets = [TokenBucket(limit, window) for limit, window in limits]
+        self.blocked_until = 0
+
+    def set_limits(self, limits):
+        with self.lock:
+            if [(b.limit, b.window) for b in self.buckets] == limits:
+                return
+            old = {b.window: b.spent for b in self.buckets}
+            self.buckets = [TokenBucket(limit, window) for limit, window in limits]
+            for bucket in self.buckets:
+                bucket.spent = old.get(bucket.window, [])
+
+    def block(self, seconds):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def wait_time(self, now):
+        wait = max(self.blocked_until - now, 0)
+        for bucket in self.buckets:
+            wait = max(wait, bucket.wait_time(now))
+        return wait
+
+    def take(self, now):
+        for bucket in self.buckets:
+            bucket.take(now)
+
+
+def acquire(limiters):
+    # Block until every limiter has a free token, then spend one from each; returns the seconds waited
+    # Locks are always taken in the order given (app limiter first)
+    waited = 0.0
+    while True:
+        now = time.monotonic()
+        for limiter in limiters:
+            limiter.lock.acquire()
+        try:
+            wait = max(limiter.wait_time(now) for limiter in limiters)
+            if wait <= 0:
+                for limiter in limiters:
+                    limiter.take(now)
+                return waited
+        finally:
+            for limiter in limiters:
+                limiter.lock.release()
+        time.sleep(wait)
+        waited += wait
+
+
+class RiotClient:
+    def __init__(self, api_key, app_limits=DEFAULT_APP_LIMITS, max_retries=5, pool_size=32, cache=None, base_url=None):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.base_url = (base_url or api_base_url or '').rstrip('/')
+        self.session.headers['X-Riot-Token'] = api_key
+        self.app_limits = app_limits
+        self.max_retries = max_retries
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.app_limiters = {}
+        self.method_limiters = {}
+        self.request_count = 0
+        self.started = time.monotonic()
+
+    def _limiters(self, host, method):
+        # Riot enforces limits per routing value, so each host gets its own buckets
+        with self.lock:
+            if host not in self.app_limiters:
+                self.app_limiters[host] = RateLimiter(self.app_limits)
+            if (host, method) not in self.method_limiters:
+                # Method limits are unknown until the first response tells us
+                self.method_limiters[(host, method)] = RateLimiter([])
+            return self.app_limiters[host], self.method_limiters[(host, method)]
+
+    def get(self, host, path, method, params=None):
+        url = f"{self.base_url}/{host}{path}" if self.base_url else f"https://{host}.api.riotgames.com{path}"
+        cache_class = METHOD_CACHE_CLASSES.get(method)
+        if self.cache is not None and cache_class is not None:
+            body = self.cache.get(cache_class, url, params)
+            if body is not None:
+                return body
+            body = self._request(url, host, method, params)
+            self.cache.put(cache_class, url, body, params)
+            return body
+        return self._request(url, host, method, params)
+
+    def _request(self, url, host, method, params):
+        app_limiter, method_limiter = self._limiters(host, method)
+        for attempt in range(self.max_retries + 1):
+            waited = acquire([app_limiter, method_limiter])
+            if waited:
+                metrics.inc('riot_limiter_wait_seconds_total', {'host': host}, waited)
+            started = time.perf_counter()
+            response = self.session.get(url, params=params)
+            metrics.observe('riot_request_seconds', time.perf_counter() - started, {'method': method})
+            metrics.inc('riot_requests_total', {'method': method, 'host': host, 'status': response.status_code})
+            with self.lock:
+                self.request_count += 1
+
+            if 'X-App-Rate-Limit' in response.headers:
+                app_limiter.set_limits(parse_rate_limits(response.headers['X-App-Rate-Limit']))
+            if 'X-Method-Rate-Limit' in response.headers:
+                method_limiter.set_limits(parse_rate_limits(response.headers['X-Method-Rate-Limit']))
+
+            if response.status_code == 429:
+                retry_after = int(response.headers.get('Retry-After', 2 ** attempt))
+                print(f"Rate limited on {method}, retrying in {retry_after}s")  # Debugging statement
+                metrics.inc('riot_rate_limited_total', {'method': method, 'type': response.headers.get('X-Rate-Limit-Type', 'unknown')})
+                metrics.inc('riot_backoff_seconds_total', {'method': method}, retry_after)
+                if response.headers.get('X-Rate-Limit-Type') == 'method':
+                    method_limiter.block(retry_after)
+                else:
+                    app_limiter.block(retry_after)
+                continue
+            if response.status_code >= 500 and attempt < self.max_retries:
+                metrics.inc('riot_backoff_seconds_total', {'method': method}, 2 ** attempt)
+                time.sleep(2 ** attempt)
+                continue
+            response.raise_for_status()  # Raise an exception for HTTP errors
+            return response.json()
+        response.raise_for_status()
+
+    def summoner_by_puuid(self, region, puuid):
+        return self.get(region, f"/tft/summoner/v1/summoners/by-puuid/{puuid}", 'summoner.by_puuid')
+
+    def match_ids_by_puuid(self, region, puuid, count=20, start=0, start_time=None):
+        params = {'start': start, 'count': count}
+        if start_time is not None:
+            # Epoch seconds; only matches played after this are returned
+            params['startTime'] = start_time
+        return self.get(PLATFORM_ROUTING[region], f"/tft/match/v1/matches/by-puuid/{puuid}/ids", 'match.by_puuid', params)
+
+    def match_by_id(self, region, match_id):
+        return self.get(PLATFORM_ROUTING[region], f"/tft/match/v1/matches/{match_id}", 'match.by_id')
+
+    def account_by_riot_id(self, region, game_name, tag_line):
+        # Not cached here; riot_accounts.py keeps resolved ids in the database
+        routing = ACCOUNT_ROUTING[PLATFORM_ROUTING[region]]
+        return self.get(routing, f"/riot/account/v1/accounts/by-riot-id/{quote(game_name, safe='')}/{quote(tag_line, safe='')}", 'account.by_riot_id')
+
+    def challenger_league(self, region, queue='RANKED_TFT'):
+        # Never cached, so a poller always sees the live ladder
+        return self.get(region, '/tft/league/v1/challenger', 'league.challenger', {'queue': queue})
+
+    def requests_per_second(self):
+        elapsed = time.monotonic() - self.started
+        return self.request_count / elapsed if elapsed > 0 else 0.0
@@ -0,0 +1,189 @@
+from collections import Counter
+from datetime import datetime
+
+# Daily aggregates kept up to date as matches are written. Each table is keyed by
+# (day, tft_set_number, puuid, ...) and its count columns are added to on conflict.
+ROLLUP_TABLES = {
+    'daily_unit_counts': (['day', 'tft_set_number', 'puuid', 'character_id', 'tier'], ['units']),
+    'daily_trait_counts': (['day', 'tft_set_number', 'puuid', 'trait_name'], ['traits']),
+    # placement_sum gives the average placement of the boards that built the item / had both units
+    'daily_item_counts': (['day', 'tft_set_number', 'puuid', 'character_id', 'item'], ['items', 'placement_sum']),
+    'daily_unit_pairs': (['day', 'tft_set_number', 'puuid', 'character_id', 'other_character_id'], ['boards', 'placement_sum']),
+    'daily_player_stats': (['day', 'tft_set_number', 'puuid'], ['games', 'placement_sum', 'top4', 'wins']),
+}
+
+COLUMN_TYPES = {
+    'day': 'DATE',
+    'tft_set_number': 'INTEGER',
+    'tier': 'INTEGER',
+}
+
+
+def table_definition(table_name):
+    key_columns, count_columns = ROLLUP_TABLES[table_name]
+    columns = [f"{column} {COLUMN_TYPES.get(column, 'TEXT')} NOT NULL" for column in key_columns]
+    columns += [f"{column} BIGINT NOT NULL DEFAULT 0" for column in count_columns]
+    columns.append(f"PRIMARY KEY ({', '.join(key_columns)})")
+    return f"CREATE TABLE IF NOT EXISTS {table_name} ({', '.join(columns)})"
+
+
+# The rollups cover every stored match once rollup_state holds ROLLUP_VERSION: a rebuild
+# records it, and so does create_tables on a database without matches, since every write
+# after that keeps the rollups in step. Bump the version when a rollup definition changes,
+# so the dashboard goes back to the raw tables until `python rollups.py` has run again.
+ROLLUP_VERSION = 2
+
+SCHEMA_STATEMENTS = [table_definition(table_name) for table_name in ROLLUP_TABLES] + [
+    # Count columns added after a table was first created (DuckDB cannot add a NOT NULL column)
+    f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {column} BIGINT DEFAULT 0"
+    for table_name, (_, count_columns) in ROLLUP_TABLES.items() for column in count_columns[1:]
+] + [
+    'CREATE TABLE IF NOT EXISTS rollup_state (version INTEGER PRIMARY KEY, rebuilt_at TIMESTAMP NOT NULL)',
+]
+
+# Rebuild every rollup from the raw tables, e.g. after upgrading an existing database
+REBUILD_STATEMENTS = [
+    'TRUNCATE ' + ', '.join(ROLLUP_TABLES),
+    '''
+    INSERT INTO daily_unit_counts (day, tft_set_number, puuid, character_id, tier, units)
+    SELECT m.game_datetime::date, m.tft_set_number, u.puuid, u.character_id, u.tier, count(*)
+    FROM Units u
+    JOIN Matches m ON m.match_id = u.match_id
+    GROUP BY 1, 2, 3, 4, 5
+    ''',
+    '''
+    INSERT INTO daily_trait_counts (day, tft_set_number, puuid, trait_name, traits)
+    SELECT m.game_datetime::date, m.tft_set_number, t.puuid, t.trait_name, count(*)
+    FROM Traits t
+    JOIN Matches m ON m.match_id = t.match_id
+    GROUP BY 1, 2, 3, 4
+    ''',
+    '''
+    INSERT INTO daily_item_counts (day, tft_set_number, puuid, character_id, item, items, placement_sum)
+    SELECT m.game_datetime::date, m.tft_set_number, ui.puuid, ui.character_id, ui.item, count(*), sum(p.placement)
+    FROM unit_items ui
+    JOIN Participants p ON p.match_id = ui.match_id AND p.puuid = ui.puuid
+    JOIN Matches m ON m.match_id = ui.match_id
+    GROUP BY 1, 2, 3, 4, 5
+    ''',
+    '''
+    INSERT INTO daily_unit_pairs (day, tft_set_number, puuid, character_id, other_character_id, boards, placement_sum)
+    SELECT m.game_datetime::date, m.tft_set_number, a.puuid, a.character_id, b.character_id, count(*), sum(p.placement)
+    FROM (SELECT DISTINCT match_id, puuid, character_id FROM Units) a
+    JOIN (SELECT DISTINCT match_id, puuid, character_id FROM Units) b
+        ON b.match_id = a.match_id AND b.puuid = a.puuid AND b.character_id <> a.character_id
+    JOIN Participants p ON p.match_id = a.match_id AND p.puuid = a.puuid
+    JOIN Matches m ON m.match_id = a.match_id
+    GROUP BY 1, 2, 3, 4, 5
+    ''',
+    '''
+    INSERT INTO daily_player_stats (day, tft_set_number, puuid, games, placement_sum, top4, wins)
+    SELECT m.game_datetime::date, m.tft_set_number, p.puuid, count(*), sum(p.placement),
+        sum(CASE WHEN p.placement <= 4 THEN 1 ELSE 0 END), sum(CASE WHEN p.win THEN 1 ELSE 0 END)
+    FROM Participants p
+    JOIN Matches m ON m.match_id = p.match_id
+    GROUP BY 1, 2, 3
+    ''',
+]
+
+
+# Function to turn newly written match rows into rollup increments.
+# Only (puuid, match_id) pairs in new_participants are counted, so a match that
+# is written twice never adds to the rollups twice.
+def compute_rollups(match_rows_list, new_participants):
+    counters = {table_name: Counter() for table_name in ROLLUP_TABLES}
+    placement_sums = {'daily_item_counts': Counter(), 'daily_unit_pairs': Counter()}
+    player_stats = {}
+
+    for match_rows in match_rows_list:
+        match_data = match_rows['Matches'][0]
+        day = match_data['game_datetime'].date()
+        set_number = match_data['tft_set_number']
+
+        placements = {}
+        for participant in match_rows['Participants']:
+            if (participant['puuid'], participant['match_id']) not in new_participants:
+                continue
+            placements[participant['puuid']] = participant['placement']
+            key = (day, set_number, participant['puuid'])
+            games, placement_sum, top4, wins = player_stats.get(key, (0, 0, 0, 0))
+            player_stats[key] = (
+                games + 1,
+                placement_sum + participant['placement'],
+                top4 + (1 if participant['placement'] <= 4 else 0),
+                wins + (1 if participant['win'] else 0),
+            )
+
+        boards = {}
+        for unit in match_rows['Units']:
+            if (unit['puuid'], unit['match_id']) not in new_participants:
+                continue
+            counters['daily_unit_counts'][(day, set_number, unit['puuid'], unit['character_id'], unit['tier'])] += 1
+            for item in unit['itemnames']:
+                key = (day, set_number, unit['puuid'], unit['character_id'], item)
+                counters['daily_item_counts'][key] += 1
+                placement_sums['daily_item_counts'][key] += placements[unit['puuid']]
+            boards.setdefault(unit['puuid'], set()).add(unit['character_id'])
+
+        # Each pair of distinct units on a board counts once in both directions
+        for puuid, character_ids in boards.items():
+            for character_id in character_ids:
+                for other_character_id in character_ids:
+                    if other_character_id != character_id:
+                        key = (day, set_number, puuid, character_id, other_character_id)
+                        counters['daily_unit_pairs'][key] += 1
+                        placement_sums['daily_unit_pairs'][key] += placements[puuid]
+
+        for trait in match_rows['Traits']:
+            if (trait['puuid'], trait['match_id']) not in new_participants:
+                continue
+            counters['daily_trait_counts'][(day, set_number, trait['puuid'], trait['trait_name'])] += 1
+
+    rollup_rows = {}
+    for table_name, counter in counters.items():
+        key_columns, count_columns = ROLLUP_TABLES[table_name]
+        if table_name in placement_sums:
+            rollup_rows[table_name] = [dict(zip(key_columns + count_columns, key + (count, placement_sums[table_name][key]))) for key, count in counter.items()]
+        else:
+            rollup_rows[table_name] = [dict(zip(key_columns + count_columns, key + (count,))) for key, count in counter.items()]
+    key_columns, count_columns = ROLLUP_TABLES['daily_player_stats']
+    rollup_rows['daily_player_stats'] = [dict(zip(key_columns + count_columns, key + stats)) for key, stats in player_stats.items()]
+    return rollup_rows
+
+
+def record_complete(cursor):
+    cursor.execute(
+        'INSERT INTO rollup_state (version, rebuilt_at) VALUES (%s, %s) ON CONFLICT (version) DO NOTHING',
+        (ROLLUP_VERSION, datetime.now())
+    )
+
+
+# Function to mark the rollups complete on a database that has no matches yet; one that
+# already has matches keeps reading the raw tables until the rollups are rebuilt
+def check_complete(cursor):
+    cursor.execute('SELECT version FROM rollup_state WHERE version = %s', (ROLLUP_VERSION,))
+    if cursor.fetchone() is not None:
+        return
+    cursor.execute('SELECT 1 FROM Participants LIMIT 1')
+    if cursor.fetchone() is None:
+        record_complete(cursor)
+    else:
+        print('The rollups do not cover the stored matches yet; the dashboard reads the raw tables until `python rollups.py` rebuilds them')
+
+
+# Function to recompute every rollup table from the raw match tables
+def rebuild_rollups():
+    import db
+    db.create_tables()
+    with db.transaction() as connection:
+        cursor = connection.cursor()
+        for statement in REBUILD_STATEMENTS:
+            cursor.execute(statement)
+        record_complete(cursor)
+        cursor.close()
+    db.close_pool()
+
+
+if __name__ == '__main__':
+    rebuild_rollups()
+    print('Rollup tables rebuilt.')
@@ -0,0 +1,235 @@
+import json
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+import pandas as pd
+from config import config, storage_config
+import metrics
+
+# Which database the writers and the dashboard use (see storage_config in config.py).
+# PostgreSQL is the default; DuckDB and SQLite run in-process from a single file,
+# so the whole stack works without a database server.
+settings = storage_config()
+backend = settings['backend']
+database_path = settings['path']
+
+EMBEDDED_BACKENDS = ('duckdb', 'sqlite')
+
+# SQLite has no array, date or boolean types; arrays are stored as JSON text and dates as
+# ISO strings, and columns declared with these types are converted back when read
+sqlite3.register_adapter(list, json.dumps)
+sqlite3.register_adapter(tuple, json.dumps)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(sep=' '))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_adapter(pd.Timestamp, lambda value: value.isoformat(sep=' '))
+sqlite3.register_converter('JSON', json.loads)
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()))
+sqlite3.register_converter('BOOLEAN', lambda value: bool(int(value)))
+
+
+def is_embedded():
+    return backend in EMBEDDED_BACKENDS
+
+
+def postgres_url():
+    db_params = config()
+    return f"postgresql://{db_params['user']}:{db_params['password']}@{db_params['host']}:{db_params['port']}/{db_params['database']}"
+
+
+# Function to rewrite one statement written for PostgreSQL into the statements the embedded backend runs
+def translate(sql, cursor):
+    add_column = re.match(r'\s*ALTER TABLE (\w+) ADD COLUMN IF NOT EXISTS (\w+) (.+)', sql, re.IGNORECASE | re.DOTALL)
+    if add_column:
+        # Embedded databases are created with every column, so this only upgrades older files
+        table_name, column, definition = add_column.groups()
+        existing = cursor.execute(f"SELECT name FROM pragma_table_info('{table_name}')").fetchall()
+        if column.lower() in {name.lower() for (name,) in existing}:
+            return []
+        sql = f"ALTER TABLE {table_name} ADD COLUMN {column} {definition}"
+
+    drop_column = re.match(r'\s*ALTER TABLE (\w+) DROP COLUMN IF EXISTS (\w+)', sql, re.IGNORECASE)
+    if drop_column:
+        table_name, column = drop_column.groups()
+        existing = cursor.execute(f"SELECT name FROM pragma_table_info('{table_name}')").fetchall()
+        # DuckDB cannot alter a table that has indexes, so there the column stays behind, unwritten
+        if backend == 'duckdb' or column.lower() not in {name.lower() for (name,) in existing}:
+            return []
+        return [f"ALTER TABLE {table_name} DROP COLUMN {column}"]
+
+    truncate = re.match(r'\s*TRUNCATE (.+)', sql, re.IGNORECASE | re.DOTALL)
+    if truncate:
+        return [f"DELETE FROM {table_name.strip()}" for table_name in truncate.group(1).split(',')]
+
+    statements = []
+    serial = re.search(r'CREATE TABLE IF NOT EXISTS (\w+) \(\s*(\w+) (?:SMALL)?SERIAL PRIMARY KEY', sql, re.IGNORECASE)
+    if serial:
+        table_name, column = serial.groups()
+        if backend == 'sqlite':
+            column_definition = f"{column} INTEGER PRIMARY KEY AUTOINCREMENT"
+        else:
+            sequence = f"{table_name}_{column}_seq".lower()
+            statements.append(f"CREATE SEQUENCE IF NOT EXISTS {sequence}")
+            column_definition = f"{column} INTEGER DEFAULT nextval('{sequence}') PRIMARY KEY"
+        sql = sql.replace(serial.group(0), f"CREATE TABLE IF NOT EXISTS {table_name} ({column_definition}")
+
+    if backend == 'sqlite':
+        sql = re.sub(r'= ANY\(%s\)', 'IN (SELECT value FROM json_each(%s))', sql, flags=re.IGNORECASE)
+        sql = re.sub(r'\b\w+\[\]', 'JSON', sql)
+        sql = re.sub(r'([\w.]+)::date\b', r'date(\1)', sql)
+        sql = re.sub(r'\bnow\(\)', 'CURRENT_TIMESTAMP', sql, flags=re.IGNORECASE)
+    else:
+        sql = re.sub(r'= ANY\(%s\)', 'IN (SELECT unnest(%s))', sql, flags=re.IGNORECASE)
+    statements.append(sql.replace('%s', '?'))
+    return statements
+
+
+class EmbeddedCursor:
+    # DB-API cursor that accepts the %s-style PostgreSQL SQL the writers are written in
+    def __init__(self, connection):
+        self.connection = connection
+        # DuckDB cursors are separate connections, so statements run on the connection itself
+        self.cursor = connection.raw if backend == 'duckdb' else connection.raw.cursor()
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    def execute(self, sql, params=()):
+        for statement in translate(sql, self.cursor):
+            self.cursor.execute(statement, list(params or ()))
+        return self
+
+    def executemany(self, sql, params_list):
+        for statement in translate(sql, self.cursor):
+            self.cursor.executemany(statement, [list(params) for params in params_list])
+        return self
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchmany(self, size=1):
+        return self.cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def close(self):
+        if backend == 'sqlite':
+            self.cursor.close()
+
+
+class EmbeddedConnection:
+    # One shared connection to the DuckDB or SQLite file; transaction() serializes its users
+    def __init__(self, path):
+        if backend == 'duckdb':
+            # Imported here so PostgreSQL and SQLite setups never need duckdb installed
+            import duckdb
+            self.raw = duckdb.connect(path)
+        else:
+            # WAL lets the dashboard read while ingestion writes
+            self.raw = sqlite3.connect(path, check_same_thread=False, timeout=60, detect_types=sqlite3.PARSE_DECLTYPES)
+            self.raw.execute('PRAGMA journal_mode=WAL')
+        self.lock = threading.Lock()
+
+    def cursor(self):
+        return EmbeddedCursor(self)
+
+    def begin(self):
+        if backend == 'duckdb':
+            self.raw.begin()
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+    def insert_rows(self, table_name, columns, rows, suffix=''):
+        # DuckDB inserts a whole DataFrame in one vectorized statement; SQLite takes the rows one by one
+        if backend == 'duckdb':
+            frame = pd.DataFrame(rows, columns=columns, dtype=object)
+            self.raw.register('insert_rows_frame', frame)
+            try:
+                self.raw.execute(f"INSERT INTO {table_name} ({', '.join(columns)}) SELECT {', '.join(columns)} FROM insert_rows_frame {suffix}")
+            finally:
+                self.raw.unregister('insert_rows_frame')
+        else:
+            # SQLite needs a WHERE after INSERT ... SELECT to parse an ON CONFLICT clause, so use VALUES
+            placeholders = ', '.join(['%s'] * len(columns))
+            self.cursor().executemany(f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders}) {suffix}", rows)
+
+
+embedded_connection = None
+embedded_lock = threading.Lock()
+
+
+def get_embedded_connection():
+    global embedded_connection
+    with embedded_lock:
+        if embedded_connection is None:
+            print(f"Opening the {backend} database at {database_path}...")
+            embedded_connection = EmbeddedConnection(database_path)
+    return embedded_connection
+
+
+def close_embedded_connection():
+    global embedded_connection
+    with embedded_lock:
+        if embedded_connection is not None:
+            embedded_connection.close()
+            embedded_connection = None
+            print('Database connection closed.')
+
+
+@contextmanager
+def embedded_transaction():
+    # One writer at a time, the same as a single-connection pool
+    connection = get_embedded_connection()
+    with connection.lock:
+        connection.begin()
+        try:
+            yield connection
+            with metrics.timer('db_commit_seconds', {'backend': backend}):
+                connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
+
+class DuckDBSource:
+    # Runs dashboard_queries' :name-parameter SQL on DuckDB, wherever those functions take an engine
+    def __init__(self, path=None):
+        self.path = path
+
+    @contextmanager
+    def connection(self):
+        # The file is opened per query so the dashboard never holds on to DuckDB's file lock
+        import duckdb
+        connection = duckdb.connect(self.path, read_only=True)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def run_query(self, sql, params):
+        # DuckDB expects $name rather than :name (PostgreSQL :: casts are left alone)
+        sql = re.sub(r'(?<![:\w]):([A-Za-z_]\w*)', r'$\1', sql)
+        used = set(re.findall(r'\$([A-Za-z_]\w*)', sql))
+        with self.connection() as connection:
+            return connection.execute(sql, {name: value for name, value in params.items() if name in used}).df()
+
+
+# Function to get what the dashboard queries run against: a SQLAlchemy engine or a DuckDB source
+def dashboard_engine():
+    from sqlalchemy import create_engine
+    if backend == 'duckdb':
+        return DuckDBSource(database_path)
+    if backend == 'sqlite':
+        return create_engine(f"sqlite:///{database_path}")
+    return create_engine(postgres_url())
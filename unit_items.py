@@ -0,0 +1,104 @@
+from dashboard_queries import match_filters, rollup_filters, run_query
+
+# One row per item equipped on a unit, written alongside Units at ingest time,
+# so item questions are indexed lookups instead of unnesting every itemnames array.
+SCHEMA_STATEMENTS = [
+    '''
+    CREATE TABLE IF NOT EXISTS unit_items (
+        match_id TEXT NOT NULL,
+        puuid TEXT NOT NULL,
+        character_id TEXT NOT NULL,
+        unit_index INTEGER NOT NULL,
+        slot SMALLINT NOT NULL,
+        item TEXT NOT NULL,
+        item_code SMALLINT,
+        PRIMARY KEY (match_id, puuid, character_id, unit_index, slot)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS unit_items_character_item_idx ON unit_items (character_id, item)',
+    'CREATE INDEX IF NOT EXISTS unit_items_item_idx ON unit_items (item)',
+]
+
+# Fill unit_items from the itemnames arrays of rows written before the table existed
+# (PostgreSQL only; DuckDB and SQLite databases are created with the table)
+BACKFILL_STATEMENT = '''
+    INSERT INTO unit_items (match_id, puuid, character_id, unit_index, slot, item, item_code)
+    SELECT u.match_id, u.puuid, u.character_id, u.unit_index, item.slot, item.item, n.code
+    FROM Units u
+    CROSS JOIN LATERAL unnest(u.itemnames) WITH ORDINALITY AS item(item, slot)
+    LEFT JOIN tft_names n ON n.kind = 'item' AND n.raw_id = item.item
+    ON CONFLICT (match_id, puuid, character_id, unit_index, slot) DO NOTHING
+'''
+
+
+def get_item_stats(engine, character_id, start_date, end_date, puuid=None, set_number=13, limit=None, from_rollups=False):
+    # How often each item was built on the unit and the average placement of boards that had it
+    limit_clause = ''
+    if from_rollups:
+        where, params = rollup_filters(start_date, end_date, puuid, set_number)
+        params['character_id'] = character_id
+        if limit is not None:
+            limit_clause = 'limit :limit'
+            params['limit'] = limit
+        sql = f'''
+            select r.item, sum(r.items) as count, sum(r.placement_sum) * 1.0 / sum(r.items) as avg_placement
+            from daily_item_counts r
+            where {where} and r.character_id = :character_id
+            group by r.item
+            order by count desc
+            {limit_clause};
+        '''
+        return run_query(engine, sql, params)
+    where, params = match_filters(start_date, end_date, puuid, set_number, alias='ui')
+    params['character_id'] = character_id
+    if limit is not None:
+        limit_clause = 'limit :limit'
+        params['limit'] = limit
+    sql = f'''
+        select ui.item, count(*) as count, avg(p.placement) as avg_placement
+        from unit_items ui
+        join matches m on m.match_id = ui.match_id
+        join participants p on p.match_id = ui.match_id and p.puuid = ui.puuid
+        where {where} and ui.character_id = :character_id
+        group by ui.item
+        order by count desc
+        {limit_clause};
+    '''
+    return run_query(engine, sql, params)
+
+
+def get_top_items_per_unit(engine, start_date, end_date, puuid=None, set_number=13, top_n=3):
+    where, params = match_filters(start_date, end_date, puuid, set_number, alias='ui')
+    params['top_n'] = top_n
+    sql = f'''
+        select character_id, item, count, avg_placement
+        from (
+            select
+                ui.character_id, ui.item, count(*) as count, avg(p.placement) as avg_placement,
+                row_number() over (partition by ui.character_id order by count(*) desc) as item_rank
+            from unit_items ui
+            join matches m on m.match_id = ui.match_id
+            join participants p on p.match_id = ui.match_id and p.puuid = ui.puuid
+            where {where}
+            group by ui.character_id, ui.item
+        ) ranked
+        where item_rank <= :top_n
+        order by character_id, count desc;
+    '''
+    return run_query(engine, sql, params)
+
+
+# Function to fill unit_items for rows written before it existed
+def backfill():
+    import db
+    db.create_tables()
+    with db.transaction() as connection:
+        cursor = connection.cursor()
+        cursor.execute(BACKFILL_STATEMENT)
+        cursor.close()
+    db.close_pool()
+
+
+if __name__ == '__main__':
+    backfill()
+    print('unit_items backfilled.')
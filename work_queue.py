@@ -0,0 +1,249 @@
+import argparse
+import json
+import os
+from datetime import datetime, timedelta
+import metrics
+
+# Checkpoints of a sweep (one tftpal.py run over the challenger ladders). Every player and
+# match id of the sweep is a work item that moves from pending to done, or to dead once it
+# has failed max_attempts times, so an interrupted sweep resumes with `tftpal.py --resume`
+# and skips everything it already finished.
+SCHEMA_STATEMENTS = [
+    '''
+    CREATE TABLE IF NOT EXISTS sweeps (
+        sweep_id TEXT PRIMARY KEY,
+        regions TEXT NOT NULL,
+        started_at TIMESTAMP NOT NULL,
+        finished_at TIMESTAMP
+    )
+    ''',
+    # kind is 'puuid' or 'match'; a done puuid item keeps the match ids it listed (JSON),
+    # so its watermark moves only once all of them are done
+    '''
+    CREATE TABLE IF NOT EXISTS work_items (
+        sweep_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        item_id TEXT NOT NULL,
+        region TEXT NOT NULL,
+        state TEXT NOT NULL,
+        attempts INTEGER NOT NULL,
+        next_attempt_at TIMESTAMP NOT NULL,
+        last_error TEXT,
+        match_ids TEXT,
+        updated_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (sweep_id, kind, item_id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS work_items_state_idx ON work_items (sweep_id, kind, region, state)',
+]
+
+ITEM_UPDATES = 'state = excluded.state, attempts = excluded.attempts, next_attempt_at = excluded.next_attempt_at, last_error = excluded.last_error, match_ids = excluded.match_ids, updated_at = excluded.updated_at'
+
+# Failed items wait retry_seconds, doubling with each attempt up to retry_max_seconds,
+# and are dead-lettered after max_attempts failures
+retry_seconds = float(os.getenv('WORK_RETRY_SECONDS', 30))
+retry_max_seconds = float(os.getenv('WORK_RETRY_MAX_SECONDS', 15 * 60))
+max_attempts = int(os.getenv('WORK_MAX_ATTEMPTS', 5))
+
+
+def as_datetime(value):
+    # SQLite hands timestamps back as text
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(retry_seconds * 2 ** (attempts - 1), retry_max_seconds))
+
+
+class Sweep:
+    def __init__(self, sweep_id, regions):
+        self.sweep_id = sweep_id
+        self.regions = regions
+
+    def query(self, sql, params, fetch=True):
+        import db
+        with db.transaction() as connection:
+            cursor = connection.cursor()
+            cursor.execute(sql, params)
+            rows = cursor.fetchall() if fetch else None
+            cursor.close()
+        return rows
+
+    def enqueue(self, kind, region, item_ids):
+        # Items already in the sweep keep their state
+        import db
+        now = datetime.now()
+        items = [{
+            'sweep_id': self.sweep_id, 'kind': kind, 'item_id': item_id, 'region': region, 'state': 'pending',
+            'attempts': 0, 'next_attempt_at': now, 'last_error': None, 'match_ids': None, 'updated_at': now,
+        } for item_id in dict.fromkeys(item_ids)]
+        if items:
+            with db.transaction() as connection:
+                db.insert_data_batch(connection, 'work_items', items, ['sweep_id', 'kind', 'item_id'])
+
+    def item_ids(self, kind, region, states=None):
+        sql = 'SELECT item_id FROM work_items WHERE sweep_id = %s AND kind = %s AND region = %s'
+        params = [self.sweep_id, kind, region]
+        if states is not None:
+            sql += ' AND state = ANY(%s)'
+            params.append(list(states))
+        return [row[0] for row in self.query(sql, params)]
+
+    def due(self, kind, region):
+        # Pending items whose backoff has run out
+        rows = self.query(
+            "SELECT item_id FROM work_items WHERE sweep_id = %s AND kind = %s AND region = %s AND state = 'pending' AND next_attempt_at <= %s",
+            [self.sweep_id, kind, region, datetime.now()]
+        )
+        return [row[0] for row in rows]
+
+    def next_attempt_at(self, region):
+        # When the next pending item of the region is due, or None once nothing is pending
+        rows = self.query(
+            "SELECT min(next_attempt_at) FROM work_items WHERE sweep_id = %s AND region = %s AND state = 'pending'",
+            [self.sweep_id, region]
+        )
+        return as_datetime(rows[0][0]) if rows else None
+
+    def mark_done(self, kind, region, item_ids, match_ids=None):
+        # match_ids: {puuid: [match ids]} for puuid items
+        import db
+        now = datetime.now()
+        items = [{
+            'sweep_id': self.sweep_id, 'kind': kind, 'item_id': item_id, 'region': region, 'state': 'done',
+            'attempts': 0, 'next_attempt_at': now, 'last_error': None,
+            'match_ids': json.dumps(match_ids[item_id]) if match_ids is not None else None, 'updated_at': now,
+        } for item_id in dict.fromkeys(item_ids)]
+        if not items:
+            return
+        with db.transaction() as connection:
+            # attempts is kept from the failures before, if any
+            db.upsert_data_batch(connection, 'work_items', items, ['sweep_id', 'kind', 'item_id'], 'state = excluded.state, match_ids = excluded.match_ids, last_error = NULL, updated_at = excluded.updated_at')
+
+    def mark_failed(self, kind, region, errors):
+        # errors: {item_id: error}; each failure pushes the item's next attempt further out
+        import db
+        if not errors:
+            return
+        now = datetime.now()
+        with db.transaction() as connection:
+            cursor = connection.cursor()
+            cursor.execute(
+                'SELECT item_id, attempts FROM work_items WHERE sweep_id = %s AND kind = %s AND item_id = ANY(%s)',
+                [self.sweep_id, kind, list(errors)]
+            )
+            attempts = dict(cursor.fetchall())
+            cursor.close()
+            items = []
+            for item_id, error in errors.items():
+                item_attempts = attempts.get(item_id, 0) + 1
+                state = 'dead' if item_attempts >= max_attempts else 'pending'
+                metrics.inc('work_item_failures_total', {'kind': kind, 'result': 'dead' if state == 'dead' else 'retry'})
+                items.append({
+                    'sweep_id': self.sweep_id, 'kind': kind, 'item_id': item_id, 'region': region, 'state': state,
+                    'attempts': item_attempts, 'next_attempt_at': now + retry_delay(item_attempts),
+                    'last_error': str(error)[:1000], 'match_ids': None, 'updated_at': now,
+                })
+            db.upsert_data_batch(connection, 'work_items', items, ['sweep_id', 'kind', 'item_id'], ITEM_UPDATES)
+
+    def listing_puuids(self, region):
+        # {puuid: [match ids]} as listed by the region's done puuid items
+        rows = self.query(
+            "SELECT item_id, match_ids FROM work_items WHERE sweep_id = %s AND kind = 'puuid' AND region = %s AND state = 'done'",
+            [self.sweep_id, region]
+        )
+        return {puuid: json.loads(match_ids or '[]') for puuid, match_ids in rows}
+
+    def complete_puuids(self, region):
+        # Players whose listed match ids are all done, so their watermarks can move
+        done_match_ids = set(self.item_ids('match', region, ['done']))
+        return [puuid for puuid, match_ids in self.listing_puuids(region).items() if done_match_ids.issuperset(match_ids)]
+
+    def counts(self):
+        # {(kind, state): items} across the sweep
+        rows = self.query('SELECT kind, state, count(*) FROM work_items WHERE sweep_id = %s GROUP BY kind, state', [self.sweep_id])
+        return {(kind, state): count for kind, state, count in rows}
+
+    def finish(self):
+        self.query('UPDATE sweeps SET finished_at = %s WHERE sweep_id = %s', [datetime.now(), self.sweep_id], fetch=False)
+
+
+def start_sweep(regions):
+    import db
+    started_at = datetime.now()
+    sweep = Sweep(started_at.strftime('%Y%m%d%H%M%S%f'), regions)
+    with db.transaction() as connection:
+        db.insert_data_batch(connection, 'sweeps', [{'sweep_id': sweep.sweep_id, 'regions': ','.join(regions), 'started_at': started_at, 'finished_at': None}])
+    return sweep
+
+
+# Function to get the newest sweep that never finished, or None
+def latest_unfinished_sweep():
+    import db
+    with db.transaction() as connection:
+        cursor = connection.cursor()
+        cursor.execute('SELECT sweep_id, regions FROM sweeps WHERE finished_at IS NULL ORDER BY started_at DESC LIMIT 1')
+        row = cursor.fetchone()
+        cursor.close()
+    return Sweep(row[0], row[1].split(',')) if row else None
+
+
+def dead_letters(sweep_id=None):
+    import db
+    sql = "SELECT w.sweep_id, w.kind, w.item_id, w.region, w.attempts, w.last_error, w.updated_at FROM work_items w WHERE w.state = 'dead'"
+    params = []
+    if sweep_id is not None:
+        sql += ' AND w.sweep_id = %s'
+        params.append(sweep_id)
+    with db.transaction() as connection:
+        cursor = connection.cursor()
+        cursor.execute(sql + ' ORDER BY w.sweep_id, w.kind, w.item_id', params)
+        rows = cursor.fetchall()
+        cursor.close()
+    return rows
+
+
+# Function to give a sweep's dead-lettered items another max_attempts tries; the sweep is
+# reopened so the next `tftpal.py --resume` picks them up
+def requeue_dead(sweep_id):
+    import db
+    now = datetime.now()
+    with db.transaction() as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT count(*) FROM work_items WHERE sweep_id = %s AND state = 'dead'", [sweep_id])
+        requeued = cursor.fetchone()[0]
+        cursor.execute(
+            "UPDATE work_items SET state = 'pending', attempts = 0, next_attempt_at = %s, updated_at = %s WHERE sweep_id = %s AND state = 'dead'",
+            [now, now, sweep_id]
+        )
+        cursor.execute('UPDATE sweeps SET finished_at = NULL WHERE sweep_id = %s', [sweep_id])
+        cursor.close()
+    return requeued
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect sweep checkpoints and dead-lettered work items')
+    parser.add_argument('command', choices=['status', 'dead', 'requeue'], help='status: item counts of the latest sweeps; dead: list dead-lettered items; requeue: retry a sweep\'s dead items on the next --resume')
+    parser.add_argument('--sweep', help='Sweep id (defaults to the latest sweep)')
+    args = parser.parse_args()
+
+    import db
+    db.create_tables()
+    with db.transaction() as connection:
+        cursor = connection.cursor()
+        cursor.execute('SELECT sweep_id, regions, started_at, finished_at FROM sweeps ORDER BY started_at DESC LIMIT 10')
+        sweeps = cursor.fetchall()
+        cursor.close()
+    sweep_id = args.sweep or (sweeps[0][0] if sweeps else None)
+
+    if args.command == 'status':
+        for listed_id, regions, started_at, finished_at in sweeps:
+            counts = Sweep(listed_id, regions.split(',')).counts()
+            summary = ', '.join(f"{kind} {state}: {count}" for (kind, state), count in sorted(counts.items()))
+            print(f"{listed_id} [{regions}] started {started_at}, {'finished ' + str(finished_at) if finished_at else 'unfinished'}: {summary}")
+    elif args.command == 'dead':
+        for row in dead_letters(sweep_id):
+            print(' | '.join(str(value) for value in row))
+    elif sweep_id is not None:
+        print(f"Requeued {requeue_dead(sweep_id)} dead items of sweep {sweep_id}; run `python tftpal.py --resume`")
+    db.close_pool()